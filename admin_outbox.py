@@ -0,0 +1,426 @@
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import MessageLimit
+from telegram.error import BadRequest, Forbidden, InvalidToken, RetryAfter
+
+from tracing import KIND_CLIENT, tracer
+
+
+# ===== Доставка карточек администратору =====
+# Карточка сначала записывается в очередь на диске (SQLite), и только потом
+# отправляется фоновой задачей: сбой Telegram не теряет лид, а после
+# перезапуска недоставленное уходит заново. Отправки в один чат проходят
+# через «ведро токенов» (не больше rate_per_minute в минуту, пачкой до burst),
+# а ответ 429 (RetryAfter) останавливает чат на указанное Telegram время.
+# Ведро и очередь лежат в той же базе, поэтому лимит общий для всех
+# процессов-обработчиков (sharding.py).
+#
+# Если в чате скопилось больше digest_threshold карточек, они уходят одним
+# сообщением-сводкой (сколько поместится в лимит длины сообщения).
+#
+# В строке очереди хранится lead_id, поэтому доставка попадает в трассу
+# заявки спаном admin.send: от постановки в очередь до доставки (или
+# неисправимой ошибки), с числом попыток и паузами по RetryAfter.
+
+DEFAULT_OUTBOX_PATH = Path("applications") / "admin_outbox.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    buttons TEXT,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL,
+    error TEXT,
+    lead_id TEXT,
+    flood_waits INTEGER NOT NULL DEFAULT 0,
+    flood_wait REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (error, not_before);
+CREATE TABLE IF NOT EXISTS buckets (
+    chat_id INTEGER PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    blocked_until REAL NOT NULL DEFAULT 0
+);
+"""
+
+# База могла быть создана до появления lead_id и учёта пауз RetryAfter
+_MIGRATIONS = [
+    ("lead_id", "ALTER TABLE outbox ADD COLUMN lead_id TEXT"),
+    ("flood_waits", "ALTER TABLE outbox ADD COLUMN flood_waits INTEGER NOT NULL DEFAULT 0"),
+    ("flood_wait", "ALTER TABLE outbox ADD COLUMN flood_wait REAL NOT NULL DEFAULT 0"),
+]
+
+# Сколько времени карточка считается «взятой» процессом, который её отправляет;
+# если он упадёт, карточку после этого заберёт другой
+_CLAIM_SECONDS = 60.0
+_DIGEST_SEPARATOR = "\n\n— — —\n\n"
+
+
+class AdminNotifier:
+    def __init__(
+        self,
+        path: Path = DEFAULT_OUTBOX_PATH,
+        rate_per_minute: float = 20.0,
+        burst: int = 3,
+        digest_threshold: int = 0,
+        backoff_base: float = 1.0,
+        backoff_cap: float = 300.0,
+        poll_interval: float = 5.0,
+    ):
+        self.path = Path(path)
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.digest_threshold = digest_threshold  # 0 — без сводок
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.poll_interval = poll_interval
+
+        self._conn = None
+        self._db_lock = threading.Lock()
+        self._bot = None
+        self._task = None
+        self._wakeup = None
+        self._pass_lock = None
+        # Сколько карточек ждут отправки (без error). Считается в памяти, чтобы
+        # /metrics не ходил в базу: +1 при постановке, −N при доставке или
+        # неисправимой ошибке; при каждом взятии пересчитывается в той же
+        # транзакции — так видны и карточки других процессов
+        self._pending = 0
+        self.sent = 0
+        self.digests = 0
+        self.retries = 0
+        self.flood_waits = 0
+        self.failed = 0
+
+    # ===== База =====
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Запросы идут из потоков asyncio.to_thread, по одному (_db_lock)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+            for column, statement in _MIGRATIONS:
+                if column not in columns:
+                    self._conn.execute(statement)
+        return self._conn
+
+    async def _run_db(self, func, *args):
+        def _call():
+            with self._db_lock:
+                return func(self._db(), *args)
+
+        return await asyncio.to_thread(_call)
+
+    @staticmethod
+    def _insert(conn, chat_id, text, buttons, lead_id, now):
+        conn.execute(
+            "INSERT INTO outbox (chat_id, text, buttons, lead_id, created_at, not_before) VALUES (?, ?, ?, ?, ?, ?)",
+            (chat_id, text, json.dumps(buttons, ensure_ascii=False) if buttons else None, lead_id, now, now),
+        )
+
+    def _take_token(self, conn, chat_id, now) -> float:
+        """Берёт токен из ведра чата; возвращает, сколько ждать (0 — можно слать)."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated_at, blocked_until FROM buckets WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+            tokens, updated_at, blocked_until = row if row else (float(self.burst), now, 0.0)
+            if blocked_until > now:
+                return blocked_until - now
+            tokens = min(float(self.burst), tokens + (now - updated_at) * self.rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+            if not wait:
+                tokens -= 1
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (chat_id, tokens, updated_at, blocked_until) VALUES (?, ?, ?, ?)",
+                (chat_id, tokens, now, blocked_until),
+            )
+            return wait
+        finally:
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _block_chat(conn, chat_id, until):
+        # После паузы — один токен: первая карточка уходит сразу
+        conn.execute(
+            "INSERT OR REPLACE INTO buckets (chat_id, tokens, updated_at, blocked_until) VALUES (?, 1, ?, ?)",
+            (chat_id, until, until),
+        )
+
+    @staticmethod
+    def _due_chats(conn, now):
+        return conn.execute(
+            "SELECT chat_id, COUNT(*) FROM outbox WHERE error IS NULL AND not_before <= ? GROUP BY chat_id",
+            (now,),
+        ).fetchall()
+
+    @staticmethod
+    def _next_due(conn):
+        row = conn.execute("SELECT MIN(not_before) FROM outbox WHERE error IS NULL").fetchone()
+        return row[0]
+
+    @staticmethod
+    def _count(conn):
+        return conn.execute("SELECT COUNT(*) FROM outbox WHERE error IS NULL").fetchone()[0]
+
+    @classmethod
+    def _claim(cls, conn, chat_id, limit, now):
+        """Берёт до limit карточек чата; возвращает их и число ждущих в очереди."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, text, buttons, attempts, lead_id, created_at, flood_waits, flood_wait FROM outbox "
+                "WHERE chat_id = ? AND error IS NULL AND not_before <= ? ORDER BY id LIMIT ?",
+                (chat_id, now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET not_before = ? WHERE id = ?",
+                ((now + _CLAIM_SECONDS, row[0]) for row in rows),
+            )
+            return rows, cls._count(conn)
+        finally:
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _delete(conn, ids):
+        conn.executemany("DELETE FROM outbox WHERE id = ?", ((i,) for i in ids))
+
+    @staticmethod
+    def _postpone(conn, ids, until, count_attempt, error=None):
+        conn.executemany(
+            "UPDATE outbox SET not_before = ?, attempts = attempts + ?, error = ? WHERE id = ?",
+            ((until, int(count_attempt), error, i) for i in ids),
+        )
+
+    @staticmethod
+    def _flood_wait(conn, ids, until, seconds):
+        conn.executemany(
+            "UPDATE outbox SET not_before = ?, flood_waits = flood_waits + 1, flood_wait = flood_wait + ? "
+            "WHERE id = ?",
+            ((until, seconds, i) for i in ids),
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        """Карточки, ждущие отправки; без обращения к базе."""
+        return self._pending
+
+    # ===== Жизненный цикл =====
+    async def start(self, bot):
+        if self._task is not None:
+            return
+        self._bot = bot
+        self._wakeup = asyncio.Event()
+        self._pass_lock = asyncio.Lock()
+        self._pending = await self._run_db(self._count)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, grace: float = 5.0):
+        """Досылает то, что можно отправить за grace секунд; остальное ждёт следующего запуска."""
+        if self._task is None:
+            return
+        deadline = time.monotonic() + grace
+        while time.monotonic() < deadline:
+            now = time.time()
+            next_due = await self._run_db(self._next_due)
+            if next_due is None or next_due > now + (deadline - time.monotonic()):
+                break
+            await asyncio.sleep(0.1)
+        # Останавливаем между проходами, а не посреди отправки
+        async with self._pass_lock:
+            self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    async def submit(self, chat_id: int, text: str, buttons=(), lead_id: str = None):
+        """Записывает карточку в очередь на диске; отправит фоновая задача.
+
+        buttons — [(текст кнопки, callback_data), ...]; lead_id — для трассы заявки
+        """
+        await self._run_db(self._insert, chat_id, text, [list(b) for b in buttons], lead_id, time.time())
+        self._pending += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # ===== Отправка =====
+    async def _run(self):
+        while True:
+            try:
+                async with self._pass_lock:
+                    delay = await self._deliver_due()
+            except Exception as e:
+                logging.error(f"Ошибка очереди карточек администратору: {e}")
+                delay = self.poll_interval
+            # Новые карточки будят сразу; чужие (другие процессы) и
+            # отложенные подхватываются по времени
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(0.0, delay))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _deliver_due(self) -> float:
+        """Отправляет всё, что можно отправить сейчас; возвращает паузу до следующего прохода."""
+        now = time.time()
+        wait = self.poll_interval
+        for chat_id, due in await self._run_db(self._due_chats, now):
+            token_wait = await self._run_db(self._take_token, chat_id, time.time())
+            if token_wait:
+                wait = min(wait, token_wait)
+                continue
+            digest = self.digest_threshold and due > self.digest_threshold
+            rows, self._pending = await self._run_db(self._claim, chat_id, due if digest else 1, time.time())
+            if rows:
+                await self._send(chat_id, rows)
+            # В чате могло остаться ещё — следующий токен
+            wait = 0 if due > len(rows) else wait
+        next_due = await self._run_db(self._next_due)
+        if next_due is not None:
+            wait = min(wait, max(0.0, next_due - time.time()))
+        return wait
+
+    async def _send(self, chat_id, rows):
+        text, markup, used = _compose(rows)
+        ids = [row[0] for row in used]
+        # Не поместившиеся в сводку возвращаем в очередь сразу
+        rest = [row[0] for row in rows[len(used):]]
+        if rest:
+            await self._run_db(self._postpone, rest, time.time(), False)
+        try:
+            await self._bot.send_message(chat_id=chat_id, text=text, reply_markup=markup)
+        except RetryAfter as e:
+            retry_after = getattr(e.retry_after, "total_seconds", lambda: e.retry_after)()
+            until = time.time() + float(retry_after)
+            self.flood_waits += 1
+            logging.warning("Telegram ограничил отправку в чат %s на %s с", chat_id, retry_after)
+            await self._run_db(self._block_chat, chat_id, until)
+            await self._run_db(self._flood_wait, ids, until, float(retry_after))
+            return
+        except (BadRequest, Forbidden, InvalidToken) as e:
+            # Повтор не поможет: оставляем в базе с текстом ошибки для разбора
+            self.failed += len(ids)
+            logging.error(f"Карточка администратору не может быть доставлена в чат {chat_id}: {e}")
+            await self._run_db(self._postpone, ids, time.time(), True, str(e))
+            self._pending = max(0, self._pending - len(ids))
+            _trace(used, False, e)
+            return
+        except Exception as e:
+            attempts = max(row[3] for row in used) + 1
+            delay = min(self.backoff_cap, self.backoff_base * 2 ** (attempts - 1))
+            delay = random.uniform(delay / 2, delay)
+            self.retries += 1
+            logging.warning(
+                "Не удалось отправить карточку администратору (попытка %s), повтор через %.0f с: %s",
+                attempts,
+                delay,
+                e,
+            )
+            await self._run_db(self._postpone, ids, time.time() + delay, True)
+            return
+
+        await self._run_db(self._delete, ids)
+        self._pending = max(0, self._pending - len(ids))
+        _trace(used, True)
+        self.sent += len(ids)
+        if len(ids) > 1:
+            self.digests += 1
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "digests": self.digests,
+            "retries": self.retries,
+            "flood_waits": self.flood_waits,
+            "failed": self.failed,
+        }
+
+
+def _trace(rows, delivered: bool, error: BaseException = None):
+    """Спан admin.send в трассе каждой заявки из отправки: от постановки в очередь до итога."""
+    if not tracer.enabled:
+        return
+    ended_ns = time.time_ns()
+    for _, _, _, attempts, lead_id, created_at, flood_waits, flood_wait in rows:
+        tracer.span(
+            lead_id,
+            "admin.send",
+            int(created_at * 1e9),
+            ended_ns,
+            {
+                # Ошибки сети и ответы 429 плюс эта, последняя попытка
+                "attempts": attempts + flood_waits + 1,
+                "retry_after_waits": flood_waits,
+                "retry_after_seconds": flood_wait,
+                "digest_size": len(rows),
+                "delivered": delivered,
+            },
+            error,
+            KIND_CLIENT,
+        )
+
+
+def _compose(rows):
+    """Текст и кнопки одной карточки или сводки из нескольких."""
+    if len(rows) == 1:
+        text, buttons = rows[0][1:3]
+        return text, _markup(json.loads(buttons) if buttons else []), rows
+
+    # Под заголовок берётся место самого длинного варианта, «(ещё N следом)»:
+    # какой из них понадобится, станет ясно только после подбора карточек
+    longest_header = _digest_header(len(rows), len(rows))
+    parts, keyboard, used = [], [], []
+    length = len(longest_header)
+    for number, row in enumerate(rows, 1):
+        text, buttons = row[1:3]
+        part = f"{number}. {text}"
+        added = len(_DIGEST_SEPARATOR) + len(part)
+        if length + added > MessageLimit.MAX_TEXT_LENGTH:
+            break
+        parts.append(part)
+        length += added
+        used.append(row)
+        for label, data in json.loads(buttons) if buttons else []:
+            keyboard.append([label + f" ({number})", data])
+    if not used:
+        # Первая карточка не помещается в сводку — уходит отдельным сообщением
+        return _compose(rows[:1])
+    header = _digest_header(len(used), len(rows) - len(used))
+    text = _DIGEST_SEPARATOR.join([header] + parts)
+    return text, _markup(keyboard), used
+
+
+def _digest_header(count, rest):
+    if rest:
+        return f"📬 Новых заявок: {count} (ещё {rest} следом)"
+    return f"📬 Новых заявок: {count}"
+
+
+def _markup(buttons):
+    if not buttons:
+        return None
+    return InlineKeyboardMarkup(
+        [[InlineKeyboardButton(label, callback_data=data)] for label, data in buttons]
+    )
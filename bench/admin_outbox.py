@@ -0,0 +1,106 @@
+# Всплеск заявок и лимиты Telegram: карточки администратору прямой
+# отправкой (как было — при ошибке карточка теряется) против очереди
+# AdminNotifier (ведро токенов, RetryAfter, повторы, сводки).
+# Заглушка бота пропускает в чат не больше LIMIT сообщений за WINDOW
+# секунд (дальше — 429 RetryAfter) и отвечает сетевой ошибкой на
+# FAILURE_RATE запросов.
+#
+#   python -m bench.admin_outbox [число_карточек]
+
+import asyncio
+import random
+import sys
+import tempfile
+import time
+from collections import deque
+from pathlib import Path
+
+from telegram.error import NetworkError, RetryAfter
+
+from admin_outbox import AdminNotifier
+
+LIMIT = 10
+WINDOW = 1.0
+FAILURE_RATE = 0.05
+CHAT_ID = 42
+
+
+class FloodLimitedBot:
+    def __init__(self, seed=0):
+        self._sent_at = deque()
+        self._random = random.Random(seed)
+        self.messages = []
+        self.cards = 0
+        self.flood_errors = 0
+        self.network_errors = 0
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        await asyncio.sleep(0.002)
+        now = time.monotonic()
+        while self._sent_at and now - self._sent_at[0] > WINDOW:
+            self._sent_at.popleft()
+        if len(self._sent_at) >= LIMIT:
+            self.flood_errors += 1
+            raise RetryAfter(1)
+        if self._random.random() < FAILURE_RATE:
+            self.network_errors += 1
+            raise NetworkError("connection reset")
+        self._sent_at.append(now)
+        self.messages.append(text)
+        self.cards += text.count("Заявка №")
+
+
+def _card(number):
+    return f"🆕 Заявка №{number}\nКлиент: Иван\nКонтакт: +7 900 000-00-{number % 100:02d}"
+
+
+async def run_direct(count):
+    bot = FloodLimitedBot()
+    started = time.perf_counter()
+    for number in range(count):
+        try:
+            await bot.send_message(chat_id=CHAT_ID, text=_card(number))
+        except Exception:
+            pass  # прежнее поведение: ошибка в лог, карточка потеряна
+    return bot, time.perf_counter() - started
+
+
+async def run_queued(count, digest_threshold):
+    bot = FloodLimitedBot()
+    with tempfile.TemporaryDirectory() as workdir:
+        notifier = AdminNotifier(
+            Path(workdir) / "outbox.sqlite3",
+            rate_per_minute=LIMIT * 60 / WINDOW * 0.9,
+            burst=LIMIT,
+            digest_threshold=digest_threshold,
+            backoff_base=0.05,
+        )
+        await notifier.start(bot)
+        started = time.perf_counter()
+        for number in range(count):
+            await notifier.submit(CHAT_ID, _card(number), [("📞 Позвонить клиенту", f"call_client:{number}")])
+        while notifier.queue_depth:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        await notifier.stop()
+    return bot, elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print(f"{count} карточек, лимит {LIMIT} сообщений за {WINDOW:.0f} с, {FAILURE_RATE:.0%} сетевых ошибок:")
+    runs = (
+        ("напрямую", run_direct(count)),
+        ("очередь", run_queued(count, 0)),
+        ("очередь+сводки", run_queued(count, 5)),
+    )
+    for name, coro in runs:
+        bot, elapsed = asyncio.run(coro)
+        print(
+            f"{name:>15}: доставлено {bot.cards:4d}/{count} карточек в {len(bot.messages):4d} сообщениях "
+            f"за {elapsed:5.2f} с; 429: {bot.flood_errors}, сетевых ошибок: {bot.network_errors}"
+        )
+
+
+if __name__ == "__main__":
+    main()
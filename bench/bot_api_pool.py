@@ -0,0 +1,91 @@
+# Пул соединений с Bot API под всплеском отправок: заглушка Bot API
+# отвечает на sendMessage с задержкой DELAY (как сеть до Telegram),
+# одновременно уходит BURST сообщений. Меряется время, ошибки ожидания
+# соединения (pool timeout) и счётчики загрузки пула PooledRequest.
+# Второй замер — отправки во время долгого getUpdates в общем пуле из
+# одного соединения и в отдельных пулах.
+#
+# Заглушка говорит только HTTP/1.1, поэтому HTTP/2 здесь не меряется.
+#
+#   python -m bench.bot_api_pool [число_сообщений]
+
+import asyncio
+import sys
+import time
+
+from telegram import Bot
+from telegram.error import TimedOut
+
+from bench.fake_bot_api import FakeBotApi
+from bot_api import PooledRequest
+
+DELAY = 0.02
+TOKEN = "123:bench"
+
+
+def _bot(api, request, get_updates_request=None):
+    return Bot(
+        TOKEN,
+        base_url=api.base_url,
+        request=request,
+        get_updates_request=get_updates_request or PooledRequest("get_updates", 1),
+    )
+
+
+async def burst(api, pool_size, count):
+    request = PooledRequest("send", connection_pool_size=pool_size, pool_timeout=1.0)
+    bot = _bot(api, request)
+    async with bot:
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(bot.send_message(chat_id=i, text="карточка") for i in range(count)),
+            return_exceptions=True,
+        )
+        elapsed = time.perf_counter() - started
+    failed = sum(1 for r in results if isinstance(r, TimedOut))
+    return elapsed, failed, request.stats()
+
+
+async def during_long_poll(api, shared):
+    send = PooledRequest("send", connection_pool_size=1 if shared else 8, pool_timeout=1.0)
+    bot = _bot(api, send, send if shared else PooledRequest("get_updates", 1))
+    async with bot:
+        poll = asyncio.create_task(bot.get_updates(timeout=3))
+        await asyncio.sleep(0.2)  # getUpdates уже занял соединение
+        latencies, failed = [], 0
+        for i in range(5):
+            started = time.perf_counter()
+            try:
+                await bot.send_message(chat_id=i, text="ответ")
+                latencies.append(time.perf_counter() - started)
+            except TimedOut:
+                failed += 1
+        await poll
+    return latencies, failed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    api = FakeBotApi(delay=DELAY)
+    api.start()
+    try:
+        print(f"{count} сообщений одновременно, ответ Bot API ~{DELAY * 1000:.0f} мс:")
+        for pool_size in (1, 4, 16, 64, 256):
+            elapsed, failed, stats = asyncio.run(burst(api, pool_size, count))
+            print(
+                f"  пул {pool_size:3d}: {elapsed:5.2f} с, pool timeout: {failed:3d}, "
+                f"пик ожидающих {max(0, stats['peak_in_flight'] - pool_size):3d}, "
+                f"ожидание соединения {stats['saturated_seconds']:.2f} с"
+            )
+
+        print("Отправки во время долгого getUpdates:")
+        for name, shared in (("общий пул из 1", True), ("отдельные пулы", False)):
+            latencies, failed = asyncio.run(during_long_poll(api, shared))
+            average = sum(latencies) / len(latencies) * 1000 if latencies else float("nan")
+            print(f"  {name:>15}: отправлено {len(latencies)}/5, pool timeout: {failed}, среднее {average:.0f} мс")
+    finally:
+        api.stop()
+
+
+if __name__ == "__main__":
+    main()
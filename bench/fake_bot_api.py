@@ -0,0 +1,264 @@
+# Заглушка Bot API для замеров без сети: принимает запросы бота
+# (TELEGRAM_API_BASE_URL=http://127.0.0.1:<порт>/bot), отдаёт
+# синтетические обновления через getUpdates или, после setWebhook, сама
+# POST-ит их на адрес бота с секретным заголовком — как Telegram.
+# Время получения каждого sendMessage (с текстом и клавиатурой)
+# записывается по chat_id, ответы на нажатия кнопок — по id нажатия.
+
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+BOT_USER = {
+    "id": 123,
+    "is_bot": True,
+    "first_name": "Петя",
+    "username": "nanorem_bench_bot",
+    "can_join_groups": False,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+
+
+def text_update(update_id: int, chat_id: int, text: str) -> dict:
+    """Синтетическое обновление: сообщение пользователя в личном чате."""
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private", "first_name": "Нагрузка"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Нагрузка"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        command = text.split()[0]
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    return {"update_id": update_id, "message": message}
+
+
+def callback_update(update_id: int, user_id: int, data: str, message: dict) -> dict:
+    """Синтетическое нажатие inline-кнопки под сообщением бота."""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": "Админ"},
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": message,
+        },
+    }
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Несколько процессов бота открывают соединения пачкой; при очереди
+    # по умолчанию (5) лишние получают сброс соединения
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # Бот обрывает долгий getUpdates при остановке — это не ошибка
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeBotApi:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, delay: float = 0.0):
+        self._server = _Server((host, port), self._handler_class())
+        self.delay = delay  # задержка ответа на методы кроме getUpdates (сеть до Telegram)
+        self._thread = None
+        self._cond = threading.Condition()
+        self._updates = []  # очередь для getUpdates
+        self._message_id = 0
+        self.webhook = None  # (url, secret_token) после setWebhook
+        self.polling = False  # бот хотя бы раз вызвал getUpdates
+        self.replies = {}  # chat_id -> [(perf_counter, text, reply_markup, message)]
+        self.answered = {}  # callback_query_id -> perf_counter
+        self.webhook_statuses = []  # HTTP-коды ответов бота на доставку
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        with self._cond:
+            self._updates.clear()
+            self.webhook = None
+            self.polling = False
+            self.replies.clear()
+            self.answered.clear()
+            self.webhook_statuses.clear()
+
+    # ===== Обновления для бота =====
+    def push(self, update: dict):
+        """Отдаёт обновление боту тем способом, который он сейчас использует."""
+        with self._cond:
+            webhook = self.webhook
+            if webhook is None:
+                self._updates.append(update)
+                self._cond.notify_all()
+                return
+        threading.Thread(target=self._deliver, args=(update, *webhook), daemon=True).start()
+
+    def _deliver(self, update: dict, url: str, secret_token: str):
+        status = post_update(url, update, secret_token)
+        with self._cond:
+            self.webhook_statuses.append(status)
+
+    def wait_ready(self, timeout: float = 30.0) -> bool:
+        """Ждёт, пока бот начнёт забирать обновления (getUpdates или setWebhook)."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.polling or self.webhook, timeout)
+
+    def wait_replies(self, chat_id: int, count: int = 1, timeout: float = 10.0):
+        with self._cond:
+            ok = self._cond.wait_for(lambda: len(self.replies.get(chat_id, ())) >= count, timeout)
+            return list(self.replies.get(chat_id, ())) if ok else None
+
+    def wait_text(self, chat_id: int, fragment: str, start: int = 0, timeout: float = 10.0):
+        """Ждёт ответа с fragment в тексте, начиная с ответа номер start.
+
+        Возвращает (номер ответа, время получения) или None.
+        """
+
+        def _find():
+            replies = self.replies.get(chat_id, ())
+            for index in range(start, len(replies)):
+                if fragment in (replies[index][1] or ""):
+                    return index, replies[index][0]
+            return None
+
+        with self._cond:
+            return self._cond.wait_for(_find, timeout)
+
+    def wait_answered(self, callback_query_id: str, timeout: float = 10.0):
+        with self._cond:
+            if self._cond.wait_for(lambda: callback_query_id in self.answered, timeout):
+                return self.answered[callback_query_id]
+            return None
+
+    # ===== Методы Bot API =====
+    def _call(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method == "deleteWebhook":
+            with self._cond:
+                self.webhook = None
+            return True
+        if method == "setWebhook":
+            with self._cond:
+                self.webhook = (params["url"], params.get("secret_token", ""))
+                self._cond.notify_all()
+            return True
+        if method == "getUpdates":
+            return self._get_updates(int(params.get("offset", 0)), float(params.get("timeout", 0)))
+        if self.delay and method != "getUpdates":
+            time.sleep(self.delay)
+        if method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            text = params.get("text")
+            with self._cond:
+                self._message_id += 1
+                message = {
+                    "message_id": self._message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "from": BOT_USER,
+                    "text": text or "",
+                }
+                self.replies.setdefault(chat_id, []).append(
+                    (time.perf_counter(), text, params.get("reply_markup"), message)
+                )
+                self._cond.notify_all()
+            return message
+        if method == "answerCallbackQuery":
+            with self._cond:
+                self.answered[str(params["callback_query_id"])] = time.perf_counter()
+                self._cond.notify_all()
+            return True
+        # sendChatAction, setMyCommands и прочее — просто «ok»
+        return True
+
+    def _get_updates(self, offset: int, timeout: float):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self.polling = True
+            self._cond.notify_all()
+            # offset подтверждает всё, что раньше него
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self._cond.wait(left)
+            return list(self._updates)
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # заголовки и тело уходят разными send: без этого ~40 мс на delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                params = _parse_params(self.headers.get("Content-Type", ""), body)
+                method = self.path.rsplit("/", 1)[-1]
+                payload = json.dumps({"ok": True, "result": api._call(method, params)}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _parse_params(content_type: str, body: bytes) -> dict:
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    # PTB шлёт form-urlencoded, сложные значения — строкой JSON; текст — как есть
+    params = {}
+    for key, value in parse_qsl(body.decode()):
+        if key == "text":
+            params[key] = value
+            continue
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+
+def post_update(url: str, update: dict, secret_token: str = None) -> int:
+    """POST обновления на webhook бота; возвращает HTTP-код ответа."""
+    headers = {"Content-Type": "application/json"}
+    if secret_token is not None:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = secret_token
+    request = urllib.request.Request(url, json.dumps(update).encode(), headers)
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
@@ -0,0 +1,98 @@
+# Сколько объектов создаёт обработчик на одно сообщение: клавиатура,
+# собираемая в каждом вызове (как было), против готовой (шаги анкеты
+# собирают клавиатуры один раз при старте).
+#
+#   python -m bench.keyboards [число_сообщений]
+
+import asyncio
+import gc
+import sys
+import time
+from types import SimpleNamespace
+
+from telegram import ReplyKeyboardMarkup
+
+import bot
+
+
+# ===== Эталон: обработчик «Перегрев» в прежнем виде =====
+async def legacy_overheat(update, context):
+    answer = update.message.text
+    valid_options_engine = ["Нет", "Был кратковременный", "Да, серьёзно", "Не знаю"]
+    engine_keyboard = [
+        ["Нет"],
+        ["Был кратковременный"],
+        ["Да, серьёзно"],
+        ["Не знаю"],
+    ]
+    if answer not in valid_options_engine:
+        bot._reply(
+            update,
+            "Пожалуйста, выберите один из вариантов на клавиатуре.",
+            reply_markup=ReplyKeyboardMarkup(
+                engine_keyboard,
+                resize_keyboard=True,
+                one_time_keyboard=True,
+            ),
+        )
+        return "overheat"
+    context.user_data["overheat"] = answer
+    repair_keyboard = [
+        ["Нет"],
+        ["Частичный ремонт"],
+        ["Капитальный ремонт"],
+        ["Не знаю"],
+    ]
+    bot._reply(
+        update,
+        "После перегрева двигатель ремонтировался?",
+        reply_markup=ReplyKeyboardMarkup(
+            repair_keyboard,
+            resize_keyboard=True,
+            one_time_keyboard=True,
+        ),
+    )
+    return "repair"
+
+
+def run(handler, answers, count):
+    sent = []
+    bot._reply = lambda update, text, **kwargs: sent.append(kwargs.get("reply_markup"))
+    context = SimpleNamespace(user_data={"aggregate": "Двигатель"})
+    if handler is bot.answer:
+        context.user_data = bot.Session()
+    updates = [
+        SimpleNamespace(message=SimpleNamespace(text=answers[i % len(answers)]))
+        for i in range(count)
+    ]
+    loop = asyncio.new_event_loop()
+
+    async def _all():
+        for update in updates:
+            if isinstance(context.user_data, bot.Session):
+                context.user_data["step"] = "engine_overheat"
+            await handler(update, context)
+
+    gc.collect()
+    gc.disable()
+    blocks = sys.getallocatedblocks()
+    started = time.perf_counter()
+    loop.run_until_complete(_all())
+    elapsed = time.perf_counter() - started
+    # Ответы держим в sent, поэтому их объекты ещё не освобождены
+    allocated = sys.getallocatedblocks() - blocks
+    gc.enable()
+    loop.close()
+    return allocated / count, elapsed / count * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    answers = ["Был кратковременный", "что-то не то"]  # верный ответ и повтор вопроса
+    for name, handler in (("как было", legacy_overheat), ("готовые", bot.answer)):
+        objects, micros = run(handler, answers, count)
+        print(f"{name:>10}: {objects:5.1f} объектов на сообщение, {micros:5.1f} мкс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+# Нагрузочный прогон bot.py без Telegram: бот запускается отдельным
+# процессом против заглушки Bot API (bench/fake_bot_api.py), N виртуальных
+# клиентов одновременно проходят анкету по сценариям — двигатель и другой
+# агрегат, ошибки ввода, /cancel, повторный выбор агрегата после заявки.
+# Виртуальный администратор нажимает «Позвонить клиенту» на каждой
+# пришедшей карточке (answerCallbackQuery + сообщение с телефоном).
+#
+# Отчёт: пропускная способность, p50/p95/p99 задержки ответа по шагам
+# анкеты и время от /start до ответа на client_contact.
+#
+#   python -m bench.load [клиентов] [повторов_на_клиента] [polling|webhook]
+
+import itertools
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from bench.fake_bot_api import FakeBotApi, callback_update, text_update
+from bench.update_latency import _free_port, _start_bot, _stop_bot, _wait_listening
+
+ADMIN_CHAT_ID = 999_999
+TIMEOUT = 30.0
+
+# Шаги: (шаг анкеты, что пишет клиент, фрагмент ожидаемого ответа)
+_START = ("start", "/start", "Выберите агрегат")
+_TAIL = [
+    ("vehicle_info", "Toyota Camry 2.4", "Ф.И.О."),
+    ("client_name", "Иван Петров", "номер телефона"),
+    ("client_contact", "+7 900 123-45-67", "Хотите выбрать"),
+]
+ENGINE = [
+    _START,
+    ("aggregate", "Двигатель", "Перегревался ли двигатель?"),
+    ("engine_overheat", "Был кратковременный", "ремонтировался?"),
+    ("engine_repair", "Нет", "Какой расход масла?"),
+    ("oil_consumption", "0.5–1 л / 1000 км", "Есть ли дым"),
+    ("smoke", "Нет", "объём двигателя в литрах"),
+    ("engine_volume", "1,6", "количество цилиндров"),
+    ("cylinders", "четыре", "цилиндров цифрой"),  # ошибка ввода
+    ("cylinders", "4", "объём масла в двигателе"),
+    ("engine_oil_volume", "4", "марку и модель"),
+    *_TAIL,
+    ("restart", "❌ Завершить", "Спасибо за обращение"),
+]
+OTHER = [
+    _START,
+    ("aggregate", "АКПП", "Ездили ли вы без масла"),
+    ("no_oil", "Кратковременно", "посторонние шумы"),
+    ("symptoms", "Иногда", "выберите один из вариантов"),  # не с клавиатуры
+    ("symptoms", "Незначительные", "объём масла в агрегате"),
+    ("oil_volume", "500", "Допустимый диапазон"),  # вне диапазона
+    ("oil_volume", "7", "марку и модель"),
+    ("vehicle_info", "Toyota Camry 2.4", "Ф.И.О."),
+    ("client_name", "Иван Петров", "номер телефона"),
+    ("client_contact", "@ivan_petrov", "Хотите выбрать"),
+    ("restart", "🔄 Выбрать ещё один агрегат", "Выберите агрегат"),
+    ("aggregate", "ГУР", "Ездили ли вы без масла"),
+    ("cancel", "/cancel", "Консультация завершена"),
+]
+CANCEL_AND_RETRY = [
+    _START,
+    ("aggregate", "Двигатель", "Перегревался ли двигатель?"),
+    ("cancel", "/cancel", "Консультация завершена"),
+    _START,
+    ("aggregate", "Редуктор (мост)", "Ездили ли вы без масла"),
+    ("no_oil", "Нет", "посторонние шумы"),
+    ("symptoms", "Нет", "объём масла в агрегате"),
+    ("oil_volume", "1,5", "марку и модель"),
+    *_TAIL,
+    ("restart", "❌ Завершить", "Спасибо за обращение"),
+]
+SCENARIOS = (ENGINE, OTHER, CANCEL_AND_RETRY)
+
+
+class LoadRun:
+    def __init__(self, api: FakeBotApi):
+        self.api = api
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.latencies = {}  # шаг -> [секунды]
+        self.completions = []  # от /start до ответа на client_contact
+        self.phone_cards = 0  # карточки с кнопкой «Позвонить клиенту»
+        self.calls = 0
+        self.messages = 0
+        self.errors = []
+
+    def _record(self, step, latency):
+        with self._lock:
+            self.latencies.setdefault(step, []).append(latency)
+            self.messages += 1
+
+    def client(self, chat_id: int, scenario, repeats: int):
+        api = self.api
+        seen = 0
+        try:
+            for _ in range(repeats):
+                started = None
+                for step, text, expected in scenario:
+                    sent = time.perf_counter()
+                    if step == "start":
+                        started = sent
+                    api.push(text_update(next(self._ids), chat_id, text))
+                    found = api.wait_text(chat_id, expected, seen, TIMEOUT)
+                    if found is None:
+                        raise RuntimeError(f"чат {chat_id}: на «{text}» ({step}) нет ответа «{expected}»")
+                    index, received = found
+                    seen = index + 1
+                    self._record(step, received - sent)
+                    if step == "client_contact":
+                        with self._lock:
+                            self.completions.append(received - started)
+                            if any(c.isdigit() for c in text):
+                                self.phone_cards += 1
+        except Exception as e:
+            with self._lock:
+                self.errors.append(str(e))
+
+    def admin(self, stop: threading.Event):
+        """Нажимает «Позвонить клиенту» под каждой новой карточкой.
+
+        После stop дожидается карточек, ещё лежащих в очереди бота.
+        """
+        api = self.api
+        handled = 0
+        deadline = None
+        while True:
+            cards = api.replies.get(ADMIN_CHAT_ID, ())
+            if handled >= len(cards):
+                if stop.is_set():
+                    if self.calls >= self.phone_cards:
+                        return
+                    deadline = deadline or time.perf_counter() + TIMEOUT
+                    if time.perf_counter() > deadline:
+                        with self._lock:
+                            self.errors.append(f"дошло карточек с телефоном: {self.calls}/{self.phone_cards}")
+                        return
+                time.sleep(0.01)
+                continue
+            _, _, markup, message = cards[handled]
+            handled += 1
+            for row in (markup or {}).get("inline_keyboard", ()):
+                for button in row:
+                    data = button.get("callback_data", "")
+                    if not data.startswith("call_client:"):
+                        continue
+                    update = callback_update(next(self._ids), ADMIN_CHAT_ID, data, message)
+                    sent = time.perf_counter()
+                    api.push(update)
+                    self.calls += 1
+                    answered = api.wait_answered(update["callback_query"]["id"], TIMEOUT)
+                    if answered is None:
+                        with self._lock:
+                            self.errors.append(f"нажатие {data} без answerCallbackQuery")
+                        continue
+                    self._record("admin_call", answered - sent)
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def report(run: LoadRun, elapsed: float, clients: int):
+    print(
+        f"{clients} клиентов: {run.messages} сообщений за {elapsed:.2f} с, "
+        f"{run.messages / elapsed:.0f} сообщений/с, ошибок: {len(run.errors)}"
+    )
+    print(f"{'шаг':>18} {'n':>6} {'p50 мс':>8} {'p95 мс':>8} {'p99 мс':>8}")
+    for step, values in sorted(run.latencies.items(), key=lambda item: -statistics.median(item[1])):
+        print(
+            f"{step:>18} {len(values):6d} {statistics.median(values) * 1000:8.1f} "
+            f"{_percentile(values, 0.95) * 1000:8.1f} {_percentile(values, 0.99) * 1000:8.1f}"
+        )
+    if run.completions:
+        print(
+            f"от /start до заявки: p50 {statistics.median(run.completions) * 1000:.0f} мс, "
+            f"p95 {_percentile(run.completions, 0.95) * 1000:.0f} мс, "
+            f"p99 {_percentile(run.completions, 0.99) * 1000:.0f} мс"
+        )
+    for error in run.errors[:5]:
+        print("  !", error)
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    mode = sys.argv[3] if len(sys.argv) > 3 else "polling"
+    api = FakeBotApi()
+    api.start()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            port = _free_port()
+            process = _start_bot(
+                api,
+                mode,
+                workdir,
+                port,
+                ADMIN_CHAT_ID=str(ADMIN_CHAT_ID),
+                ADMIN_RATE_PER_MINUTE="1000000",
+                ADMIN_BURST="1000",
+            )
+            try:
+                if not api.wait_ready(60):
+                    raise RuntimeError("бот не начал принимать обновления")
+                if mode == "webhook":
+                    _wait_listening(port)
+                run = LoadRun(api)
+                stop = threading.Event()
+                admin = threading.Thread(target=run.admin, args=(stop,))
+                threads = [
+                    threading.Thread(target=run.client, args=(chat_id, SCENARIOS[chat_id % len(SCENARIOS)], repeats))
+                    for chat_id in range(1, clients + 1)
+                ]
+                started = time.perf_counter()
+                admin.start()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - started
+                stop.set()
+                admin.join(TIMEOUT * 2)
+            finally:
+                _stop_bot(process, workdir)
+        report(run, elapsed, clients)
+    finally:
+        api.stop()
+
+
+if __name__ == "__main__":
+    main()
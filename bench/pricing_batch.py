@@ -0,0 +1,80 @@
+# Скалярный calculate_treatment_cost в цикле против пакетного расчёта: по
+# столбцу названий агрегатов и по готовым кодам (factorize), когда строки
+# при расчёте не сравниваются. Перед замером проверяется, что результаты
+# совпадают поэлементно.
+#
+#   python -m bench.pricing_batch [число_строк]
+
+import random
+import sys
+import time
+
+import numpy as np
+
+from pricing import calculate_treatment_cost
+from pricing_batch import RESULT_FIELDS, calculate_treatment_cost_batch, factorize
+
+AGGREGATES = ["Двигатель", "МКПП", "АКПП", "Редуктор (мост)", "ГУР", "Неизвестный"]
+
+
+def make_columns(n, seed=1):
+    rnd = random.Random(seed)
+    aggregate = [rnd.choice(AGGREGATES) for _ in range(n)]
+    engine_volume = [rnd.choice([None, 0.0, round(rnd.uniform(0.6, 20.0), 1)]) for _ in range(n)]
+    oil_volume = [rnd.choice([None, round(rnd.uniform(0.3, 70.0), 1)]) for _ in range(n)]
+    cylinders = [rnd.choice([None, 2, 3, 4, 6, 8, 12, 16]) for _ in range(n)]
+    return aggregate, engine_volume, oil_volume, cylinders
+
+
+def _best(calculate, repeat=5):
+    # Пакетный расчёт быстрый и шумит сильнее скалярного цикла: лучший из повторов
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = calculate()
+        times.append(time.perf_counter() - started)
+    return result, min(times)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    aggregate, engine_volume, oil_volume, cylinders = make_columns(n)
+
+    started = time.perf_counter()
+    scalar = [
+        calculate_treatment_cost(a, e, o, c)
+        for a, e, o, c in zip(aggregate, engine_volume, oil_volume, cylinders)
+    ]
+    scalar_time = time.perf_counter() - started
+
+    # Столбцы заранее в NumPy, как при перерасчёте выгрузки из базы
+    columns = (
+        np.asarray(aggregate),
+        np.array([np.nan if v is None else v for v in engine_volume]),
+        np.array([np.nan if v is None else v for v in oil_volume]),
+        np.array([np.nan if v is None else v for v in cylinders], dtype=np.float64),
+    )
+    batch, batch_time = _best(lambda: calculate_treatment_cost_batch(*columns))
+    codes, categories = factorize(columns[0])
+    by_codes, codes_time = _best(
+        lambda: calculate_treatment_cost_batch(codes, *columns[1:], categories=categories)
+    )
+
+    for i, field in enumerate(RESULT_FIELDS):
+        expected = np.array([row[i] for row in scalar], dtype=np.float64)
+        for result in (batch, by_codes):
+            if not np.array_equal(expected, result[field]):
+                bad = int(np.flatnonzero(expected != result[field])[0])
+                raise SystemExit(
+                    f"Расхождение в {field}, строка {bad}: "
+                    f"{expected[bad]!r} != {result[field][bad]!r}"
+                )
+
+    print(f"строк: {n}")
+    print(f"скалярно: {scalar_time:.3f} с")
+    print(f"пакетно, по названиям: {batch_time:.3f} с (×{scalar_time / batch_time:.0f})")
+    print(f"пакетно, по кодам:     {codes_time:.3f} с (×{scalar_time / codes_time:.0f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Проверка эквивалентности движка правил прежним реализациям pricing.py и
+# calculator.py (их формулы повторены ниже как эталон) и микро-замер.
+#
+#   python -m bench.pricing_engine [число_строк]
+
+import random
+import sys
+import timeit
+
+import calculator
+import pricing
+from bench.pricing_batch import make_columns
+
+
+# ===== Эталон: прежние реализации с if-цепочками =====
+def legacy_pricing(aggregate, engine_volume=None, oil_volume=None, cylinders=None, cfg=None):
+    base_work_cost = {"Двигатель": 3000, "МКПП": 5000, "АКПП": 6000, "Редуктор (мост)": 300, "ГУР": 300}
+    rvs_ml = 0.0
+    accel_ml = 0.0
+    if aggregate == "Двигатель" and engine_volume and oil_volume:
+        rvs_ml = engine_volume * cfg.rvs_dose_ml_per_l_engine
+        accel_ml = oil_volume * cfg.accel_dose_ml_per_l_oil
+    elif oil_volume:
+        rvs_ml = oil_volume * 5
+        accel_ml = oil_volume * 2.5
+    material_cost = rvs_ml * cfg.rvs_price_per_ml + accel_ml * cfg.accel_price_per_ml
+    base_work = base_work_cost.get(aggregate, 0)
+    if aggregate == "Двигатель":
+        cyl = cylinders or 4
+        work_cost = 3000 if cyl == 2 else base_work + 1000 * cyl
+    else:
+        work_cost = base_work
+    if aggregate == "Двигатель" and engine_volume and engine_volume >= 8.0:
+        work_cost *= 1.5
+    material_price_client = material_cost * cfg.markup_coef
+    total_price_client = material_price_client + work_cost
+    profit = total_price_client - (material_cost + work_cost)
+    return rvs_ml, accel_ml, material_cost, material_price_client, work_cost, total_price_client, profit
+
+
+def legacy_calculator(aggregate, engine_volume, oil_volume, rvs_price, accel_price, markup, rvs_dose, accel_dose):
+    if aggregate == "Двигатель" and engine_volume is not None and oil_volume is not None:
+        rvs_ml = engine_volume * rvs_dose
+        accel_ml = oil_volume * accel_dose
+    elif oil_volume is not None:
+        rvs_ml = oil_volume * 5
+        accel_ml = oil_volume * 2.5
+    else:
+        rvs_ml = 0
+        accel_ml = 0
+    cost_raw = rvs_ml * rvs_price + accel_ml * accel_price
+    client_price = cost_raw * markup
+    return rvs_ml, accel_ml, cost_raw, client_price, client_price - cost_raw
+
+
+def check_equivalence(n):
+    cfg = pricing.current_config()
+    rows = list(zip(*make_columns(n, seed=2)))
+    for aggregate, engine_volume, oil_volume, cylinders in rows:
+        expected = legacy_pricing(aggregate, engine_volume, oil_volume, cylinders, cfg)
+        actual = pricing.calculate_treatment_cost(aggregate, engine_volume, oil_volume, cylinders)
+        if expected != actual:
+            raise SystemExit(f"pricing: {aggregate, engine_volume, oil_volume, cylinders}: {expected} != {actual}")
+
+        # У прежнего calculator 0 л считался указанным объёмом; бот нули не пропускает
+        if engine_volume == 0:
+            continue
+        prices = (65.0, 28.0, 2.2, 10.0, 5.0)
+        expected = legacy_calculator(aggregate, engine_volume, oil_volume, *prices)
+        actual = calculator.calculate_treatment_cost(aggregate, engine_volume, oil_volume, *prices)
+        if expected != actual:
+            raise SystemExit(f"calculator: {aggregate, engine_volume, oil_volume}: {expected} != {actual}")
+    print(f"эквивалентность: {n} строк совпали")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    check_equivalence(n)
+
+    cfg = pricing.current_config()
+    rnd = random.Random(3)
+    rows = list(zip(*make_columns(1000, seed=4)))
+    rnd.shuffle(rows)
+    number = 200
+
+    cases = {
+        "if-цепочки (эталон)": lambda: [legacy_pricing(*row, cfg) for row in rows],
+        "движок правил": lambda: [pricing.calculate_treatment_cost(*row, config=cfg) for row in rows],
+        "calculator (адаптер)": lambda: [
+            calculator.calculate_treatment_cost(a, e, o, 70.0, 30.0, 2.0, 10.0, 5.0)
+            for a, e, o, _ in rows
+        ],
+    }
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=number, repeat=3))
+        print(f"{name:>22}: {seconds / number / len(rows) * 1e9:.0f} нс на расчёт")
+
+
+if __name__ == "__main__":
+    main()
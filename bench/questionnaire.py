@@ -0,0 +1,183 @@
+# Стоимость обработки одного сообщения анкеты: прежние отдельные
+# обработчики с if по агрегату против одного обработчика по таблице шагов.
+# Расчёт и отправка заявки в замер не входят — только выбор шага,
+# проверка ответа и следующий вопрос. Таблица платит ещё и за учёт, которого
+# у прежних обработчиков нет: шаг в сессии, гистограмма, воронка, трассировка.
+#
+#   python -m bench.questionnaire [число_анкет]
+
+import asyncio
+import sys
+import time
+from types import SimpleNamespace
+
+import bot
+import keyboards
+from session import Session
+
+
+# ===== Эталон: прежние обработчики (в редакции с готовыми клавиатурами) =====
+AGGREGATES = keyboards.choice("Двигатель", "МКПП", "АКПП", "Редуктор (мост)", "ГУР")
+ENGINE_OVERHEAT = keyboards.choice("Нет", "Был кратковременный", "Да, серьёзно", "Не знаю")
+ENGINE_REPAIR = keyboards.choice("Нет", "Частичный ремонт", "Капитальный ремонт", "Не знаю")
+OIL_CONSUMPTION = keyboards.choice("До 0.5 л / 1000 км", "0.5–1 л / 1000 км", "Более 1 л / 1000 км")
+SMOKE = keyboards.choice("Нет", "Синий", "Белый", "Чёрный")
+NO_OIL = keyboards.choice("Нет", "Кратковременно", "Да, долго", "Не знаю")
+SYMPTOMS = keyboards.choice("Нет", "Незначительные", "Сильные", "Не знаю")
+CHOOSE = "Пожалуйста, выберите один из вариантов на клавиатуре."
+
+
+async def legacy_aggregate(update, context):
+    choice = update.message.text
+    context.user_data["aggregate"] = choice
+    if choice == "Двигатель":
+        bot._reply(update, "Перегревался ли двигатель?", reply_markup=ENGINE_OVERHEAT.markup)
+        return "overheat"
+    if choice in AGGREGATES.valid:
+        bot._reply(update, "Ездили ли вы без масла?", reply_markup=NO_OIL.markup)
+        return "overheat"
+    bot._reply(update, CHOOSE, reply_markup=AGGREGATES.markup)
+    return "aggregate"
+
+
+async def legacy_overheat(update, context):
+    aggregate = context.user_data.get("aggregate", "Двигатель")
+    answer = update.message.text
+    if aggregate == "Двигатель":
+        if answer not in ENGINE_OVERHEAT.valid:
+            bot._reply(update, CHOOSE, reply_markup=ENGINE_OVERHEAT.markup)
+            return "overheat"
+        context.user_data["overheat"] = answer
+        if answer == "Нет":
+            bot._reply(update, "Какой расход масла?", reply_markup=OIL_CONSUMPTION.markup)
+            return "oil_consumption"
+        bot._reply(update, "Ремонтировался?", reply_markup=ENGINE_REPAIR.markup)
+        return "repair"
+    if answer not in NO_OIL.valid:
+        bot._reply(update, CHOOSE, reply_markup=NO_OIL.markup)
+        return "overheat"
+    context.user_data["no_oil"] = answer
+    bot._reply(update, "Есть ли шумы?", reply_markup=SYMPTOMS.markup)
+    return "repair"
+
+
+async def legacy_repair(update, context):
+    aggregate = context.user_data.get("aggregate", "Двигатель")
+    answer = update.message.text
+    if aggregate == "Двигатель":
+        if answer not in ENGINE_REPAIR.valid:
+            bot._reply(update, CHOOSE, reply_markup=ENGINE_REPAIR.markup)
+            return "repair"
+        context.user_data["repair"] = answer
+        bot._reply(update, "Какой расход масла?", reply_markup=OIL_CONSUMPTION.markup)
+        return "oil_consumption"
+    if answer not in SYMPTOMS.valid:
+        bot._reply(update, CHOOSE, reply_markup=SYMPTOMS.markup)
+        return "repair"
+    context.user_data["symptoms"] = answer
+    bot._reply(update, "Объём масла?", reply_markup=keyboards.REMOVE)
+    return "oil_volume"
+
+
+async def legacy_oil_consumption(update, context):
+    answer = update.message.text
+    if answer not in OIL_CONSUMPTION.valid:
+        bot._reply(update, CHOOSE, reply_markup=OIL_CONSUMPTION.markup)
+        return "oil_consumption"
+    context.user_data["oil_consumption"] = answer
+    bot._reply(update, "Есть ли дым?", reply_markup=SMOKE.markup)
+    return "smoke"
+
+
+async def legacy_smoke(update, context):
+    answer = update.message.text
+    if answer not in SMOKE.valid:
+        bot._reply(update, CHOOSE, reply_markup=SMOKE.markup)
+        return "smoke"
+    context.user_data["smoke"] = answer
+    bot._reply(update, "Объём двигателя?", reply_markup=keyboards.REMOVE)
+    return "engine_volume"
+
+
+async def legacy_engine_volume(update, context):
+    text = update.message.text.strip().replace(",", ".")
+    try:
+        value = float(text)
+        if value < 0.6 or value > 20.0:
+            raise ValueError
+    except ValueError:
+        bot._reply(update, "Введите корректный объём двигателя")
+        return "engine_volume"
+    context.user_data["engine_volume"] = value
+    if context.user_data.get("aggregate", "Двигатель") == "Двигатель":
+        bot._reply(update, "Сколько цилиндров?")
+        return "cylinders"
+    bot._reply(update, "Объём масла?")
+    return "oil_volume"
+
+
+async def legacy_cylinders(update, context):
+    text = update.message.text.strip()
+    if not text.isdigit():
+        bot._reply(update, "Введите цифрой")
+        return "cylinders"
+    cylinders = int(text)
+    if cylinders < 2 or cylinders > 16:
+        bot._reply(update, "Введите реалистичное количество")
+        return "cylinders"
+    context.user_data["cylinders"] = cylinders
+    bot._reply(update, "Объём масла в двигателе?")
+    return "oil_volume"
+
+
+LEGACY = {
+    "aggregate": legacy_aggregate,
+    "overheat": legacy_overheat,
+    "repair": legacy_repair,
+    "oil_consumption": legacy_oil_consumption,
+    "smoke": legacy_smoke,
+    "engine_volume": legacy_engine_volume,
+    "cylinders": legacy_cylinders,
+}
+
+# Двигатель с перегревом и одной ошибкой ввода: 8 сообщений до объёма масла
+SCRIPT = ["Двигатель", "Был кратковременный", "Нет", "0.5–1 л / 1000 км", "Нет", "1,6", "четыре", "4"]
+
+
+async def run_legacy(count):
+    for _ in range(count):
+        context = SimpleNamespace(user_data=Session())
+        state = "aggregate"
+        for text in SCRIPT:
+            state = await LEGACY[state](SimpleNamespace(message=SimpleNamespace(text=text)), context)
+        assert state == "oil_volume", state
+
+
+async def run_engine(count):
+    first = bot.QUESTIONNAIRE.first_step
+    for _ in range(count):
+        context = SimpleNamespace(user_data=Session())
+        context.user_data["step"] = first
+        for text in SCRIPT:
+            await bot.answer(SimpleNamespace(message=SimpleNamespace(text=text)), context)
+        assert context.user_data["step"] == "engine_oil_volume", context.user_data["step"]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    bot._reply = lambda update, text, **kwargs: None
+    updates = count * len(SCRIPT)
+    runners = {"обработчики": run_legacy, "таблица шагов": run_engine}
+    timings = {name: [] for name in runners}
+    # Прогоны чередуются, берётся лучший: меньше влияние соседей по машине
+    for _ in range(7):
+        for name, runner in runners.items():
+            started = time.perf_counter()
+            asyncio.run(runner(count))
+            timings[name].append(time.perf_counter() - started)
+    for name, values in timings.items():
+        print(f"{name:>14}: {min(values) / updates * 1e6:.2f} мкс на сообщение")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# Память на сессию: словарь user_data против Session со __slots__, и
+# объём памяти при постоянном притоке новых клиентов с очисткой и без.
+#
+#   python -m bench.session [число_клиентов]
+
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from types import MappingProxyType
+
+from session import Session, SessionSweeper
+
+
+ANSWERS = {
+    "lead_id": "01JB8Y3Z4K5M6N7P8Q9R0S1T2V",
+    "aggregate": "Двигатель",
+    "overheat": "Нет",
+    "repair": "Нет",
+    "oil_consumption": "Нет",
+    "smoke": "Нет",
+    "engine_volume": 1.6,
+    "cylinders": 4,
+    "oil_volume": 4.0,
+    "vehicle_info": "Lada Vesta 2019",
+    "client_name": "Иван",
+    "client_contact": "+79991234567",
+}
+
+
+def fill(factory, count):
+    sessions = {}
+    for user_id in range(count):
+        session = factory()
+        for key, value in ANSWERS.items():
+            session[key] = value
+        sessions[user_id] = session
+    return sessions
+
+
+def measure(factory, count):
+    tracemalloc.start()
+    sessions = fill(factory, count)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del sessions
+    return size // count
+
+
+class _Application:
+    # Минимум того, что SessionSweeper берёт у Application
+    def __init__(self):
+        self._user_data = defaultdict(Session)
+        self.user_data = MappingProxyType(self._user_data)
+
+    def drop_user_data(self, user_id):
+        self._user_data.pop(user_id, None)
+
+
+def churn(clients, ttl_hours):
+    # Каждый «час» приходит новая партия клиентов; очистка раз в час
+    app = _Application()
+    sweeper = SessionSweeper(ttl_hours * 3600)
+    sweeper.application = app
+    now = time.time()
+    per_hour = clients // 48
+    tracemalloc.start()
+    for hour in range(48):
+        for user_id in range(hour * per_hour, (hour + 1) * per_hour):
+            session = app._user_data[user_id]
+            session.update(ANSWERS)
+            session.last_seen = now + hour * 3600
+        if ttl_hours:
+            sweeper.sweep(now=now + hour * 3600)
+        if hour in (11, 23, 47):
+            size, _ = tracemalloc.get_traced_memory()
+            print(f"  через {hour + 1:>2} ч: сессий {len(app.user_data):>6}, {size / 2**20:6.1f} МБ")
+    tracemalloc.stop()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"dict:    {measure(dict, count)} байт на сессию")
+    print(f"Session: {measure(Session, count)} байт на сессию")
+    print("без очистки:")
+    churn(count, 0)
+    print("с очисткой (TTL 6 ч):")
+    churn(count, 6)
+
+
+if __name__ == "__main__":
+    main()
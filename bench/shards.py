@@ -0,0 +1,98 @@
+# Пропускная способность: один процесс против нескольких
+# процессов-обработчиков (BOT_WORKERS) за общим приёмником. bot.py
+# запускается против заглушки Bot API; каждый из чатов проходит анкету
+# целиком, до заявки (12 сообщений), все чаты — одновременно. После
+# остановки бота проверяется, что в CSV (у каждого обработчика свой) ровно
+# по строке на заявку и по одному заголовку на файл.
+#
+#   python -m bench.shards [число_чатов] [обработчиков ...]
+
+import csv
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench.fake_bot_api import FakeBotApi, text_update
+from bench.update_latency import _free_port, _start_bot, _stop_bot
+from lead_writer import CSV_HEADERS
+
+SCRIPT = [
+    "/start",
+    "Двигатель",
+    "Был кратковременный",
+    "Нет",
+    "0.5–1 л / 1000 км",
+    "Нет",
+    "1,6",
+    "4",
+    "4",
+    "Toyota Camry 2.4",
+    "Иван Петров",
+    "+7 900 123-45-67",
+]
+# На последний ответ — заключение и вопрос о следующем агрегате
+REPLIES = len(SCRIPT) + 1
+
+
+def _check_csv(workdir: str, chats: int):
+    files = sorted(Path(workdir, "applications").glob("leads*.csv"))
+    rows = 0
+    for path in files:
+        with open(path, newline="", encoding="utf-8") as f:
+            lines = list(csv.reader(f))
+        if lines[0] != CSV_HEADERS or CSV_HEADERS in lines[1:]:
+            raise RuntimeError(f"{path.name}: заголовок не в начале или повторяется")
+        rows += len(lines) - 1
+    if rows != chats:
+        raise RuntimeError(f"в CSV {rows} заявок из {chats}")
+    return [path.name for path in files]
+
+
+def measure(api: FakeBotApi, workers: int, chats: int):
+    api.reset()
+    os.environ["BOT_WORKERS"] = str(workers)
+    with tempfile.TemporaryDirectory() as workdir:
+        process = _start_bot(api, "polling", workdir, _free_port())
+        try:
+            if not api.wait_ready(60):
+                raise RuntimeError("бот не начал принимать обновления")
+            update_id = 1
+            started = time.perf_counter()
+            for text in SCRIPT:
+                for chat_id in range(1, chats + 1):
+                    api.push(text_update(update_id, chat_id, text))
+                    update_id += 1
+            for chat_id in range(1, chats + 1):
+                replies = api.wait_replies(chat_id, REPLIES, timeout=120)
+                if replies is None or "Хотите выбрать" not in replies[-1][1]:
+                    raise RuntimeError(f"чат {chat_id} не дошёл до заявки: {replies}")
+            elapsed = time.perf_counter() - started
+        finally:
+            _stop_bot(process, workdir)
+        return elapsed, _check_csv(workdir, chats)
+
+
+def main():
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    counts = [int(arg) for arg in sys.argv[2:]] or [1, 2, 4]
+    api = FakeBotApi()
+    api.start()
+    try:
+        print(f"ядер: {os.cpu_count()}, чатов: {chats}")
+        baseline = None
+        for workers in counts:
+            elapsed, files = measure(api, workers, chats)
+            updates = chats * len(SCRIPT)
+            baseline = baseline or updates / elapsed
+            print(
+                f"обработчиков {workers}: {elapsed:5.2f} с, {updates / elapsed:7.0f} обновлений/с "
+                f"(×{updates / elapsed / baseline:.2f}), CSV: {', '.join(files)}"
+            )
+    finally:
+        api.stop()
+
+
+if __name__ == "__main__":
+    main()
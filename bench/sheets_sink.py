@@ -0,0 +1,109 @@
+# Сравнение отправки лидов в Google Sheets на локальной заглушке вебхука:
+# прежний путь (новый POST в потоке на каждый лид) против GoogleSheetsSink.
+#
+#   python -m bench.sheets_sink [число_лидов] [задержка_вебхука_мс]
+
+import asyncio
+import json
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from sheets_sink import GoogleSheetsSink
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, как у Apps Script
+    # Заголовки и тело уходят разными write: без TCP_NODELAY на keep-alive
+    # соединении каждый ответ ждал бы отложенного ACK (~40 мс)
+    disable_nagle_algorithm = True
+    latency = 0.05
+    received = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        leads = body["leads"] if "leads" in body else [body]
+        time.sleep(self.latency)
+        with self.lock:
+            type(self).received += len(leads)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+class _StandInServer(ThreadingHTTPServer):
+    # По умолчанию очередь подключений — 5: остальные одновременные
+    # соединения ждали бы повтора SYN (1 с), чего у Apps Script нет
+    request_queue_size = 128
+
+
+def _payload(i):
+    return {
+        "name": f"Клиент {i}",
+        "contact": "+79990000000",
+        "aggregate": "Двигатель",
+        "vehicle": "Toyota Camry 2.4",
+        "engine_volume": 2.4,
+        "oil_volume": 4.5,
+        "price": 12345.0,
+        "profit": 4321.0,
+    }
+
+
+async def _per_lead_threads(url, n):
+    def _do_post(payload):
+        req = urllib.request.Request(
+            url,
+            data=json.dumps(payload).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            return resp.status
+
+    await asyncio.gather(*(asyncio.to_thread(_do_post, _payload(i)) for i in range(n)))
+
+
+async def _sink(url, n):
+    with tempfile.TemporaryDirectory() as tmp:
+        # Настройки по умолчанию, как в боте: по одному лиду, 16 соединений
+        sink = GoogleSheetsSink(url, spool_path=Path(tmp) / "spool.jsonl")
+        await sink.start()
+        for i in range(n):
+            sink.submit(_payload(i))
+        await sink.stop()
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    _StandInHandler.latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 50) / 1000
+
+    server = _StandInServer(("127.0.0.1", 0), _StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/exec"
+
+    try:
+        for name, runner in (("поток на каждый лид", _per_lead_threads), ("GoogleSheetsSink", _sink)):
+            _StandInHandler.received = 0
+            started = time.perf_counter()
+            asyncio.run(runner(url, n))
+            elapsed = time.perf_counter() - started
+            print(
+                f"{name:>22}: {n} лидов за {elapsed:.2f} с "
+                f"({n / elapsed:.0f} лидов/с, принято {_StandInHandler.received})"
+            )
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# Хранение состояния анкет: время старта при большой истории и запись
+# пачкой за проход против записи на каждое обновление.
+#
+#   python -m bench.state_store [число_пользователей]
+
+import asyncio
+import pickle
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from state_store import SqlitePersistence
+
+
+def _user_data(user_id):
+    return {
+        "lead_id": f"01J{user_id:023d}",
+        "aggregate": "Двигатель",
+        "engine_volume": 1.6,
+        "oil_volume": 4.0,
+        "cylinders": 4,
+        "client_name": "Иван",
+    }
+
+
+def populate(path: Path, users: int, active: int):
+    # Вся история старше TTL, кроме active последних анкет
+    persistence = SqlitePersistence(path)
+    old = time.time() - 30 * 24 * 3600
+    now = time.time()
+    with persistence._writer as conn:
+        conn.executemany(
+            "INSERT INTO user_data VALUES (?, ?, ?)",
+            ((user_id, pickle.dumps(_user_data(user_id)), old) for user_id in range(users)),
+        )
+        conn.executemany(
+            "INSERT INTO conversations VALUES ('questionnaire', ?, ?, ?)",
+            (
+                (f"[{user_id}, {user_id}]", pickle.dumps(7), now if user_id < active else old)
+                for user_id in range(users)
+            ),
+        )
+    persistence._reader.close()
+    persistence._writer.close()
+
+
+async def startup(path: Path):
+    persistence = SqlitePersistence(path)
+    started = time.perf_counter()
+    await persistence.get_user_data()
+    conversations = await persistence.get_conversations("questionnaire")
+    elapsed = time.perf_counter() - started
+    await persistence.flush()
+    return elapsed, len(conversations)
+
+
+def eager_startup(path: Path):
+    # Как загрузили бы всё целиком (PicklePersistence и т.п.)
+    started = time.perf_counter()
+    conn = sqlite3.connect(path)
+    user_data = {user_id: pickle.loads(data) for user_id, data in conn.execute("SELECT user_id, data FROM user_data")}
+    conversations = dict(conn.execute("SELECT key, state FROM conversations"))
+    conn.close()
+    return time.perf_counter() - started, len(user_data) + len(conversations)
+
+
+async def writes(path: Path, updates: int, batched: bool):
+    persistence = SqlitePersistence(path)
+    started = time.perf_counter()
+    for user_id in range(updates):
+        await persistence.update_user_data(user_id, _user_data(user_id))
+        await persistence.update_conversation("questionnaire", (user_id, user_id), 8)
+        if not batched:
+            await persistence._flush_task
+    await persistence.flush()
+    return time.perf_counter() - started, persistence.batches
+
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "state.sqlite3"
+        populate(path, users, active=200)
+        eager, loaded = eager_startup(path)
+        print(f"загрузка всей истории ({users} польз.): {eager:.3f} с, {loaded} записей")
+        lazy, active = await startup(path)
+        print(f"SqlitePersistence: {lazy:.3f} с, поднято анкет: {active}")
+        lazy, active = await startup(path)
+        print(f"повторный старт (старое уже удалено): {lazy:.4f} с, анкет: {active}")
+
+        for batched in (False, True):
+            path = Path(tmp) / f"writes_{batched}.sqlite3"
+            elapsed, batches = await writes(path, 2000, batched)
+            name = "одной пачкой" if batched else "по одной"
+            print(f"2000 обновлений {name}: {elapsed:.3f} с, транзакций: {batches}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
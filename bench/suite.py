@@ -0,0 +1,245 @@
+# Набор замеров горячих путей заявки с сохранёнными базовыми значениями:
+# скалярный и пакетный расчёт цены (по названиям и по кодам агрегатов),
+# сборка расчёта с текстами, карточка администратору, запись заявки (SQLite,
+# JSON, leads.csv) и сборка пачки для Google Sheets. Сеть не нужна.
+#
+# Результаты сравниваются с bench/baselines.json. Машины бывают быстрее и
+# медленнее, поэтому вместе с замерами хранится калибровка (чистый цикл
+# на Python), и сравнивается время с поправкой на неё. Если случай
+# медленнее базового больше, чем в его порог, печатается разница с
+# базовыми значениями и код выхода 1.
+#
+#   python -m bench.suite             # сравнить с базовыми значениями
+#   python -m bench.suite --update    # записать текущие как базовые
+#   python -m bench.suite admin_card  # только выбранные случаи
+
+import itertools
+import json
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+import numpy as np
+
+import pricing
+from bench.pricing_batch import make_columns
+from lead_store import LeadStore
+from lead_writer import LeadWriter
+from pricing_batch import calculate_treatment_cost_batch, factorize
+from quotes import build_quote, render_admin_card
+from sheets_sink import lead_payload
+
+BASELINES_PATH = Path(__file__).with_name("baselines.json")
+REPEAT = 5
+
+
+class Case(NamedTuple):
+    name: str
+    setup: Callable  # (workdir) -> (функция замера, единиц работы за вызов)
+    number: int  # вызовов в одном повторе
+    threshold: float  # допустимое замедление относительно базового
+
+
+# ===== Данные =====
+_ROWS = list(zip(*make_columns(1000, seed=4)))
+_ids = itertools.count()
+
+
+def _application(quote=None) -> dict:
+    quote = quote or build_quote("Двигатель", 1.6, 4.0, 4, pricing.current_config())
+    return {
+        "lead_id": f"L-BENCH-{next(_ids):08d}",
+        "timestamp": datetime(2026, 1, 15, 12, 30).isoformat(),
+        "client_name": "Иван Петров",
+        "client_contact": "+7 900 123-45-67",
+        "aggregate": "Двигатель",
+        "engine_volume": 1.6,
+        "oil_volume": 4.0,
+        "overheat": "Был кратковременный",
+        "no_oil": None,
+        "repair": "Нет",
+        "oil_consumption": "0.5–1 л / 1000 км",
+        "smoke": "Нет",
+        "symptoms": None,
+        "rvs_ml": quote.rvs_ml,
+        "accel_ml": quote.accel_ml,
+        "material_cost": quote.material_cost,
+        "material_price_client": quote.material_price_client,
+        "work_cost": quote.work_cost,
+        "total_price_client": quote.total_price_client,
+        "profit": quote.profit,
+        "pricing_version": quote.pricing_version,
+        "vehicle_info": "Toyota Camry 2.4",
+        "printable_quote": quote.printable_quote,
+    }
+
+
+def _batch(size):
+    return [_application() for _ in range(size)]
+
+
+# ===== Случаи =====
+def _pricing_scalar(workdir):
+    config = pricing.current_config()
+    calculate = pricing.calculate_treatment_cost
+    return lambda: [calculate(*row, config=config) for row in _ROWS], len(_ROWS)
+
+
+def _pricing_batch(workdir):
+    aggregate, engine_volume, oil_volume, cylinders = make_columns(100_000, seed=5)
+    columns = (
+        np.asarray(aggregate),
+        np.array([np.nan if v is None else v for v in engine_volume]),
+        np.array([np.nan if v is None else v for v in oil_volume]),
+        np.array([np.nan if v is None else v for v in cylinders], dtype=np.float64),
+    )
+    return lambda: calculate_treatment_cost_batch(*columns), len(aggregate)
+
+
+def _pricing_batch_codes(workdir):
+    # Агрегаты заранее в кодах (factorize): без сравнения строк
+    aggregate, engine_volume, oil_volume, cylinders = make_columns(100_000, seed=5)
+    codes, categories = factorize(aggregate)
+    columns = (
+        np.array([np.nan if v is None else v for v in engine_volume]),
+        np.array([np.nan if v is None else v for v in oil_volume]),
+        np.array([np.nan if v is None else v for v in cylinders], dtype=np.float64),
+    )
+    return lambda: calculate_treatment_cost_batch(codes, *columns, categories=categories), len(codes)
+
+
+def _quote_build(workdir):
+    # Промах кеша: расчёт плюс тексты для клиента и карточки
+    config = pricing.current_config()
+    return lambda: [build_quote(*row, config) for row in _ROWS], len(_ROWS)
+
+
+def _admin_card(workdir):
+    quote = build_quote("Двигатель", 1.6, 4.0, 4, pricing.current_config())
+    application = _application(quote)
+    return lambda: render_admin_card(application, quote), 1
+
+
+def _persist_sqlite(workdir):
+    store = LeadStore(Path(workdir) / "leads.sqlite3")
+    return lambda: store.insert_many(_batch(100)), 100
+
+
+def _writer(workdir, **kwargs):
+    # Без fsync: меряется сборка и запись, а не диск песочницы
+    return LeadWriter(Path(workdir) / "applications", fsync_interval=-1, **kwargs)
+
+
+def _persist_json(workdir):
+    writer = _writer(workdir)
+    writer.applications_dir.mkdir()
+    return lambda: writer._export_json(_batch(100)), 100
+
+
+def _persist_csv(workdir):
+    writer = _writer(workdir)
+    writer.applications_dir.mkdir()
+    return lambda: writer._export_csv(_batch(100)), 100
+
+
+def _sheets_payload(workdir):
+    # Пачка в том виде, в каком её отправляет GoogleSheetsSink
+    applications = _batch(20)
+    return lambda: json.dumps({"leads": [lead_payload(a) for a in applications]}).encode(), 20
+
+
+# Пороги с запасом на шум общей машины; запись на диск шумит сильнее всего
+CASES = [
+    Case("pricing_scalar", _pricing_scalar, 30, 1.5),
+    Case("pricing_batch", _pricing_batch, 10, 1.5),
+    Case("pricing_batch_codes", _pricing_batch_codes, 10, 1.5),
+    Case("quote_build", _quote_build, 5, 1.5),
+    Case("admin_card", _admin_card, 10_000, 1.5),
+    Case("persist_sqlite", _persist_sqlite, 5, 2.0),
+    Case("persist_json", _persist_json, 3, 3.0),
+    Case("persist_csv", _persist_csv, 10, 2.0),
+    Case("sheets_payload", _sheets_payload, 1000, 1.5),
+]
+
+
+def _calibration_ns() -> float:
+    seconds = min(timeit.repeat(lambda: sum(i * i for i in range(10_000)), number=50, repeat=REPEAT))
+    return seconds / 50 / 10_000 * 1e9
+
+
+def measure(case: Case) -> float:
+    """Нс на единицу работы (строку, заявку, карточку) — лучший из повторов."""
+    with tempfile.TemporaryDirectory() as workdir:
+        run, units = case.setup(workdir)
+        run()  # прогрев: импорты, кеши, создание файлов и таблиц
+        seconds = min(timeit.repeat(run, number=case.number, repeat=REPEAT))
+    return seconds / case.number / units * 1e9
+
+
+def _load_baselines() -> dict:
+    if not BASELINES_PATH.exists():
+        return {"calibration_ns": None, "cases": {}}
+    with open(BASELINES_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_baselines(calibration, results):
+    data = {"calibration_ns": round(calibration, 3), "cases": {k: round(v, 1) for k, v in results.items()}}
+    with open(BASELINES_PATH, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def main():
+    args = sys.argv[1:]
+    update = "--update" in args
+    selected = [a for a in args if not a.startswith("--")]
+    unknown = set(selected) - {case.name for case in CASES}
+    if unknown:
+        raise SystemExit(f"Неизвестные случаи: {', '.join(sorted(unknown))}")
+    cases = [case for case in CASES if not selected or case.name in selected]
+
+    baselines = _load_baselines()
+    calibration = _calibration_ns()
+    # Поправка на машину: во сколько раз калибровка медленнее записанной
+    scale = calibration / baselines["calibration_ns"] if baselines.get("calibration_ns") else 1.0
+
+    print(f"калибровка: {calibration:.2f} нс (×{scale:.2f} к базовой)")
+    print(f"{'случай':>19} {'нс/ед.':>10} {'базовое':>10} {'×':>6} {'порог':>6}")
+    results, regressions = {}, []
+    for case in cases:
+        ns = results[case.name] = measure(case)
+        base = baselines["cases"].get(case.name)
+        if base is None:
+            print(f"{case.name:>19} {ns:10.1f} {'—':>10} {'':>6} {case.threshold:6.2f}")
+            continue
+        ratio = ns / (base * scale)
+        if ratio > case.threshold:
+            # Одиночный всплеск чужой нагрузки не считается замедлением
+            ns = results[case.name] = min(ns, measure(case))
+            ratio = ns / (base * scale)
+        mark = "  ← медленнее порога" if ratio > case.threshold else ""
+        print(f"{case.name:>19} {ns:10.1f} {base:10.1f} {ratio:6.2f} {case.threshold:6.2f}{mark}")
+        if ratio > case.threshold:
+            regressions.append((case, base, ns, ratio))
+
+    if update:
+        merged = dict(baselines["cases"], **results) if selected else results
+        _save_baselines(calibration, merged)
+        print(f"базовые значения записаны в {BASELINES_PATH}")
+        return
+
+    if regressions:
+        print(f"\n--- {BASELINES_PATH.name} (калибровка {baselines['calibration_ns']} нс)")
+        print(f"+++ текущий прогон (калибровка {calibration:.3f} нс)")
+        for case, base, ns, ratio in regressions:
+            print(f"- {case.name}: {base:.1f} нс")
+            print(f"+ {case.name}: {ns:.1f} нс (×{ratio:.2f} с поправкой, порог ×{case.threshold:.2f})")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
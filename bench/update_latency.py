@@ -0,0 +1,144 @@
+# Задержка «обновление → ответ» в режимах polling и webhook без сети:
+# bot.py запускается отдельным процессом против заглушки Bot API
+# (bench/fake_bot_api.py), которая подаёт синтетические /start и
+# засекает приход sendMessage. Пауза ответа (REPLY_DELAY_SECONDS)
+# выключена — меряется только доставка и обработка.
+# Заодно проверяется, что webhook отклоняет чужой секрет (403) и что
+# процесс корректно завершается по SIGINT.
+#
+#   python -m bench.update_latency [число_обновлений]
+
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench.fake_bot_api import FakeBotApi, post_update, text_update
+
+BOT_PATH = Path(__file__).resolve().parent.parent / "bot.py"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_listening(port: int, timeout: float = 30.0):
+    # setWebhook приходит раньше, чем бот начинает слушать порт
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def _start_bot(api: FakeBotApi, mode: str, workdir: str, port: int, **extra_env):
+    env = dict(
+        os.environ,
+        BOT_TOKEN="123:bench",
+        BOT_MODE=mode,
+        TELEGRAM_API_BASE_URL=api.base_url,
+        REPLY_DELAY_SECONDS="0",
+        ADMIN_CHAT_ID="0",
+        GOOGLE_SHEETS_WEBHOOK_URL="",
+        WEBHOOK_LISTEN="127.0.0.1",
+        WEBHOOK_PORT=str(port),
+        WEBHOOK_URL=f"http://127.0.0.1:{port}",
+        WEBHOOK_SECRET_TOKEN="",
+    )
+    env.update(extra_env)
+    # Лог — в файл: непрочитанный PIPE заполнится и остановит бота
+    with open(Path(workdir) / "bot.log", "w") as log:
+        return subprocess.Popen(
+            [sys.executable, str(BOT_PATH)],
+            cwd=workdir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=log,
+        )
+
+
+def _log_tail(workdir: str) -> str:
+    return (Path(workdir) / "bot.log").read_text(errors="replace")[-2000:]
+
+
+def _stop_bot(process, workdir: str) -> float:
+    started = time.perf_counter()
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        raise RuntimeError("бот не остановился за 30 с")
+    if process.returncode != 0:
+        raise RuntimeError(f"бот завершился с кодом {process.returncode}:\n{_log_tail(workdir)}")
+    return time.perf_counter() - started
+
+
+def measure(api: FakeBotApi, mode: str, count: int):
+    api.reset()
+    port = _free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        process = _start_bot(api, mode, workdir, port)
+        try:
+            if not api.wait_ready():
+                raise RuntimeError(f"бот не начал принимать обновления ({mode})")
+
+            if mode == "webhook":
+                _wait_listening(port)
+                url = api.webhook[0]
+                forged = post_update(url, text_update(1, 1, "/start"), "wrong-secret")
+                assert forged == 403, f"чужой секрет принят: HTTP {forged}"
+                missing = post_update(url, text_update(2, 1, "/start"))
+                assert missing == 403, f"запрос без секрета принят: HTTP {missing}"
+
+            latencies = []
+            for i in range(count):
+                chat_id = 1000 + i
+                sent = time.perf_counter()
+                api.push(text_update(10 + i, chat_id, "/start"))
+                replies = api.wait_replies(chat_id)
+                if replies is None:
+                    raise RuntimeError(f"нет ответа на обновление {i} ({mode})")
+                latencies.append(replies[0][0] - sent)
+
+            if mode == "webhook":
+                assert set(api.webhook_statuses) == {200}, api.webhook_statuses
+        finally:
+            if process.poll() is None:
+                shutdown = _stop_bot(process, workdir)
+            else:
+                raise RuntimeError(f"бот упал ({mode}):\n{_log_tail(workdir)}")
+    return latencies, shutdown
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    api = FakeBotApi()
+    api.start()
+    try:
+        for mode in ("polling", "webhook"):
+            latencies, shutdown = measure(api, mode, count)
+            latencies.sort()
+            p50 = statistics.median(latencies) * 1000
+            p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+            print(
+                f"{mode:>8}: p50 {p50:6.2f} мс, p95 {p95:6.2f} мс, "
+                f"остановка {shutdown:.2f} с ({count} обновлений)"
+            )
+    finally:
+        api.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# Параллельная обработка обновлений: последовательная (как было),
+# SimpleUpdateProcessor из PTB (параллельно, но без порядка в чате) и
+# ChatOrderedUpdateProcessor. Обработчик имитирует запрос к Bot API
+# (await DELAY ± 50%) и записывает порядок сообщений каждого чата.
+# Второй замер — «шумный» клиент шлёт пачку сообщений, остальные
+# по одному: сколько ждут остальные.
+#
+#   python -m bench.update_order [число_чатов] [сообщений_на_чат]
+
+import asyncio
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+from telegram.ext import SimpleUpdateProcessor
+
+from chat_order import ChatOrderedUpdateProcessor
+
+DELAY = 0.005
+LIMIT = 64
+
+
+_jitter = random.Random(0)
+
+
+def _update(chat_id, seq):
+    return SimpleNamespace(
+        effective_chat=SimpleNamespace(id=chat_id),
+        effective_user=None,
+        seq=seq,
+        delay=DELAY * _jitter.uniform(0.5, 1.5),
+    )
+
+
+async def _feed(processor, updates, seen, finished):
+    async def handle(update):
+        await asyncio.sleep(update.delay)
+        seen.setdefault(update.effective_chat.id, []).append(update.seq)
+        finished[update.effective_chat.id] = time.perf_counter()
+
+    await processor.initialize()
+    # Как Application: задача на каждое обновление в порядке получения
+    # (при лимите 1 PTB ждёт каждое обновление сам)
+    if processor.max_concurrent_updates > 1:
+        tasks = [asyncio.create_task(processor.process_update(u, handle(u))) for u in updates]
+        await asyncio.gather(*tasks)
+    else:
+        for update in updates:
+            await processor.process_update(update, handle(update))
+    await processor.shutdown()
+
+
+def run(processor, updates):
+    seen, finished = {}, {}
+    started = time.perf_counter()
+    asyncio.run(_feed(processor, updates, seen, finished))
+    elapsed = time.perf_counter() - started
+    out_of_order = sum(1 for seqs in seen.values() if seqs != sorted(seqs))
+    return elapsed, out_of_order, {chat: at - started for chat, at in finished.items()}
+
+
+def main():
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    per_chat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    # Сообщения чатов перемешаны, как в реальном потоке
+    updates = [_update(chat, seq) for seq in range(per_chat) for chat in range(chats)]
+    processors = {
+        "последовательно": lambda: SimpleUpdateProcessor(1),
+        "PTB параллельно": lambda: SimpleUpdateProcessor(LIMIT),
+        "по чатам": lambda: ChatOrderedUpdateProcessor(LIMIT),
+    }
+
+    print(f"{chats} чатов × {per_chat} сообщений, обработчик ~{DELAY * 1000:.0f} мс:")
+    for name, make in processors.items():
+        elapsed, out_of_order, _ = run(make(), updates)
+        print(f"{name:>16}: {elapsed:6.2f} с, чатов с нарушенным порядком: {out_of_order}")
+
+    # Шумный чат 0 прислал 500 сообщений раньше остальных
+    burst = [_update(0, seq) for seq in range(500)] + [_update(chat, 0) for chat in range(1, chats)]
+    print(f"\nЧат 0 прислал 500 сообщений, затем {chats - 1} чатов по одному:")
+    for name, make in processors.items():
+        _, out_of_order, finished = run(make(), burst)
+        others = sorted(at for chat, at in finished.items() if chat)
+        print(
+            f"{name:>16}: остальные получили ответ через {others[len(others) // 2] * 1000:7.1f} мс "
+            f"(медиана), порядок нарушен в {out_of_order} чатах"
+        )
+
+
+if __name__ == "__main__":
+    main()
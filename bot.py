@@ -1,46 +1,83 @@
 import asyncio
-import csv
+import contextvars
 import logging
 import os
-import json
 import re
+import secrets
+import time
 from datetime import datetime
-from pathlib import Path
 
-import requests
 from dotenv import load_dotenv
-from telegram import (
-    Update,
-    ReplyKeyboardMarkup,
-    ReplyKeyboardRemove,
-    InlineKeyboardButton,
-    InlineKeyboardMarkup,
-)
+from telegram import Update
+from telegram.constants import MessageLimit
 from telegram.ext import (
     ApplicationBuilder,
+    ApplicationHandlerStop,
     CommandHandler,
     MessageHandler,
     ConversationHandler,
     CallbackQueryHandler,
     ContextTypes,
+    TypeHandler,
     filters,
 )
 
-from pricing import calculate_treatment_cost  # расчёт материалов и цены
+import funnel
+import keyboards
+import metrics
+import tracing
+from admin_outbox import AdminNotifier
+from bot_api import PooledRequest
+from chat_order import ChatOrderedUpdateProcessor
+from funnel import FunnelLog
+from profiling import (
+    LoopLagMonitor,
+    MemoryTracer,
+    deep_sizeof,
+    format_size,
+    rss_bytes,
+    sample_stacks,
+)
+from lead_ids import new_lead_id
+from lead_store import normalize_phone
+from lead_writer import LeadWriter
+from questionnaire import InvalidAnswer, Step, is_phone, load_questionnaire
+from quotes import QuoteCache, render_admin_card  # расчёт материалов и цены
+from reply_scheduler import ReplyScheduler
+from session import Session, SessionSweeper
+from sharding import ShardSupervisor
+from sheets_sink import GoogleSheetsSink, lead_payload
+from state_store import SqlitePersistence
+from tracing import tracer
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 
-REPLY_DELAY_SECONDS = 3
 GOOGLE_SHEETS_WEBHOOK_URL = os.getenv(
     "GOOGLE_SHEETS_WEBHOOK_URL",
     "https://script.google.com/macros/s/AKfycbxkxg3rqI9zoOMhrT60nUrXOfApVD4FpLiPFJiEPw_EWDOWfmo-cghMtgEFEEkujBl8Dg/exec",
 ).strip()
 
 
-async def _sleep_before_reply():
-    await asyncio.sleep(REPLY_DELAY_SECONDS)
+# Сессия, чьё обновление сейчас обрабатывается (своя у каждой задачи PTB):
+# по ней _reply отмечает в трассе отправку ответа
+_current_session = contextvars.ContextVar("current_session", default=None)
+
+
+def _reply(update: Update, text: str, **kwargs):
+    # Ответ уходит через REPLY_DELAY_SECONDS, хендлер не ждёт
+    session = _current_session.get()
+    on_sent = _reply_sent(session) if session is not None else None
+    reply_scheduler.reply(update.message, text, on_sent=on_sent, **kwargs)
+
+
+def _reply_sent(session):
+    def on_sent(queued_ns, sent_ns):
+        session.replied_at = sent_ns
+        tracer.span(session.get("lead_id"), "reply", queued_ns, sent_ns, {"delay_s": REPLY_DELAY_SECONDS})
+
+    return on_sent
 
 
 def _normalize_google_script_url(url: str) -> str:
@@ -63,23 +100,6 @@ def _normalize_google_script_url(url: str) -> str:
     return url
 
 
-async def _post_to_google_sheets(payload: dict):
-    url = _normalize_google_script_url(GOOGLE_SHEETS_WEBHOOK_URL)
-    if not url:
-        return
-
-    def _do_post():
-        return requests.post(url, json=payload, timeout=10)
-
-    resp = await asyncio.to_thread(_do_post)
-    if not resp.ok:
-        logging.error(
-            "Google Sheets webhook returned %s: %s",
-            resp.status_code,
-            (resp.text or "")[:500],
-        )
-
-
 async def call_client_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     if query is None:
@@ -113,885 +133,439 @@ def _clean_int(env_value: str, default: str) -> int:
         env_value = env_value.split("=", 1)[1]
     return int(env_value)
 
+
+def _clean_float(env_value: str, default: str) -> float:
+    if not env_value:
+        env_value = default
+    if "=" in env_value:
+        env_value = env_value.split("=", 1)[1]
+    return float(env_value)
+
+
+def _clean_str(env_value: str) -> str:
+    if not env_value:
+        return ""
+    if "=" in env_value:
+        env_value = env_value.split("=", 1)[1]
+    return env_value.strip()
+
 # Читаем настройки из .env / переменных окружения
 ADMIN_CHAT_ID = _clean_int(os.getenv("ADMIN_CHAT_ID"), "0")
 
+# Карточки администратору: не больше ADMIN_RATE_PER_MINUTE сообщений в минуту
+# (пачкой до ADMIN_BURST); при очереди больше ADMIN_DIGEST_THRESHOLD карточек
+# они уходят одной сводкой (0 — без сводок)
+ADMIN_RATE_PER_MINUTE = _clean_float(os.getenv("ADMIN_RATE_PER_MINUTE"), "20")
+ADMIN_BURST = _clean_int(os.getenv("ADMIN_BURST"), "3")
+ADMIN_DIGEST_THRESHOLD = _clean_int(os.getenv("ADMIN_DIGEST_THRESHOLD"), "0")
+
+admin_notifier = AdminNotifier(
+    rate_per_minute=ADMIN_RATE_PER_MINUTE,
+    burst=ADMIN_BURST,
+    digest_threshold=ADMIN_DIGEST_THRESHOLD,
+)
+
+# Пауза перед ответом клиенту («печатает…»), секунды
+REPLY_DELAY_SECONDS = _clean_float(os.getenv("REPLY_DELAY_SECONDS"), "3")
+
+reply_scheduler = ReplyScheduler(REPLY_DELAY_SECONDS)
+
 # Показывать ли цены клиенту в ответе бота
 SHOW_PRICE_TO_CLIENT = os.getenv("SHOW_PRICE_TO_CLIENT", "false").lower() == "true"
 
+# Пачки для Google Sheets: не больше N лидов и не дольше T секунд ожидания.
+# 1 — по одному лиду в прежнем формате; больше — только с обновлённым скриптом
+GOOGLE_SHEETS_BATCH_SIZE = _clean_int(os.getenv("GOOGLE_SHEETS_BATCH_SIZE"), "1")
+GOOGLE_SHEETS_BATCH_INTERVAL = _clean_float(os.getenv("GOOGLE_SHEETS_BATCH_INTERVAL"), "2")
+# Сколько лидов (или пачек) отправлять в Google Sheets одновременно
+GOOGLE_SHEETS_MAX_CONNECTIONS = _clean_int(os.getenv("GOOGLE_SHEETS_MAX_CONNECTIONS"), "16")
+
+# Запись заявок: размер очереди и как часто делать fsync (секунды)
+LEADS_QUEUE_SIZE = _clean_int(os.getenv("LEADS_QUEUE_SIZE"), "1000")
+LEADS_FSYNC_INTERVAL = _clean_float(os.getenv("LEADS_FSYNC_INTERVAL"), "1")
+
+# Основное хранилище — applications/leads.sqlite3, JSON и CSV — выгрузки
+LEADS_EXPORT_JSON = os.getenv("LEADS_EXPORT_JSON", "true").lower() == "true"
+LEADS_EXPORT_CSV = os.getenv("LEADS_EXPORT_CSV", "true").lower() == "true"
+
+lead_writer = LeadWriter(
+    max_queue=LEADS_QUEUE_SIZE,
+    fsync_interval=LEADS_FSYNC_INTERVAL,
+    export_json=LEADS_EXPORT_JSON,
+    export_csv=LEADS_EXPORT_CSV,
+)
 
-# ===== Состояния диалога =====
-(
-    AGGREGATE,
-    OVERHEAT,
-    REPAIR,
-    OIL_CONSUMPTION,
-    SMOKE,
-    ENGINE_VOLUME,
-    CYLINDERS,
-    OIL_VOLUME,
-    VEHICLE_INFO,
-    CLIENT_NAME,
-    CLIENT_CONTACT,
-    RESTART,
-) = range(12)
-
+# Кеш готовых расчётов: сколько разных наборов параметров держать в памяти
+QUOTE_CACHE_SIZE = _clean_int(os.getenv("QUOTE_CACHE_SIZE"), "1024")
 
-# ===== /start =====
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    logging.info(">>> Вызван /start от пользователя %s", update.effective_user.id)
-    context.user_data.clear()
-    await _sleep_before_reply()
-
-    keyboard = [
-        ["Двигатель"],
-        ["МКПП"],
-        ["АКПП"],
-        ["Редуктор (мост)"],
-        ["ГУР"],
-    ]
+quote_cache = QuoteCache(QUOTE_CACHE_SIZE)
 
-    await update.message.reply_text(
-        "Здравствуйте!\n"
-        "Я виртуальный помощник Петя по авто-продукции NANOREM.\n"
-        "Сначала выберите агрегат, для которого хотите рассмотреть обработку NANOREM.\n\n"
-        "Выберите агрегат:",
-        reply_markup=ReplyKeyboardMarkup(
-            keyboard,
-            resize_keyboard=True,
-            one_time_keyboard=True,
-        ),
-    )
+sheets_sink = GoogleSheetsSink(
+    _normalize_google_script_url(GOOGLE_SHEETS_WEBHOOK_URL),
+    batch_size=GOOGLE_SHEETS_BATCH_SIZE,
+    batch_interval=GOOGLE_SHEETS_BATCH_INTERVAL,
+    max_connections=GOOGLE_SHEETS_MAX_CONNECTIONS,
+)
 
-    return AGGREGATE
+# Состояние анкет (applications/state.sqlite3): как часто сохранять (секунды)
+# и через сколько дней забывать брошенные анкеты
+STATE_FLUSH_INTERVAL = _clean_float(os.getenv("STATE_FLUSH_INTERVAL"), "5")
+STATE_CONVERSATION_TTL_DAYS = _clean_float(os.getenv("STATE_CONVERSATION_TTL_DAYS"), "7")
 
+# Сессии без сообщений дольше SESSION_TTL_HOURS удаляются (0 — не удалять);
+# проверка раз в SESSION_SWEEP_INTERVAL секунд
+SESSION_TTL_HOURS = _clean_float(os.getenv("SESSION_TTL_HOURS"), "24")
+SESSION_SWEEP_INTERVAL = _clean_float(os.getenv("SESSION_SWEEP_INTERVAL"), "300")
 
-# ===== /clean =====
-async def clean(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    context.user_data.clear()
-    await _sleep_before_reply()
-    await update.message.reply_text(
-        "Данные очищены. Начнём заново.\n\nВведите /start",
-        reply_markup=ReplyKeyboardRemove(),
-    )
+session_sweeper = SessionSweeper(SESSION_TTL_HOURS * 3600, SESSION_SWEEP_INTERVAL)
 
+# Метрики Prometheus (metrics.py): GET http://METRICS_LISTEN:METRICS_PORT/metrics,
+# 0 — без сервера. При BOT_WORKERS > 1 обработчики слушают METRICS_PORT+1, +2, …
+METRICS_LISTEN = _clean_str(os.getenv("METRICS_LISTEN")) or "127.0.0.1"
+METRICS_PORT = _clean_int(os.getenv("METRICS_PORT"), "0")
 
-# ===== Выбор агрегата =====
-async def aggregate_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    choice = update.message.text
-    context.user_data["aggregate"] = choice
-    await _sleep_before_reply()
+metrics_server = metrics.MetricsServer(METRICS_LISTEN, METRICS_PORT)
 
-    engine_keyboard = [
-        ["Нет"],
-        ["Был кратковременный"],
-        ["Да, серьёзно"],
-        ["Не знаю"],
-    ]
-    other_keyboard = [
-        ["Нет"],
-        ["Кратковременно"],
-        ["Да, долго"],
-        ["Не знаю"],
-    ]
-    aggregate_keyboard = [
-        ["Двигатель"],
-        ["МКПП"],
-        ["АКПП"],
-        ["Редуктор (мост)"],
-        ["ГУР"],
-    ]
+HANDLER_SECONDS = metrics.histogram(
+    "bot_handler_seconds", "Время обработчика по шагу анкеты или команде", ("handler",)
+)
+PRICING_SECONDS = metrics.histogram(
+    "bot_pricing_seconds",
+    "Время расчёта стоимости (hit — из кеша расчётов)",
+    ("cache",),
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01),
+)
+PRICING_ERRORS = metrics.counter("bot_pricing_errors_total", "Ошибки расчёта стоимости")
+_PRICING_HIT = PRICING_SECONDS.labels("hit")
+_PRICING_MISS = PRICING_SECONDS.labels("miss")
 
-    if choice == "Двигатель":
-        await update.message.reply_text(
-            "Задам несколько вопросов, чтобы понять, подходит ли обработка двигателя NANOREM.\n\n"
-            "Перегревался ли двигатель?",
-            reply_markup=ReplyKeyboardMarkup(
-                engine_keyboard,
-                resize_keyboard=True,
-                one_time_keyboard=True,
-            ),
-        )
-        return OVERHEAT
-
-    if choice in ["МКПП", "АКПП", "Редуктор (мост)", "ГУР"]:
-        await update.message.reply_text(
-            "Задам несколько вопросов, чтобы понять, подходит ли обработка NANOREM "
-            "для выбранного агрегата.\n\n"
-            "Ездили ли вы без масла или с очень низким уровнем масла в этом агрегате?",
-            reply_markup=ReplyKeyboardMarkup(
-                other_keyboard,
-                resize_keyboard=True,
-                one_time_keyboard=True,
-            ),
-        )
-        return OVERHEAT
-
-    # Некорректный выбор агрегата
-    await update.message.reply_text(
-        "Пожалуйста, выберите один из вариантов на клавиатуре.",
-        reply_markup=ReplyKeyboardMarkup(
-            aggregate_keyboard,
-            resize_keyboard=True,
-            one_time_keyboard=True,
-        ),
-    )
-    return AGGREGATE
 
+# Трассировка анкеты (tracing.py): спаны в формате OTLP/JSON строками в
+# TRACING_FILE и/или POST в коллектор TRACING_ENDPOINT (…:4318/v1/traces)
+TRACING_FILE = _clean_str(os.getenv("TRACING_FILE"))
+TRACING_ENDPOINT = _clean_str(os.getenv("TRACING_ENDPOINT"))
 
-# ===== Перегрев / езда без масла =====
-async def overheat(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    aggregate = context.user_data.get("aggregate", "Двигатель")
-    answer = update.message.text
-    await _sleep_before_reply()
-
-    if aggregate == "Двигатель":
-        valid_options_engine = ["Нет", "Был кратковременный", "Да, серьёзно", "Не знаю"]
-        engine_keyboard = [
-            ["Нет"],
-            ["Был кратковременный"],
-            ["Да, серьёзно"],
-            ["Не знаю"],
-        ]
-
-        if answer not in valid_options_engine:
-            await update.message.reply_text(
-                "Пожалуйста, выберите один из вариантов на клавиатуре.",
-                reply_markup=ReplyKeyboardMarkup(
-                    engine_keyboard,
-                    resize_keyboard=True,
-                    one_time_keyboard=True,
-                ),
-            )
-            return OVERHEAT
-
-        context.user_data["overheat"] = answer
-
-        if answer == "Нет":
-            # Сразу переходим к расходу масла
-            oil_keyboard = [
-                ["До 0.5 л / 1000 км"],
-                ["0.5–1 л / 1000 км"],
-                ["Более 1 л / 1000 км"],
-            ]
-            await update.message.reply_text(
-                "Какой расход масла?",
-                reply_markup=ReplyKeyboardMarkup(
-                    oil_keyboard,
-                    resize_keyboard=True,
-                    one_time_keyboard=True,
-                ),
-            )
-            return OIL_CONSUMPTION
-
-        # Если перегрев был — спрашиваем про ремонт
-        repair_keyboard = [
-            ["Нет"],
-            ["Частичный ремонт"],
-            ["Капитальный ремонт"],
-            ["Не знаю"],
-        ]
-        await update.message.reply_text(
-            "После перегрева двигатель ремонтировался?",
-            reply_markup=ReplyKeyboardMarkup(
-                repair_keyboard,
-                resize_keyboard=True,
-                one_time_keyboard=True,
-            ),
-        )
-        return REPAIR
-
-    # Для остальных агрегатов — вопрос про езду без масла
-    valid_options_no_oil = ["Нет", "Кратковременно", "Да, долго", "Не знаю"]
-    other_keyboard = [
-        ["Нет"],
-        ["Кратковременно"],
-        ["Да, долго"],
-        ["Не знаю"],
-    ]
+tracing.configure(TRACING_FILE, TRACING_ENDPOINT)
 
-    if answer not in valid_options_no_oil:
-        await update.message.reply_text(
-            "Пожалуйста, выберите один из вариантов на клавиатуре.",
-            reply_markup=ReplyKeyboardMarkup(
-                other_keyboard,
-                resize_keyboard=True,
-                one_time_keyboard=True,
-            ),
-        )
-        return OVERHEAT
+# Сторож цикла событий (profiling.py): зависание дольше LOOP_LAG_THRESHOLD_MS
+# пишется в лог со стеком виновника (0 — выключено)
+LOOP_LAG_THRESHOLD_MS = _clean_float(os.getenv("LOOP_LAG_THRESHOLD_MS"), "100")
 
-    context.user_data["no_oil"] = answer
+loop_monitor = LoopLagMonitor(LOOP_LAG_THRESHOLD_MS / 1000)
 
-    symptoms_keyboard = [
-        ["Нет"],
-        ["Незначительные"],
-        ["Сильные"],
-        ["Не знаю"],
-    ]
-    await update.message.reply_text(
-        "Есть ли посторонние шумы, вибрации или рывки в работе этого агрегата?",
-        reply_markup=ReplyKeyboardMarkup(
-            symptoms_keyboard,
-            resize_keyboard=True,
-            one_time_keyboard=True,
-        ),
-    )
-    return REPAIR
+# /profile у администратора: сколько секунд снимать стеки по умолчанию и максимум
+PROFILE_DEFAULT_SECONDS = 10
+PROFILE_MAX_SECONDS = 120
 
+# /memory: tracemalloc включается первым вызовом команды; с MEMORY_TRACE_FRAMES > 0 —
+# сразу при запуске и с этим числом кадров стека на каждое выделение
+MEMORY_TRACE_FRAMES = _clean_int(os.getenv("MEMORY_TRACE_FRAMES"), "0")
 
-# ===== Ремонт / симптомы =====
-async def repair(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    aggregate = context.user_data.get("aggregate", "Двигатель")
-    answer = update.message.text
-    await _sleep_before_reply()
-
-    if aggregate == "Двигатель":
-        valid_options_engine = ["Нет", "Частичный ремонт", "Капитальный ремонт", "Не знаю"]
-        repair_keyboard = [
-            ["Нет"],
-            ["Частичный ремонт"],
-            ["Капитальный ремонт"],
-            ["Не знаю"],
-        ]
-
-        if answer not in valid_options_engine:
-            await update.message.reply_text(
-                "Пожалуйста, выберите один из вариантов на клавиатуре.",
-                reply_markup=ReplyKeyboardMarkup(
-                    repair_keyboard,
-                    resize_keyboard=True,
-                    one_time_keyboard=True,
-                ),
-            )
-            return REPAIR
-
-        context.user_data["repair"] = answer
-
-        oil_keyboard = [
-            ["До 0.5 л / 1000 км"],
-            ["0.5–1 л / 1000 км"],
-            ["Более 1 л / 1000 км"],
-        ]
-        await update.message.reply_text(
-            "Какой расход масла?",
-            reply_markup=ReplyKeyboardMarkup(
-                oil_keyboard,
-                resize_keyboard=True,
-                one_time_keyboard=True,
-            ),
-        )
-        return OIL_CONSUMPTION
-
-    # Остальные агрегаты: симптомы
-    valid_options_symptoms = ["Нет", "Незначительные", "Сильные", "Не знаю"]
-    symptoms_keyboard = [
-        ["Нет"],
-        ["Незначительные"],
-        ["Сильные"],
-        ["Не знаю"],
-    ]
+memory_tracer = MemoryTracer(MEMORY_TRACE_FRAMES)
 
-    if answer not in valid_options_symptoms:
-        await update.message.reply_text(
-            "Пожалуйста, выберите один из вариантов на клавиатуре.",
-            reply_markup=ReplyKeyboardMarkup(
-                symptoms_keyboard,
-                resize_keyboard=True,
-                one_time_keyboard=True,
-            ),
-        )
-        return REPAIR
+# Воронка анкеты (funnel.py): события переходов в applications/funnel/,
+# счётчики сохраняются раз в FUNNEL_CHECKPOINT_INTERVAL секунд
+FUNNEL_LOG = os.getenv("FUNNEL_LOG", "true").lower() == "true"
+FUNNEL_CHECKPOINT_INTERVAL = _clean_float(os.getenv("FUNNEL_CHECKPOINT_INTERVAL"), "30")
 
-    context.user_data["symptoms"] = answer
+funnel_log = FunnelLog(checkpoint_interval=FUNNEL_CHECKPOINT_INTERVAL, enabled=FUNNEL_LOG)
 
-    await update.message.reply_text(
-        "Укажите объём масла в агрегате (например: 4)",
-        reply_markup=ReplyKeyboardRemove(),
-    )
-    return OIL_VOLUME
 
+def _trace_begin(context: ContextTypes.DEFAULT_TYPE, name: str, wait_user: bool = True):
+    """Спан ожидания клиента (от нашего ответа до его сообщения); время начала обработчика."""
+    session = context.user_data
+    if not tracer.enabled or session is None:
+        return None
+    started_ns = time.time_ns()
+    replied_at = session.get("replied_at")
+    if wait_user and replied_at:
+        tracer.span(session.get("lead_id"), "wait_user", replied_at, started_ns, {"step": name})
+    _current_session.set(session)
+    return started_ns
 
-# ===== Расход масла =====
-async def oil_consumption(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    answer = update.message.text
-    await _sleep_before_reply()
-    valid_options = [
-        "До 0.5 л / 1000 км",
-        "0.5–1 л / 1000 км",
-        "Более 1 л / 1000 км",
-    ]
-    oil_keyboard = [
-        ["До 0.5 л / 1000 км"],
-        ["0.5–1 л / 1000 км"],
-        ["Более 1 л / 1000 км"],
-    ]
 
-    if answer not in valid_options:
-        await update.message.reply_text(
-            "Пожалуйста, выберите один из вариантов на клавиатуре.",
-            reply_markup=ReplyKeyboardMarkup(
-                oil_keyboard,
-                resize_keyboard=True,
-                one_time_keyboard=True,
-            ),
-        )
-        return OIL_CONSUMPTION
+def _trace_end(context: ContextTypes.DEFAULT_TYPE, name: str, started_ns):
+    if started_ns is not None:
+        tracer.span(context.user_data.get("lead_id"), f"handle {name}", started_ns, time.time_ns())
 
-    context.user_data["oil_consumption"] = answer
 
-    smoke_keyboard = [
-        ["Нет"],
-        ["Синий"],
-        ["Белый"],
-        ["Чёрный"],
-    ]
-    await update.message.reply_text(
-        "Есть ли дым из выхлопной трубы?",
-        reply_markup=ReplyKeyboardMarkup(
-            smoke_keyboard,
-            resize_keyboard=True,
-            one_time_keyboard=True,
-        ),
-    )
-    return SMOKE
-
-
-# ===== Дым =====
-async def smoke(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    answer = update.message.text
-    await _sleep_before_reply()
-    valid_options = ["Нет", "Синий", "Белый", "Чёрный"]
-    smoke_keyboard = [
-        ["Нет"],
-        ["Синий"],
-        ["Белый"],
-        ["Чёрный"],
-    ]
+def _timed(name: str, handler, wait_user: bool = True):
+    timer = HANDLER_SECONDS.labels(name)
 
-    if answer not in valid_options:
-        await update.message.reply_text(
-            "Пожалуйста, выберите один из вариантов на клавиатуре.",
-            reply_markup=ReplyKeyboardMarkup(
-                smoke_keyboard,
-                resize_keyboard=True,
-                one_time_keyboard=True,
-            ),
-        )
-        return SMOKE
+    async def timed(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        started = time.perf_counter()
+        started_ns = _trace_begin(context, name, wait_user)
+        try:
+            return await handler(update, context)
+        finally:
+            timer.observe(time.perf_counter() - started)
+            _trace_end(context, name, started_ns)
 
-    context.user_data["smoke"] = answer
+    return timed
 
-    await update.message.reply_text(
-        "Укажите объём двигателя в литрах (например: 1.6)",
-        reply_markup=ReplyKeyboardRemove(),
-    )
-    return ENGINE_VOLUME
 
+# ===== Состояния диалога =====
+# Вопросы анкеты обслуживает один обработчик (answer): текущий шаг хранится
+# в сессии, сами шаги и переходы — в questionnaire.json
+QUESTION = "question"
+RESTART = "restart"
 
-# ===== Объём двигателя =====
-async def engine_volume(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text.strip().replace(",", ".")
-    await _sleep_before_reply()
-    try:
-        engine_volume_value = float(text)
-        # Диапазон под себя, пример: 0.6–20.0
-        if engine_volume_value < 0.6 or engine_volume_value > 20.0:
-            raise ValueError
-    except ValueError:
-        await update.message.reply_text(
-            "Пожалуйста, введите корректный объём двигателя в литрах, например: 1.6\n"
-            "Допустимый диапазон: от 0.6 до 100.0 л."
-        )
-        return ENGINE_VOLUME
 
-    context.user_data["engine_volume"] = engine_volume_value
+def _ask(update: Update, step: Step):
+    _reply(update, step.question, reply_markup=step.markup)
 
-    aggregate = context.user_data.get("aggregate", "Двигатель")
-    if aggregate == "Двигатель":
-        await update.message.reply_text(
-            "Укажите количество цилиндров в двигателе (например: 4)"
-        )
-        return CYLINDERS
 
-    # Для других агрегатов сразу переходим к объёму масла
-    await update.message.reply_text(
-        "Укажите объём масла в агрегате (например: 4)"
-    )
-    return OIL_VOLUME
+def _enter_step(session, name: str):
+    session.step = name
+    session.step_since = time.time()
+    funnel_log.emit(funnel.ENTER, name, getattr(session, "lead_id", None))
 
 
-# ===== Количество цилиндров =====
-async def cylinders_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text.strip()
-    await _sleep_before_reply()
+def _leave_step(session, event: str):
+    """Уход с текущего шага (ответ, /cancel, /start заново) с временем на шаге."""
+    since = getattr(session, "step_since", None)
+    if since is None:
+        return
+    funnel_log.emit(event, session.step, getattr(session, "lead_id", None), time.time() - since)
+    if event != funnel.ANSWER:
+        del session.step_since
 
-    if not text.isdigit():
-        await update.message.reply_text(
-            "Пожалуйста, введите количество цилиндров цифрой, например: 4"
-        )
-        return CYLINDERS
 
-    cylinders = int(text)
+# ===== /start =====
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    logging.info(">>> Вызван /start от пользователя %s", update.effective_user.id)
+    # Анкету бросили на середине и начали заново
+    _leave_step(context.user_data, funnel.RESTART)
+    context.user_data.clear()
+    # ID заявки выдаётся в начале диалога и попадает в базу, файлы, Sheets и карточку
+    context.user_data["lead_id"] = new_lead_id()
+    _enter_step(context.user_data, QUESTIONNAIRE.first_step)
 
-    # Допустимый диапазон, подправь под себя
-    if cylinders < 2 or cylinders > 16:
-        await update.message.reply_text(
-            "Пожалуйста, введите реалистичное количество цилиндров (от 2 до 20)."
-        )
-        return CYLINDERS
+    _ask(update, QUESTIONNAIRE.steps[QUESTIONNAIRE.first_step])
+    return QUESTION
 
-    context.user_data["cylinders"] = cylinders
 
-    await update.message.reply_text(
-        "Укажите объём масла в двигателе (например: 4)"
+# ===== /clean =====
+async def clean(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    context.user_data.clear()
+    _reply(
+        update,
+        "Данные очищены. Начнём заново.\n\nВведите /start",
+        reply_markup=keyboards.REMOVE,
     )
-    return OIL_VOLUME
 
 
+# ===== Ответ на вопрос анкеты =====
+async def answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Горячий путь: поля Session читаются как атрибуты, шаг и его гистограмма —
+    # одним поиском в _STATES, следующий шаг — по ссылке из текущего
+    session = context.user_data
+    entry = _STATES.get(getattr(session, "step", None))
+    if entry is None:
+        return await _start_over(update, context)
+    step, timer = entry
 
+    started = time.perf_counter()
+    started_ns = _trace_begin(context, step.name)
+    try:
+        return await _answer_step(update, context, session, step)
+    finally:
+        timer.observe(time.perf_counter() - started)
+        if started_ns is not None:
+            _trace_end(context, step.name, started_ns)
 
-# ===== Объём масла + расчёт =====
-async def oil_volume(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text.strip().replace(",", ".")
-    await _sleep_before_reply()
-    aggregate = context.user_data.get("aggregate", "Двигатель")
 
+async def _answer_step(update: Update, context: ContextTypes.DEFAULT_TYPE, session, step: Step):
     try:
-        oil_volume_value = float(text)
+        value = step.parse(update.message.text)
+    except InvalidAnswer as e:
+        funnel_log.emit(funnel.INVALID, step.name, getattr(session, "lead_id", None))
+        _reply(update, e.message, reply_markup=e.markup)
+        return QUESTION
+
+    setattr(session, step.field, value)
+    _leave_step(session, funnel.ANSWER)
+
+    state = QUESTION
+    if step.action:
+        state = await _ACTIONS[step.action](update, context)
+
+    next_step = step.next_steps.get(value, step.default_step)
+    if next_step is None:
+        funnel_log.emit(funnel.DONE, step.name, getattr(session, "lead_id", None))
+        session.pop("step_since", None)
+        return state
+
+    _enter_step(session, next_step.name)
+    _reply(update, next_step.question, reply_markup=next_step.markup)
+    return QUESTION
+
+
+async def _start_over(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Шаг неизвестен: анкета из старой версии бота или изменённого описания
+    _reply(
+        update,
+        "Анкета изменилась, и ответы не сохранились. Давайте начнём заново: /start",
+        reply_markup=keyboards.REMOVE,
+    )
+    return ConversationHandler.END
 
-        if aggregate == "Двигатель":
-            if oil_volume_value < 2.0 or oil_volume_value > 70.0:
-                raise ValueError
-        else:
-            if oil_volume_value < 0.3 or oil_volume_value > 100.0:
-                raise ValueError
 
-    except ValueError:
-        if aggregate == "Двигатель":
-            await update.message.reply_text(
-                "Пожалуйста, введите корректный объём масла в двигателе, например: 4\n"
-                "Допустимый диапазон: от 2 до 70 л."
-            )
-        else:
-            await update.message.reply_text(
-                "Пожалуйста, введите корректный объём масла в агрегате, например: 4\n"
-                "Допустимый диапазон: от 0.3 до 100 л."
-            )
-        return OIL_VOLUME
+async def _no_questionnaire(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Текст вне анкеты: её не начинали или удалили вместе с брошенной сессией
+    _reply(
+        update,
+        "Анкета не начата или прошло много времени, и ответы не сохранились. Давайте начнём: /start",
+        reply_markup=keyboards.REMOVE,
+    )
 
-    context.user_data["oil_volume"] = oil_volume_value
 
+# ===== Расчёт после объёма масла =====
+async def calculate_quote(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    aggregate = context.user_data.get("aggregate", "Двигатель")
     engine_volume_value = context.user_data.get("engine_volume")
+    oil_volume_value = context.user_data.get("oil_volume")
     cylinders = context.user_data.get("cylinders")
 
-    logging.info(
-        "DEBUG before calc: aggregate=%s, engine_volume=%s, oil_volume=%s, cylinders=%s",
-        aggregate,
-        engine_volume_value,
-        oil_volume_value,
-        cylinders,
-    )
-
+    misses = quote_cache.misses
+    started = time.perf_counter()
     try:
-        (
-            rvs_ml,
-            accel_ml,
-            material_cost,
-            material_price_client,
-            work_cost,
-            total_price_client,
-            profit,
-        ) = calculate_treatment_cost(
-            aggregate=aggregate,
-            engine_volume=engine_volume_value,
-            oil_volume=oil_volume_value,
-            cylinders=cylinders,
+        # Готовый расчёт (цифры + тексты) из кеша; версия цен сохраняется в заявке
+        with tracer.io(context.user_data.get("lead_id"), "pricing", aggregate=aggregate):
+            quote = quote_cache.get(aggregate, engine_volume_value, oil_volume_value, cylinders)
+        (_PRICING_HIT if quote_cache.misses == misses else _PRICING_MISS).observe(
+            time.perf_counter() - started
         )
+        context.user_data["quote"] = quote
 
-        context.user_data["rvs_ml"] = rvs_ml
-        context.user_data["accel_ml"] = accel_ml
-        context.user_data["material_cost"] = material_cost
-        context.user_data["material_price_client"] = material_price_client
-        context.user_data["work_cost"] = work_cost
-        context.user_data["total_price_client"] = total_price_client
-        context.user_data["profit"] = profit
-
-        logging.info(
-            "Расчёт обработки %s: объем двигателя=%s, масло=%s, цилиндров=%s, РВС=%.1f, ускоритель=%.1f, себестоимость=%.2f, цена=%.2f, прибыль=%.2f",
+        logging.debug(
+            "Расчёт обработки %s (цены v%s): объем двигателя=%s, масло=%s, цилиндров=%s, цена=%.2f",
             aggregate,
+            quote.pricing_version,
             engine_volume_value,
             oil_volume_value,
             cylinders,
-            rvs_ml,
-            accel_ml,
-            material_cost,
-            total_price_client,
-            profit,
+            quote.total_price_client,
         )
 
     except Exception as e:
+        PRICING_ERRORS.inc()
         logging.error(f"Ошибка при расчёте стоимости: {e}")
 
-    await update.message.reply_text(
-        "Укажите марку и модель вашего транспортного средства (например: Toyota Camry 2.4)."
-    )
-    return VEHICLE_INFO
-
-
+    return QUESTION
 
 
-# ===== Марка и модель ТС =====
-async def vehicle_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    info = update.message.text.strip()
-    await _sleep_before_reply()
-    if len(info) < 2:
-        await update.message.reply_text(
-            "Пожалуйста, укажите марку и модель полностью, например: MAN TGS 18.440."
-        )
-        return VEHICLE_INFO
-
-    context.user_data["vehicle_info"] = info
-
-    await update.message.reply_text(
-        "Спасибо. Теперь укажите, пожалуйста, ваше Ф.И.О."
-    )
-    return CLIENT_NAME
-
-
-# ===== Ф.И.О. клиента =====
-async def client_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    name = update.message.text.strip()
-    await _sleep_before_reply()
-    if len(name) < 2:
-        await update.message.reply_text(
-            "Пожалуйста, укажите ваше полное Ф.И.О. (минимум 2 символа)."
-        )
-        return CLIENT_NAME
-
-    context.user_data["client_name"] = name
-
-    await update.message.reply_text(
-        "Укажите номер телефона или @username в Telegram для связи."
-    )
-    return CLIENT_CONTACT
-
-
-# ===== Контакт клиента, заключение, сохранение, уведомление админу =====
-async def client_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    contact = update.message.text.strip()
-    await _sleep_before_reply()
-
-    # убираем всё, что не цифра
-    phone_digits = re.sub(r"\D", "", contact)
-    is_phone = len(phone_digits) >= 10  # пропускаем любые нормальные номера
-    is_username = contact.startswith("@") and len(contact) >= 5
-
-    if not (is_phone or is_username):
-        await update.message.reply_text(
-            "Пожалуйста, укажите номер телефона или @username для связи."
-        )
-        return CLIENT_CONTACT
-
-    context.user_data["client_contact"] = contact
+# ===== Заключение, сохранение, уведомление админу =====
+async def submit_application(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    lead_id = context.user_data.setdefault("lead_id", new_lead_id())
 
     aggregate = context.user_data.get("aggregate", "Двигатель")
-    overheat = context.user_data.get("overheat")
-    no_oil = context.user_data.get("no_oil")
-    oil = context.user_data.get("oil_consumption")
-    smoke = context.user_data.get("smoke")
-    symptoms = context.user_data.get("symptoms")
-
     engine_volume_value = context.user_data.get("engine_volume")
     oil_volume_value = context.user_data.get("oil_volume")
 
-    rvs_ml = context.user_data.get("rvs_ml")
-    accel_ml = context.user_data.get("accel_ml")
-    material_cost = context.user_data.get("material_cost")
-    material_price_client = context.user_data.get("material_price_client")
-    work_cost = context.user_data.get("work_cost")
-    total_price_client = context.user_data.get("total_price_client")
-    profit = context.user_data.get("profit")
+    # Расчёт с готовыми текстами; None, если расчёт не удался
+    quote = context.user_data.get("quote")
 
     client_name_value = context.user_data.get("client_name")
     client_contact_value = context.user_data.get("client_contact")
 
-
-
     # Заключение для клиента
-    if aggregate == "Двигатель":
-        if (
-            overheat == "Да, серьёзно"
-            and oil == "Более 1 л / 1000 км"
-            and smoke == "Синий"
-        ):
-            conclusion = (
-                "⚠️ Заключение:\n\n"
-                "По введённым данным применение NANOREM не рекомендуется.\n\n"
-                "Рекомендуется предварительная диагностика агрегата."
-            )
-        else:
-            conclusion = (
-                "✅ Заключение:\n\n"
-                "По предварительным данным применение NANOREM возможно.\n"
-                "Рекомендуется консультация специалиста."
-            )
-    else:
-        if no_oil == "Да, долго" and symptoms == "Сильные":
-            conclusion = (
-                "⚠️ Заключение:\n\n"
-                "По введённым данным применение NANOREM не рекомендуется.\n\n"
-                "Рекомендуется предварительная диагностика агрегата."
-            )
-        else:
-            conclusion = (
-                "✅ Заключение:\n\n"
-                "По предварительным данным применение NANOREM возможно.\n"
-                "Рекомендуется консультация специалиста."
-            )
-
     text = (
-        conclusion
+        QUESTIONNAIRE.conclusion.text(context.user_data)
         + f"\n\nВыбранный агрегат: {aggregate}."
         + "\n\nНаш специалист свяжется с вами для уточнения деталей."
     )
 
     # Клиенту — только заключение (согласно SHOW_PRICE_TO_CLIENT=false)
     # Если позже захочешь показывать цену — здесь можно будет условно добавить блок с ценами
-    await update.message.reply_text(text)
-
-    # ===== Сохранение заявки в файл =====
-    printable_quote = None  # одна переменная и для файла, и для карточки
-
-    try:
-        applications_dir = Path("applications")
-        applications_dir.mkdir(exist_ok=True)
-
-        application_data = {
-            "timestamp": datetime.now().isoformat(),
-            "client_name": client_name_value,
-            "client_contact": client_contact_value,
-            "aggregate": aggregate,
-            "engine_volume": engine_volume_value,
-            "oil_volume": oil_volume_value,
-            "overheat": overheat,
-            "no_oil": no_oil,
-            "repair": context.user_data.get("repair"),
-            "oil_consumption": oil,
-            "smoke": smoke,
-            "symptoms": symptoms,
-            "rvs_ml": rvs_ml,
-            "accel_ml": accel_ml,
-            "material_cost": material_cost,
-            "material_price_client": material_price_client,
-            "work_cost": work_cost,
-            "total_price_client": total_price_client,
-            "profit": profit,
-            "vehicle_info": context.user_data.get("vehicle_info"),
-        }
-
+    _reply(update, text)
+
+    # ===== Сохранение заявки =====
+    application_data = {
+        "lead_id": lead_id,
+        "timestamp": datetime.now().isoformat(),
+        "client_name": client_name_value,
+        "client_contact": client_contact_value,
+        "aggregate": aggregate,
+        "engine_volume": engine_volume_value,
+        "oil_volume": oil_volume_value,
+        "overheat": context.user_data.get("overheat"),
+        "no_oil": context.user_data.get("no_oil"),
+        "repair": context.user_data.get("repair"),
+        "oil_consumption": context.user_data.get("oil_consumption"),
+        "smoke": context.user_data.get("smoke"),
+        "symptoms": context.user_data.get("symptoms"),
+        "rvs_ml": quote.rvs_ml if quote else None,
+        "accel_ml": quote.accel_ml if quote else None,
+        "material_cost": quote.material_cost if quote else None,
+        "material_price_client": quote.material_price_client if quote else None,
+        "work_cost": quote.work_cost if quote else None,
+        "total_price_client": quote.total_price_client if quote else None,
+        "profit": quote.profit if quote else None,
+        "pricing_version": quote.pricing_version if quote else None,
+        "vehicle_info": context.user_data.get("vehicle_info"),
+    }
+    if quote:
         # Текст для клиента (для печати/копирования)
-        if (
-            material_price_client is not None
-            and work_cost is not None
-            and total_price_client is not None
-        ):
-            printable_quote = (
-                "Предварительный расчёт стоимости обработки NANOREM:\n\n"
-                f"Материалы: {material_price_client:.2f} руб.\n"
-                f"Работа: {work_cost:.2f} руб.\n"
-                f"ИТОГО: {total_price_client:.2f} руб.\n\n"
-                "Расчёт предварительный, окончательная стоимость может быть скорректирована "
-                "по результатам диагностики и осмотра."
-            )
-            application_data["printable_quote"] = printable_quote
-
-
-        filename = applications_dir / f"application_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(application_data, f, ensure_ascii=False, indent=2)
-
-    except Exception as e:
-        logging.error(f"Ошибка при сохранении заявки: {e}")
+        application_data["printable_quote"] = quote.printable_quote
 
-    # ===== Сохранение лида в CSV =====
     try:
-        applications_dir = Path("applications")
-        applications_dir.mkdir(exist_ok=True)
-
-        leads_csv_path = applications_dir / "leads.csv"
-        file_exists = leads_csv_path.exists()
-
-        headers = [
-            "дата",
-            "имя клиента",
-            "контакт",
-            "агрегат",
-            "марка авто",
-            "объем двигателя",
-            "объем масла",
-            "итоговая цена",
-            "прибыль",
-        ]
-
-        row = {
-            "дата": datetime.now().isoformat(sep=" ", timespec="seconds"),
-            "имя клиента": client_name_value or "",
-            "контакт": client_contact_value or "",
-            "агрегат": aggregate or "",
-            "марка авто": context.user_data.get("vehicle_info") or "",
-            "объем двигателя": engine_volume_value if engine_volume_value is not None else "",
-            "объем масла": oil_volume_value if oil_volume_value is not None else "",
-            "итоговая цена": (
-                f"{total_price_client:.2f}" if total_price_client is not None else ""
-            ),
-            "прибыль": f"{profit:.2f}" if profit is not None else "",
-        }
-
-        with open(leads_csv_path, "a", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=headers)
-            if not file_exists:
-                writer.writeheader()
-            writer.writerow(row)
+        # Базу, JSON-файл и строку leads.csv пишет поток lead_writer
+        with tracer.io(lead_id, "leads.enqueue"):
+            await lead_writer.submit(application_data)
     except Exception as e:
-        logging.error(f"Ошибка при сохранении лида в CSV: {e}")
+        logging.error(f"Ошибка при сохранении заявки: {e}")
 
     # ===== Отправка лида в Google Sheets (POST JSON) =====
     try:
-        payload = {
-            "name": client_name_value or "",
-            "contact": client_contact_value or "",
-            "aggregate": aggregate or "",
-            "vehicle": context.user_data.get("vehicle_info") or "",
-            "engine_volume": engine_volume_value,
-            "oil_volume": oil_volume_value,
-            "price": total_price_client,
-            "profit": profit,
-        }
-        await _post_to_google_sheets(payload)
+        sheets_sink.submit(lead_payload(application_data))
     except Exception as e:
-        logging.error(f"Ошибка при отправке лида в Google Sheets: {e}")
+        logging.error(f"Ошибка при постановке лида в очередь Google Sheets: {e}")
 
     # ===== Отправка карточки администратору =====
     if ADMIN_CHAT_ID:
-        vehicle_info = context.user_data.get("vehicle_info")
-
-        card_lines = [
-            "📝 Новая заявка от клиента",
-            "",
-            f"👤 Ф.И.О.: {client_name_value or '-'}",
-            f"📞 Контакт: {client_contact_value or '-'}",
-            f"🔧 Агрегат: {aggregate}",
-        ]
-
-        if vehicle_info:
-            card_lines.append(f"🚗 ТС: {vehicle_info}")
-
-        card_lines.append("")
-
-        if engine_volume_value is not None:
-            card_lines.append(f"⚙️ Объём двигателя: {engine_volume_value} л")
-        if oil_volume_value is not None:
-            card_lines.append(f"🛢️ Объём масла: {oil_volume_value} л")
-
-        if aggregate == "Двигатель":
-            if overheat:
-                card_lines.append(f"🌡️ Перегрев: {overheat}")
-            if context.user_data.get("repair"):
-                card_lines.append(f"🔨 Ремонт: {context.user_data.get('repair')}")
-            if oil:
-                card_lines.append(f"📊 Расход масла: {oil}")
-            if smoke:
-                card_lines.append(f"💨 Дым: {smoke}")
-        else:
-            if no_oil:
-                card_lines.append(f"⛽ Езда без масла: {no_oil}")
-            if symptoms:
-                card_lines.append(f"🔊 Симптомы: {symptoms}")
-
-        # Блок материалов и финансов
-        if rvs_ml is not None or accel_ml is not None:
-            card_lines.append("")
-            card_lines.append("🧪 Материалы:")
-            if rvs_ml is not None:
-                card_lines.append(f" • РВС: {rvs_ml:.1f} мл")
-            if accel_ml is not None:
-                card_lines.append(f" • Ускоритель: {accel_ml:.1f} мл")
+        card_text = render_admin_card(application_data, quote)
 
-        if (
-            material_cost is not None
-            and material_price_client is not None
-            and work_cost is not None
-            and total_price_client is not None
-            and profit is not None
-        ):
-            card_lines.append("")
-            card_lines.append("💰 Финансы:")
-            card_lines.append(f" • Себестоимость материалов: {material_cost:.2f} руб.")
-            card_lines.append(
-                f" • Цена материалов для клиента: {material_price_client:.2f} руб."
-            )
-            card_lines.append(f" • Работа: {work_cost:.2f} руб.")
-            card_lines.append(
-                f" • ИТОГО для клиента: {total_price_client:.2f} руб."
-            )
-            card_lines.append(f" • Чистая прибыль: {profit:.2f} руб.")
-
-        if printable_quote:
-            card_lines.append("")
-            card_lines.append("📄 Текст для клиента:")
-            card_lines.append(printable_quote)
-
-        card_text = "\n".join(card_lines)
+        buttons = []
+        if is_phone(client_contact_value):
+            normalized_digits = normalize_phone(re.sub(r"\D", "", client_contact_value))
+            buttons.append(("📞 Позвонить клиенту", f"call_client:{normalized_digits}"))
 
         try:
-            if not is_phone:
-                await context.bot.send_message(chat_id=ADMIN_CHAT_ID, text=card_text)
-            else:
-                normalized_digits = phone_digits
-                if len(normalized_digits) == 11 and normalized_digits.startswith("8"):
-                    normalized_digits = "7" + normalized_digits[1:]
-                elif len(normalized_digits) == 10:
-                    normalized_digits = "7" + normalized_digits
-
-                reply_markup = InlineKeyboardMarkup(
-                    [
-                        [
-                            InlineKeyboardButton(
-                                "📞 Позвонить клиенту",
-                                callback_data=f"call_client:{normalized_digits}",
-                            )
-                        ]
-                    ]
-                )
-                await context.bot.send_message(
-                    chat_id=ADMIN_CHAT_ID,
-                    text=card_text,
-                    reply_markup=reply_markup,
-                )
+            # Карточка пишется в очередь на диске, отправляет admin_notifier
+            with tracer.io(lead_id, "admin_outbox.submit"):
+                await admin_notifier.submit(ADMIN_CHAT_ID, card_text, buttons, lead_id)
         except Exception as e:
-            logging.error(f"Ошибка при отправке карточки администратору: {e}")
+            logging.error(f"Ошибка при постановке карточки администратору в очередь: {e}")
+
+    # Анкета заполнена: корневой спан трассы закрывается здесь, запись
+    # заявки и отправка в Google Sheets дописывают свои спаны позже
+    tracer.root(lead_id, time.time_ns(), {"aggregate": aggregate, "priced": quote is not None})
 
     # Предложение обработать ещё один агрегат
-    restart_keyboard = [
-        ["🔄 Выбрать ещё один агрегат"],
-        ["❌ Завершить"],
-    ]
-    await update.message.reply_text(
+    _reply(
+        update,
         "Хотите выбрать обработку ещё одного агрегата?",
-        reply_markup=ReplyKeyboardMarkup(
-            restart_keyboard,
-            resize_keyboard=True,
-            one_time_keyboard=True,
-        ),
+        reply_markup=keyboards.RESTART.markup,
     )
 
     return RESTART
 
 
+# Действия, на которые ссылаются шаги анкеты ("action" в questionnaire.json)
+_ACTIONS = {
+    "quote": calculate_quote,
+    "submit": submit_application,
+}
+
+QUESTIONNAIRE = load_questionnaire(actions=_ACTIONS)
+# Шаг и его дочерняя гистограмма по имени состояния, собираются один раз:
+# обработчик делает один поиск в словаре на сообщение
+_STATES = {name: (step, HANDLER_SECONDS.labels(name)) for name, step in QUESTIONNAIRE.steps.items()}
+
+
 # ===== /help =====
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await _sleep_before_reply()
     help_text = (
         "🤖 Помощник Петя по авто-продукции NANOREM\n\n"
         "Я помогу вам определить, подходит ли обработка NANOREM для вашего агрегата.\n\n"
@@ -1003,15 +577,98 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "после чего дам рекомендацию по применению NANOREM."
     )
 
-    await update.message.reply_text(help_text)
+    _reply(update, help_text)
+
+
+# ===== /profile (только администратор) =====
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    if not ADMIN_CHAT_ID or chat_id != ADMIN_CHAT_ID:
+        return
+
+    try:
+        seconds = float(context.args[0]) if context.args else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        seconds = PROFILE_DEFAULT_SECONDS
+    seconds = min(max(seconds, 1), PROFILE_MAX_SECONDS)
+
+    await context.bot.send_message(chat_id=chat_id, text=f"⏱ Снимаю стеки {seconds:.0f} с…")
+    # Профилировщик — отдельный поток, цикл событий в это время работает как обычно
+    collapsed = await asyncio.to_thread(sample_stacks, seconds)
+    stats = loop_monitor.stats()
+    await context.bot.send_document(
+        chat_id=chat_id,
+        document=collapsed.encode(),
+        filename=f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}_pid{os.getpid()}.folded",
+        caption=(
+            "Collapsed stacks для flamegraph.pl / speedscope.\n"
+            f"Зависаний цикла дольше {stats['threshold_ms']} мс: {stats['stalls']}, "
+            f"наибольшее опоздание {stats['max_lag_ms']} мс"
+        ),
+    )
+
+
+# ===== /memory (только администратор) =====
+def _data_summary(name: str, entries: dict, size) -> str:
+    total = sum(size(data) for data in entries.values())
+    average = total // len(entries) if entries else 0
+    return f"{name}: {len(entries)} записей, ~{format_size(total)} (в среднем {format_size(average)})"
+
+
+async def memory_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    if not ADMIN_CHAT_ID or chat_id != ADMIN_CHAT_ID:
+        return
+
+    if context.args and context.args[0] == "stop":
+        memory_tracer.stop()
+        await context.bot.send_message(chat_id=chat_id, text="tracemalloc выключен.")
+        return
+
+    app = context.application
+    lines = [
+        f"🧠 Память процесса {os.getpid()}: {format_size(rss_bytes())}",
+        # Расчёт (quote) общий с кешем расчётов и в размер сессии не входит
+        _data_summary("user_data", app.user_data, lambda data: data.memory_size()),
+        _data_summary("chat_data", app.chat_data, deep_sizeof),
+        f"Кеш расчётов: {len(quote_cache)} из {quote_cache.maxsize}",
+        "",
+    ]
+    if memory_tracer.tracing:
+        # Снимок всех выделений — долгий, делаем его не в цикле событий
+        lines.append(await asyncio.to_thread(memory_tracer.report))
+    else:
+        memory_tracer.start()
+        lines.append(
+            "tracemalloc включён (выделения памяти станут медленнее). Следующий /memory покажет, "
+            "где занята память и что выросло; /memory stop — выключить."
+        )
+    text = "\n".join(lines)
+    await context.bot.send_message(chat_id=chat_id, text=text[: MessageLimit.MAX_TEXT_LENGTH])
+
+
+# ===== /funnel (только администратор) =====
+async def funnel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    if not ADMIN_CHAT_ID or chat_id != ADMIN_CHAT_ID:
+        return
+
+    if not funnel_log.enabled:
+        await context.bot.send_message(chat_id=chat_id, text="Воронка выключена (FUNNEL_LOG=false).")
+        return
+    # Снимки других процессов-обработчиков читаются с диска — не в цикле событий
+    stats = await asyncio.to_thread(funnel_log.snapshot)
+    text = funnel.render(stats, QUESTIONNAIRE.steps, QUESTIONNAIRE.first_step)
+    await context.bot.send_message(chat_id=chat_id, text=text[: MessageLimit.MAX_TEXT_LENGTH])
 
 
 # ===== /cancel =====
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await _sleep_before_reply()
-    await update.message.reply_text(
+    _leave_step(context.user_data, funnel.CANCEL)
+    _reply(
+        update,
         "Консультация завершена.",
-        reply_markup=ReplyKeyboardRemove(),
+        reply_markup=keyboards.REMOVE,
     )
     return ConversationHandler.END
 
@@ -1019,65 +676,383 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ===== Повторный выбор =====
 async def restart_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text
-    await _sleep_before_reply()
 
     if "Выбрать" in text:
         context.user_data.clear()
         return await start(update, context)
 
-    await update.message.reply_text(
+    _reply(
+        update,
         "Спасибо за обращение! Если понадобится выбор — нажмите /start.",
-        reply_markup=ReplyKeyboardRemove(),
+        reply_markup=keyboards.REMOVE,
     )
     return ConversationHandler.END
 
 
-def _clean_str(env_value: str) -> str:
-    if not env_value:
-        return ""
-    if "=" in env_value:
-        env_value = env_value.split("=", 1)[1]
-    return env_value.strip()
+# ===== Сессия: отметка активности и удалённые анкеты =====
+def _session_guard(conv: ConversationHandler):
+    async def guard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if context.user_data is None:
+            return
+        context.user_data.touch()
 
-def main():
-    raw_token = os.getenv("BOT_TOKEN")
-    token = _clean_str(raw_token)
-    if not token:
-        logging.error("Токен бота не найден! Установите переменную окружения BOT_TOKEN.")
-        return
+        # Сессию удалили как брошенную, а анкета ещё ждёт ответа: ответы
+        # пропали, поэтому просим начать заново, а не считаем по пустым данным
+        message = update.message
+        if (
+            message is None
+            or not message.text
+            or message.text.startswith("/")
+            or "lead_id" in context.user_data
+            or not conv.check_update(update)
+        ):
+            return
+        _reply(
+            update,
+            "Прошло много времени, и ответы не сохранились. Давайте начнём заново: /start",
+            reply_markup=keyboards.REMOVE,
+        )
+        raise ApplicationHandlerStop
+
+    return guard
+
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = _clean_str(os.getenv("BOT_MODE")).lower() or "polling"
+
+# Webhook: бот слушает WEBHOOK_LISTEN:WEBHOOK_PORT/WEBHOOK_PATH, а Telegram
+# шлёт обновления на WEBHOOK_URL/WEBHOOK_PATH (адрес за прокси/балансировщиком)
+WEBHOOK_LISTEN = _clean_str(os.getenv("WEBHOOK_LISTEN")) or "0.0.0.0"
+WEBHOOK_PORT = _clean_int(os.getenv("WEBHOOK_PORT"), "8443")
+WEBHOOK_URL = _clean_str(os.getenv("WEBHOOK_URL")).rstrip("/")
+WEBHOOK_PATH = _clean_str(os.getenv("WEBHOOK_PATH")).strip("/") or "telegram"
+WEBHOOK_SECRET_TOKEN = _clean_str(os.getenv("WEBHOOK_SECRET_TOKEN"))
+WEBHOOK_MAX_CONNECTIONS = _clean_int(os.getenv("WEBHOOK_MAX_CONNECTIONS"), "40")
+
+# Очередь полученных, но ещё не обработанных обновлений. Когда она полна,
+# приём ждёт: webhook отвечает Telegram позже, polling не забирает новые
+UPDATE_QUEUE_SIZE = _clean_int(os.getenv("UPDATE_QUEUE_SIZE"), "1000")
+
+# Сколько обновлений обрабатывать одновременно. Разные чаты идут
+# параллельно, сообщения одного чата — по очереди (1 — всё последовательно)
+MAX_CONCURRENT_UPDATES = _clean_int(os.getenv("MAX_CONCURRENT_UPDATES"), "64")
+# Сколько взятых из очереди обновлений может ждать своей очереди в чате или
+# свободного места; остальные остаются в очереди UPDATE_QUEUE_SIZE
+MAX_WAITING_UPDATES = _clean_int(os.getenv("MAX_WAITING_UPDATES"), str(max(1, MAX_CONCURRENT_UPDATES)))
+
+update_processor = ChatOrderedUpdateProcessor(max(1, MAX_CONCURRENT_UPDATES), MAX_WAITING_UPDATES)
+
+# Другой адрес Bot API (локальный Bot API сервер или заглушка для замеров)
+TELEGRAM_API_BASE_URL = _clean_str(os.getenv("TELEGRAM_API_BASE_URL"))
+
+# Соединения с Bot API (bot_api.py): пул для отправки и отдельный для getUpdates.
+# BOT_API_HTTP_VERSION=2 требует python-telegram-bot[http2]
+BOT_API_POOL_SIZE = _clean_int(os.getenv("BOT_API_POOL_SIZE"), "256")
+BOT_API_POOL_TIMEOUT = _clean_float(os.getenv("BOT_API_POOL_TIMEOUT"), "1")
+BOT_API_KEEPALIVE_EXPIRY = _clean_float(os.getenv("BOT_API_KEEPALIVE_EXPIRY"), "30")
+BOT_API_HTTP_VERSION = _clean_str(os.getenv("BOT_API_HTTP_VERSION")) or "1.1"
+BOT_API_GET_UPDATES_POOL_SIZE = _clean_int(os.getenv("BOT_API_GET_UPDATES_POOL_SIZE"), "1")
+
+send_request = PooledRequest(
+    "send",
+    connection_pool_size=max(1, BOT_API_POOL_SIZE),
+    pool_timeout=BOT_API_POOL_TIMEOUT,
+    keepalive_expiry=BOT_API_KEEPALIVE_EXPIRY,
+    http_version=BOT_API_HTTP_VERSION,
+)
+get_updates_request = PooledRequest(
+    "get_updates",
+    connection_pool_size=max(1, BOT_API_GET_UPDATES_POOL_SIZE),
+    pool_timeout=BOT_API_POOL_TIMEOUT,
+    keepalive_expiry=BOT_API_KEEPALIVE_EXPIRY,
+    http_version=BOT_API_HTTP_VERSION,
+)
+
+# Число процессов-обработчиков (sharding.py). 1 — всё в одном процессе
+BOT_WORKERS = _clean_int(os.getenv("BOT_WORKERS"), "1")
+
+
+async def _on_init(app):
+    lead_writer.start()
+    await sheets_sink.start()
+    session_sweeper.start(app)
+    await admin_notifier.start(app.bot)
+    await metrics_server.start()
+    tracer.start()
+    funnel_log.start()
+    loop_monitor.start()
+    if MEMORY_TRACE_FRAMES > 0:
+        memory_tracer.start()
+
+
+async def _on_stop(app):
+    # Дожидаемся запланированных ответов, пока бот ещё может их отправить
+    await reply_scheduler.flush()
+    await loop_monitor.stop()
+    await metrics_server.stop()
+    await session_sweeper.stop()
+    await admin_notifier.stop()
+    await sheets_sink.stop()
+    await lead_writer.stop()
+    await asyncio.to_thread(tracer.stop)
+    await asyncio.to_thread(funnel_log.stop)
+    logging.info("Кеш расчётов: %s", quote_cache.stats())
+    logging.info("Сессии: %s", session_sweeper.stats())
+    logging.info("Обработка обновлений: %s", update_processor.stats())
+    logging.info("Карточки администратору: %s", admin_notifier.stats())
+    logging.info("Bot API, отправка: %s", send_request.stats())
+    logging.info("Цикл событий: %s", loop_monitor.stats())
+    logging.info("Воронка: %s", funnel_log.stats())
+
+
+def _builder(token: str, processor: ChatOrderedUpdateProcessor = None):
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        .request(send_request)
+        .get_updates_request(get_updates_request)
+    )
+    if processor is None:
+        builder = builder.update_queue(asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE))
+    else:
+        # Обновление берётся из очереди, только когда у обработки есть место:
+        # иначе оно копится здесь, а при полной очереди ждёт приём
+        builder = builder.update_queue(processor.update_queue(UPDATE_QUEUE_SIZE)).concurrent_updates(processor)
+    if TELEGRAM_API_BASE_URL:
+        builder = builder.base_url(TELEGRAM_API_BASE_URL)
+    return builder
+
+
+def _pool_metrics():
+    for name, stat, help in (
+        ("bot_api_in_flight", "in_flight", "Запросы к Bot API в работе"),
+        ("bot_api_waiting", "waiting", "Запросы к Bot API, ждущие соединения"),
+    ):
+        metrics.callback(
+            name,
+            help,
+            lambda stat=stat: {r.name: r.stats()[stat] for r in (send_request, get_updates_request)},
+            labelnames=("pool",),
+        )
+    for name, stat, help in (
+        ("bot_api_requests_total", "requests", "Запросы к Bot API"),
+        ("bot_api_pool_timeouts_total", "pool_timeouts", "Запросы, не дождавшиеся соединения"),
+        ("bot_api_saturated_seconds_total", "saturated_seconds", "Время, когда запросы ждали свободного соединения"),
+    ):
+        metrics.callback(
+            name,
+            help,
+            lambda stat=stat: {r.name: r.stats()[stat] for r in (send_request, get_updates_request)},
+            kind="counter",
+            labelnames=("pool",),
+        )
+
+
+def _pipeline_metrics(app, conv: ConversationHandler):
+    metrics.callback(
+        "bot_conversations_active",
+        "Незавершённые анкеты",
+        # У ConversationHandler нет публичного счётчика, словарь состояний — внутренний
+        lambda: len(conv._conversations),
+    )
+    metrics.callback("bot_sessions", "Сессии клиентов в памяти", lambda: len(app.user_data))
+    metrics.callback(
+        "bot_session_bytes",
+        "Средний размер сессии в байтах (по первой тысяче сессий)",
+        # Считается и при SESSION_TTL_HOURS=0; выборка — чтобы запрос не обходил все сессии
+        session_sweeper.measure,
+    )
+    metrics.callback(
+        "bot_queue_depth",
+        "Очереди: обновления, запись заявок, Google Sheets, карточки, состояние анкет",
+        lambda: {
+            "updates": app.update_queue.qsize(),
+            "leads": lead_writer.queue_depth,
+            "sheets": sheets_sink.queue_depth,
+            "admin_cards": admin_notifier.queue_depth,
+            "state": app.persistence.pending,
+        },
+        labelnames=("queue",),
+    )
+    metrics.callback("bot_updates_in_flight", "Обновления в обработке", lambda: update_processor.in_flight)
+    metrics.callback(
+        "bot_updates_waiting",
+        "Обновления, взятые из очереди и ждущие своей очереди в чате или места",
+        lambda: update_processor.waiting,
+    )
+    metrics.callback(
+        "bot_updates_processed_total", "Обработанные обновления", lambda: update_processor.processed, kind="counter"
+    )
+    metrics.callback(
+        "bot_leads_written_total", "Заявки, записанные на диск", lambda: lead_writer.written, kind="counter"
+    )
+    metrics.callback(
+        "bot_admin_cards_total",
+        "Отправка карточек администратору: sent, digests, retries, flood_waits, failed",
+        admin_notifier.stats,
+        kind="counter",
+        labelnames=("outcome",),
+    )
+    _pool_metrics()
+
+
+def _orphan_spools(worker, workers: int):
+    """Спулы Google Sheets обработчиков, которых при таком BOT_WORKERS больше нет."""
+    indexes = set()
+    for path in sheets_sink.spool_path.parent.glob("sheets_spool.worker*"):
+        match = re.fullmatch(r"sheets_spool\.worker(\d+)\.(jsonl|taken)", path.name)
+        if match:
+            indexes.add(int(match.group(1)))
+    return [
+        sheets_sink.spool_path.with_name(f"sheets_spool.worker{index}.jsonl")
+        for index in sorted(indexes)
+        # Один процесс забирает все; обработчик — свои «лишние» номера
+        if worker is None or (index >= workers and index % workers == worker)
+    ]
 
-    app = ApplicationBuilder().token(token).build()
+
+def build_application(token: str, updater: bool = True, owns_key=None, worker: int = None, workers: int = 1):
+    """Бот со всеми обработчиками; updater=False и номер worker из workers — для процесса-обработчика."""
+    sheets_sink.orphan_spools = _orphan_spools(worker, workers)
+    if worker is not None:
+        # У каждого обработчика свой порт метрик (приёмник — на METRICS_PORT) и своя воронка
+        metrics_server.port = METRICS_PORT + 1 + worker if METRICS_PORT else 0
+        funnel_log.name = f"worker{worker}"
+        # Свои CSV и спул Google Sheets: без блокировок между процессами
+        lead_writer.csv_name = f"leads.worker{worker}.csv"
+        sheets_sink.spool_path = sheets_sink.spool_path.with_name(f"sheets_spool.worker{worker}.jsonl")
+    builder = _builder(token, update_processor)
+    if not updater:
+        builder = builder.updater(None)
+
+    app = (
+        builder
+        .post_init(_on_init)
+        .post_stop(_on_stop)
+        .context_types(ContextTypes(user_data=Session))
+        .persistence(
+            SqlitePersistence(
+                update_interval=STATE_FLUSH_INTERVAL,
+                conversation_ttl=STATE_CONVERSATION_TTL_DAYS * 24 * 3600,
+                owns_key=owns_key,
+            )
+        )
+        .build()
+    )
 
     conv = ConversationHandler(
-        entry_points=[CommandHandler("start", start)],
+        entry_points=[CommandHandler("start", _timed("start", start, wait_user=False))],
         states={
-            AGGREGATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, aggregate_choice)],
-            OVERHEAT: [MessageHandler(filters.TEXT & ~filters.COMMAND, overheat)],
-            REPAIR: [MessageHandler(filters.TEXT & ~filters.COMMAND, repair)],
-            OIL_CONSUMPTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, oil_consumption)],
-            SMOKE: [MessageHandler(filters.TEXT & ~filters.COMMAND, smoke)],
-            ENGINE_VOLUME: [MessageHandler(filters.TEXT & ~filters.COMMAND, engine_volume)],
-            CYLINDERS: [MessageHandler(filters.TEXT & ~filters.COMMAND, cylinders_handler)],
-            OIL_VOLUME: [MessageHandler(filters.TEXT & ~filters.COMMAND, oil_volume)],
-            VEHICLE_INFO: [MessageHandler(filters.TEXT & ~filters.COMMAND, vehicle_info)],
-            CLIENT_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, client_name)],
-            CLIENT_CONTACT: [MessageHandler(filters.TEXT & ~filters.COMMAND, client_contact)],
-            RESTART: [MessageHandler(filters.TEXT & ~filters.COMMAND, restart_choice)],
+            QUESTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, answer)],
+            RESTART: [MessageHandler(filters.TEXT & ~filters.COMMAND, _timed("restart", restart_choice))],
         },
         fallbacks=[
-            CommandHandler("cancel", cancel),
-            CommandHandler("start", start),
+            CommandHandler("cancel", _timed("cancel", cancel)),
+            CommandHandler("start", _timed("start", start, wait_user=False)),
+            # Сохранённое состояние из прежней версии анкеты
+            MessageHandler(filters.TEXT & ~filters.COMMAND, _timed("start_over", _start_over)),
         ],
         allow_reentry=True,
+        name="questionnaire",
+        persistent=True,
+        # Анкета завершается вместе с удалением сессии: с JobQueue по таймауту,
+        # без него её ключ удаляет session_sweeper (а ответ — _session_guard)
+        conversation_timeout=(
+            SESSION_TTL_HOURS * 3600 if SESSION_TTL_HOURS > 0 and app.job_queue else None
+        ),
     )
 
-    app.add_handler(CallbackQueryHandler(call_client_callback, pattern=r"^call_client:"))
+    session_sweeper.conversation = conv
+    app.add_handler(TypeHandler(Update, _session_guard(conv)), group=-1)
+    app.add_handler(
+        CallbackQueryHandler(_timed("call_client", call_client_callback), pattern=r"^call_client:")
+    )
     app.add_handler(conv)
+    # В той же группе после анкеты: срабатывает, только если анкета сообщение не взяла
+    app.add_handler(
+        MessageHandler(filters.TEXT & ~filters.COMMAND & filters.ChatType.PRIVATE, _no_questionnaire)
+    )
     app.add_handler(CommandHandler("clean", clean))
     app.add_handler(CommandHandler("help", help_command))
+    app.add_handler(CommandHandler("profile", profile_command))
+    app.add_handler(CommandHandler("memory", memory_command))
+    app.add_handler(CommandHandler("funnel", funnel_command))
+    _pipeline_metrics(app, conv)
+    return app
+
+
+def build_ingress(token: str, supervisor: ShardSupervisor):
+    """Приёмник: только получает обновления и раздаёт их обработчикам."""
+    async def on_init(app):
+        await supervisor.start(app)
+        await metrics_server.start()
+        loop_monitor.start()
+
+    async def on_stop(app):
+        await loop_monitor.stop()
+        await metrics_server.stop()
+        await supervisor.stop(app)
+
+    app = _builder(token).post_init(on_init).post_stop(on_stop).build()
+    app.add_handler(TypeHandler(Update, supervisor.forward))
+
+    metrics.callback("bot_workers_alive", "Живые процессы-обработчики", lambda: supervisor.alive)
+    metrics.callback(
+        "bot_queue_depth",
+        "Очередь полученных обновлений",
+        lambda: {"updates": app.update_queue.qsize()},
+        labelnames=("queue",),
+    )
+    for name, stat, help in (
+        ("bot_updates_forwarded_total", "forwarded", "Обновления, переданные обработчикам"),
+        ("bot_worker_restarts_total", "restarts", "Перезапуски упавших обработчиков"),
+    ):
+        metrics.callback(name, help, lambda stat=stat: supervisor.stats()[stat], kind="counter")
+    _pool_metrics()
+    return app
+
+
+def _serve(app):
+    if BOT_MODE == "webhook":
+        # Без заданного секрета генерируем свой на каждый запуск: setWebhook
+        # бот вызывает сам, а чужие POST без заголовка получат 403
+        secret_token = WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32)
+        logging.info(
+            "Бот запущен (webhook): слушаю %s:%s/%s", WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH
+        )
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL}/{WEBHOOK_PATH}",
+            secret_token=secret_token,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        return
 
     logging.info("Бот запущен и готов к работе!")
-    app.run_polling()
+    app.run_polling(allowed_updates=Update.ALL_TYPES)
+
+
+def main():
+    raw_token = os.getenv("BOT_TOKEN")
+    token = _clean_str(raw_token)
+    if not token:
+        logging.error("Токен бота не найден! Установите переменную окружения BOT_TOKEN.")
+        return
+
+    if BOT_MODE not in ("polling", "webhook"):
+        logging.error("Неизвестный BOT_MODE=%s: используйте polling или webhook.", BOT_MODE)
+        return
+    if BOT_MODE == "webhook" and not WEBHOOK_URL:
+        logging.error("Для BOT_MODE=webhook укажите WEBHOOK_URL (публичный https-адрес бота).")
+        return
+
+    if BOT_WORKERS > 1:
+        _serve(build_ingress(token, ShardSupervisor(token, BOT_WORKERS)))
+    else:
+        _serve(build_application(token))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,104 @@
+import importlib.util
+import logging
+import time
+
+import httpx
+from telegram.error import TimedOut
+from telegram.request import HTTPXRequest
+
+
+# ===== Соединения с Bot API =====
+# Два отдельных пула: долгий getUpdates держит своё соединение и не
+# занимает места отправкам. Для каждого пула настраиваются размер,
+# ожидание свободного соединения, время жизни keep-alive и версия HTTP.
+# Счётчики показывают, насколько пул загружен: сколько запросов сейчас в
+# работе, сколько ждут соединения и сколько времени запросы ждали соединения.
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+class PooledRequest(HTTPXRequest):
+    def __init__(
+        self,
+        name: str,
+        connection_pool_size: int = 256,
+        pool_timeout: float = 1.0,
+        keepalive_expiry: float = 30.0,
+        http_version: str = "1.1",
+        **kwargs,
+    ):
+        if http_version != "1.1" and not http2_available():
+            logging.warning(
+                "HTTP/2 для пула %s недоступен (pip install 'python-telegram-bot[http2]'), используется HTTP/1.1",
+                name,
+            )
+            http_version = "1.1"
+        super().__init__(
+            connection_pool_size=connection_pool_size,
+            pool_timeout=pool_timeout,
+            http_version=http_version,
+            httpx_kwargs={
+                "limits": httpx.Limits(
+                    max_connections=connection_pool_size,
+                    max_keepalive_connections=connection_pool_size,
+                    keepalive_expiry=keepalive_expiry,
+                )
+            },
+            **kwargs,
+        )
+        self.name = name
+        self.pool_size = connection_pool_size
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.pool_timeouts = 0
+        self._saturated_since = None
+        self._saturated_total = 0.0
+
+    @property
+    def waiting(self) -> int:
+        """Запросы, которым не хватило соединения (оценка: сверх размера пула)."""
+        return max(0, self.in_flight - self.pool_size)
+
+    @property
+    def saturated_seconds(self) -> float:
+        total = self._saturated_total
+        if self._saturated_since is not None:
+            total += time.monotonic() - self._saturated_since
+        return total
+
+    async def do_request(self, *args, **kwargs):
+        self.requests += 1
+        self.in_flight += 1
+        if self.in_flight > self.peak_in_flight:
+            self.peak_in_flight = self.in_flight
+        # Пул считается переполненным, только когда запросу не досталось
+        # соединения. Занятый целиком пул — норма для getUpdates: единственное
+        # соединение всё время держит долгий опрос, и никто его не ждёт
+        if self.in_flight > self.pool_size and self._saturated_since is None:
+            self._saturated_since = time.monotonic()
+        try:
+            return await super().do_request(*args, **kwargs)
+        except TimedOut as e:
+            if isinstance(e.__cause__, httpx.PoolTimeout):
+                self.pool_timeouts += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            if self.in_flight <= self.pool_size and self._saturated_since is not None:
+                self._saturated_total += time.monotonic() - self._saturated_since
+                self._saturated_since = None
+
+    def stats(self) -> dict:
+        return {
+            "pool_size": self.pool_size,
+            "http_version": self.http_version,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "peak_in_flight": self.peak_in_flight,
+            "requests": self.requests,
+            "pool_timeouts": self.pool_timeouts,
+            "saturated_seconds": round(self.saturated_seconds, 3),
+        }
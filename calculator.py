@@ -1,4 +1,27 @@
 # calculator.py
+#
+# Прежний интерфейс расчёта с явными ценами и дозировками. Считает тот же
+# движок правил, что и pricing.calculate_treatment_cost: цены и дозировки
+# из аргументов подставляются в текущий снимок, правила агрегатов — из файла.
+# Как и в pricing, нулевой объём считается «не указан».
+
+from functools import lru_cache
+
+from pricing import calculate_treatment_cost as _calculate, current_config, derive_config
+
+
+@lru_cache(maxsize=32)
+def _config_for(version, rvs_price_per_ml, accel_price_per_ml, markup_coef, rvs_dose_engine, accel_dose_oil):
+    # version — только часть ключа кеша: после смены правил снимок пересобирается
+    return derive_config(
+        current_config(),
+        rvs_price_per_ml=rvs_price_per_ml,
+        accel_price_per_ml=accel_price_per_ml,
+        markup_coef=markup_coef,
+        rvs_dose_ml_per_l_engine=rvs_dose_engine,
+        accel_dose_ml_per_l_oil=accel_dose_oil,
+    )
+
 
 def calculate_treatment_cost(
     aggregate,
@@ -10,22 +33,17 @@ def calculate_treatment_cost(
     rvs_dose_engine,
     accel_dose_oil,
 ):
-    if aggregate == "Двигатель" and engine_volume is not None and oil_volume is not None:
-        rvs_ml = engine_volume * rvs_dose_engine
-        accel_ml = oil_volume * accel_dose_oil
-    else:
-        if oil_volume is not None:
-            rvs_ml = oil_volume * 5
-            accel_ml = oil_volume * 2.5
-        else:
-            rvs_ml = 0
-            accel_ml = 0
-
-    cost_rvs = rvs_ml * rvs_price_per_ml
-    cost_accel = accel_ml * accel_price_per_ml
-    cost_raw = cost_rvs + cost_accel
-
-    client_price = cost_raw * markup_coef
+    config = _config_for(
+        current_config().version,
+        rvs_price_per_ml,
+        accel_price_per_ml,
+        markup_coef,
+        rvs_dose_engine,
+        accel_dose_oil,
+    )
+    rvs_ml, accel_ml, cost_raw, client_price, _, _, _ = _calculate(
+        aggregate, engine_volume, oil_volume, config=config
+    )
     profit = client_price - cost_raw
 
     return rvs_ml, accel_ml, cost_raw, client_price, profit
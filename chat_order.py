@@ -0,0 +1,161 @@
+import asyncio
+
+from telegram.ext import BaseUpdateProcessor
+
+
+# ===== Параллельная обработка с порядком внутри чата =====
+# Обновления разных чатов обрабатываются одновременно (не больше
+# max_concurrent_updates сразу), обновления одного чата — строго по
+# очереди, в порядке получения: ConversationHandler видит ответы клиента
+# так же, как при последовательной обработке.
+#
+# Ожидание своей очереди в чате не занимает место в общем лимите: иначе
+# один клиент, присылающий сообщения пачкой, забирал бы все места и
+# останавливал остальных. Но и ждущих не больше max_waiting: Application
+# запускает задачу на каждое взятое из update_queue обновление, не дожидаясь
+# места, поэтому обновление берётся из очереди (update_queue()) только когда
+# обрабатываемых и ждущих вместе меньше limit + max_waiting. Остальные
+# лежат в update_queue, а когда заполнена и она, приём ждёт.
+
+
+def _chat_key(update):
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(update, "effective_user", None)
+    return None if user is None else ("user", user.id)
+
+
+class _AdmissionQueue(asyncio.Queue):
+    """update_queue, из которой обновление берётся, только если есть место в обработке.
+
+    Место занимает get() и освобождает task_done(): Application вызывает его
+    после обработки каждого взятого обновления (и сигнала остановки).
+    """
+
+    def __init__(self, admitted: asyncio.Semaphore, maxsize: int):
+        super().__init__(maxsize)
+        self._admitted = admitted
+        self._taken = 0
+
+    async def get(self):
+        await self._admitted.acquire()
+        try:
+            item = await super().get()
+        except BaseException:
+            self._admitted.release()
+            raise
+        self._taken += 1
+        return item
+
+    def task_done(self):
+        super().task_done()
+        # Остаток, который Application выбрасывает при остановке через
+        # get_nowait(), места не занимал
+        if self._taken:
+            self._taken -= 1
+            self._admitted.release()
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    __slots__ = (
+        "_limit",
+        "_max_waiting",
+        "_slots",
+        "_admitted",
+        "_chats",
+        "in_flight",
+        "waiting",
+        "peak_in_flight",
+        "peak_waiting",
+        "processed",
+    )
+
+    def __init__(self, max_concurrent_updates: int, max_waiting: int = None):
+        if max_concurrent_updates < 1:
+            raise ValueError("max_concurrent_updates должен быть положительным")
+        max_waiting = max_concurrent_updates if max_waiting is None else max(1, max_waiting)
+        # Семафор BaseUpdateProcessor (берётся до очереди чата) — на всё
+        # допущенное; одновременную обработку ограничивает _slots после неё
+        super().__init__(max_concurrent_updates + max_waiting)
+        self._limit = max_concurrent_updates
+        self._max_waiting = max_waiting
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._admitted = asyncio.Semaphore(max_concurrent_updates + max_waiting)
+        self._chats = {}  # ключ чата -> [asyncio.Lock, число обновлений чата в работе и в очереди]
+        self.in_flight = 0  # обрабатываются сейчас
+        self.waiting = 0  # получены, ждут своей очереди в чате или свободного места
+        self.peak_in_flight = 0
+        self.peak_waiting = 0
+        self.processed = 0
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def active_chats(self) -> int:
+        return len(self._chats)
+
+    def update_queue(self, maxsize: int) -> asyncio.Queue:
+        """Очередь для ApplicationBuilder.update_queue, которая держит лимит допущенных."""
+        return _AdmissionQueue(self._admitted, maxsize)
+
+    async def do_process_update(self, update, coroutine):
+        key = _chat_key(update)
+        entry = None
+        if key is not None:
+            entry = self._chats.get(key)
+            if entry is None:
+                entry = self._chats[key] = [asyncio.Lock(), 0]
+            entry[1] += 1
+
+        self.waiting += 1
+        if self.waiting > self.peak_waiting:
+            self.peak_waiting = self.waiting
+        started = False
+        try:
+            if entry is not None:
+                await entry[0].acquire()
+            try:
+                async with self._slots:
+                    self.waiting -= 1
+                    started = True
+                    self.in_flight += 1
+                    if self.in_flight > self.peak_in_flight:
+                        self.peak_in_flight = self.in_flight
+                    try:
+                        await coroutine
+                    finally:
+                        self.in_flight -= 1
+                        self.processed += 1
+            finally:
+                if entry is not None:
+                    entry[0].release()
+        finally:
+            if not started:
+                # Отменили, пока ждали очереди: корутина так и не запускалась
+                self.waiting -= 1
+                coroutine.close()
+            if entry is not None:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._chats[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "limit": self._limit,
+            "max_waiting": self._max_waiting,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "active_chats": self.active_chats,
+            "peak_in_flight": self.peak_in_flight,
+            "peak_waiting": self.peak_waiting,
+            "processed": self.processed,
+        }
@@ -0,0 +1,379 @@
+import json
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+
+# ===== Воронка анкеты =====
+# Каждый переход ConversationHandler — короткое событие: вошёл на шаг,
+# ответил (с временем на шаге), ошибся во вводе, ушёл через /cancel или
+# /start, отправил заявку. Обработчик только кладёт событие в очередь,
+# поток-писатель дописывает их строками в applications/funnel/<процесс>.log
+# и сразу прибавляет к счётчикам по шагам (за всё время и по часам за
+# последние WINDOW_HOURS часов). Поэтому /funnel не перечитывает журнал:
+# отчёт — сумма счётчиков по шагам, сколько бы событий ни накопилось.
+#
+# Раз в checkpoint_interval секунд счётчики сохраняются в <процесс>.state.json
+# вместе со смещением в журнале; после перезапуска дочитывается только хвост
+# журнала после смещения. У каждого процесса-обработчика свой журнал и свой
+# снимок, /funnel складывает их.
+
+ENTER = "enter"
+ANSWER = "answer"
+INVALID = "invalid"
+CANCEL = "cancel"
+RESTART = "restart"
+DONE = "done"
+EVENTS = (ENTER, ANSWER, INVALID, CANCEL, RESTART, DONE)
+
+# Границы корзин времени на шаге, секунды: медиана берётся по корзинам
+TIME_BUCKETS = (2, 5, 10, 20, 30, 60, 120, 300, 600, 1800, 3600, 6 * 3600)
+WINDOW_HOURS = 24
+
+_STOP = object()
+
+
+class StepStats:
+    __slots__ = ("counts", "seconds", "times")
+
+    def __init__(self):
+        self.counts = dict.fromkeys(EVENTS, 0)
+        self.seconds = 0.0  # сумма времени до ответа
+        self.times = [0] * (len(TIME_BUCKETS) + 1)  # последняя ячейка — дольше всех границ
+
+    def merge(self, other: "StepStats"):
+        for event, count in other.counts.items():
+            self.counts[event] += count
+        self.seconds += other.seconds
+        self.times = [a + b for a, b in zip(self.times, other.times)]
+
+    def median(self):
+        """Верхняя граница корзины, в которую попала медиана; None — ответов нет."""
+        total = sum(self.times)
+        if not total:
+            return None
+        cumulative = 0
+        for bound, count in zip(TIME_BUCKETS + (math.inf,), self.times):
+            cumulative += count
+            if cumulative * 2 >= total:
+                return bound
+        return math.inf
+
+    def to_dict(self) -> dict:
+        return {"counts": self.counts, "seconds": round(self.seconds, 3), "times": self.times}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "StepStats":
+        stats = cls()
+        stats.counts.update(data.get("counts", {}))
+        stats.seconds = data.get("seconds", 0.0)
+        times = data.get("times")
+        if times and len(times) == len(stats.times):
+            stats.times = list(times)
+        return stats
+
+
+class FunnelStats:
+    """Счётчики по шагам: за всё время и по часам за последние WINDOW_HOURS часов."""
+
+    def __init__(self):
+        self.steps = {}  # шаг -> StepStats
+        self.hours = {}  # номер часа от эпохи -> {шаг: {событие: число}}
+        self.since = None  # время первого события
+
+    def apply(self, ts: float, event: str, step: str, seconds=None):
+        if event not in EVENTS:
+            return
+        if self.since is None:
+            self.since = ts
+        stats = self.steps.get(step)
+        if stats is None:
+            stats = self.steps[step] = StepStats()
+        stats.counts[event] += 1
+        # Время на шаге считается по ответам; у /cancel и /start оно только в журнале
+        if event == ANSWER and seconds is not None:
+            stats.seconds += seconds
+            stats.times[bisect_left(TIME_BUCKETS, seconds)] += 1
+
+        hour = int(ts // 3600)
+        window = self.hours.get(hour)
+        if window is None:
+            window = self.hours[hour] = {}
+            # Часы старше окна больше не нужны: словарь не растёт дольше WINDOW_HOURS
+            for old in [h for h in self.hours if h <= hour - WINDOW_HOURS]:
+                del self.hours[old]
+        counts = window.get(step)
+        if counts is None:
+            counts = window[step] = dict.fromkeys(EVENTS, 0)
+        counts[event] += 1
+
+    def merge(self, other: "FunnelStats"):
+        for step, stats in other.steps.items():
+            self.steps.setdefault(step, StepStats()).merge(stats)
+        for hour, window in other.hours.items():
+            mine = self.hours.setdefault(hour, {})
+            for step, counts in window.items():
+                target = mine.setdefault(step, dict.fromkeys(EVENTS, 0))
+                for event, count in counts.items():
+                    target[event] = target.get(event, 0) + count
+        if other.since is not None and (self.since is None or other.since < self.since):
+            self.since = other.since
+
+    def recent(self, now: float = None) -> dict:
+        """{шаг: {событие: число}} за последние WINDOW_HOURS часов."""
+        now = time.time() if now is None else now
+        first = int(now // 3600) - WINDOW_HOURS + 1
+        totals = {}
+        for hour, window in self.hours.items():
+            if hour < first:
+                continue
+            for step, counts in window.items():
+                target = totals.setdefault(step, dict.fromkeys(EVENTS, 0))
+                for event, count in counts.items():
+                    target[event] = target.get(event, 0) + count
+        return totals
+
+    def to_dict(self) -> dict:
+        return {
+            "since": self.since,
+            "steps": {step: stats.to_dict() for step, stats in self.steps.items()},
+            "hours": {str(hour): window for hour, window in self.hours.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FunnelStats":
+        stats = cls()
+        stats.since = data.get("since")
+        stats.steps = {step: StepStats.from_dict(item) for step, item in data.get("steps", {}).items()}
+        stats.hours = {int(hour): window for hour, window in data.get("hours", {}).items()}
+        return stats
+
+
+def _format_seconds(seconds) -> str:
+    if seconds is None:
+        return "—"
+    if seconds == math.inf:
+        return f"> {_format_seconds(TIME_BUCKETS[-1])}"
+    if seconds < 60:
+        return f"{seconds:.0f} с"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} мин"
+    return f"{seconds / 3600:.1f} ч"
+
+
+def _drop(entered: int, answered: int) -> str:
+    return f"{(entered - answered) / entered:.0%}" if entered else "—"
+
+
+def render(stats: FunnelStats, steps, first_step: str, now: float = None) -> str:
+    """Текст для /funnel: шаги в порядке анкеты, уход с каждого шага и время на нём."""
+    started = stats.steps[first_step].counts[ENTER] if first_step in stats.steps else 0
+    done = sum(s.counts[DONE] for s in stats.steps.values())
+    since = time.strftime("%d.%m.%Y %H:%M", time.localtime(stats.since)) if stats.since else "—"
+    recent = stats.recent(now)
+    lines = [
+        f"📉 Воронка анкеты с {since}",
+        f"Начали: {started}, заявок: {done} ({done / started:.0%})" if started else "Событий пока нет.",
+        "",
+        f"шаг: вошли → ответили (ушли), то же за {WINDOW_HOURS} ч; "
+        "медиана / среднее время ответа; ошибки ввода, /cancel, /start",
+    ]
+    for step in steps:
+        item = stats.steps.get(step)
+        if item is None or not item.counts[ENTER]:
+            continue
+        counts = item.counts
+        answered = counts[ANSWER]
+        window = recent.get(step, {})
+        lines.append(
+            f"{step}: {counts[ENTER]} → {answered} ({_drop(counts[ENTER], answered)}), "
+            f"{WINDOW_HOURS} ч: {window.get(ENTER, 0)} → {window.get(ANSWER, 0)} "
+            f"({_drop(window.get(ENTER, 0), window.get(ANSWER, 0))}); "
+            f"{_format_seconds(item.median())} / {_format_seconds(item.seconds / answered if answered else None)}; "
+            f"{counts[INVALID]}, {counts[CANCEL]}, {counts[RESTART]}"
+        )
+    return "\n".join(lines)
+
+
+class FunnelLog:
+    def __init__(
+        self,
+        directory: Path = Path("applications") / "funnel",
+        name: str = "main",
+        checkpoint_interval: float = 30.0,
+        max_queue: int = 10000,
+        enabled: bool = True,
+    ):
+        self.directory = Path(directory)
+        self.name = name
+        self.checkpoint_interval = checkpoint_interval
+        self.enabled = enabled
+        self.counters = FunnelStats()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._offset = 0
+        self.written = 0
+        self.dropped = 0
+
+    @property
+    def log_path(self) -> Path:
+        return self.directory / f"{self.name}.log"
+
+    @property
+    def state_path(self) -> Path:
+        return self.directory / f"{self.name}.state.json"
+
+    def emit(self, event: str, step: str, lead_id=None, seconds: float = None):
+        """Событие перехода; из обработчика, без ожидания диска."""
+        if not self.enabled or self._thread is None:
+            return
+        try:
+            self._queue.put_nowait((time.time(), event, step, lead_id, seconds))
+        except queue.Full:
+            self.dropped += 1
+
+    # ===== Поток-писатель =====
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="funnel", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Дописывает очередь и сохраняет счётчики; блокирует, вызывать через asyncio.to_thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._recover()
+            fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        except OSError as e:
+            logging.error(f"Воронка: не удалось открыть {self.log_path}: {e}")
+            self.enabled = False
+            return
+        checkpoint_at = time.monotonic() + self.checkpoint_interval
+        dirty = False
+        stopping = False
+        try:
+            while not stopping:
+                try:
+                    batch = [self._queue.get(timeout=max(0.0, checkpoint_at - time.monotonic()))]
+                except queue.Empty:
+                    batch = []
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if _STOP in batch:
+                    batch = [event for event in batch if event is not _STOP]
+                    stopping = True
+                if batch:
+                    self._write(fd, batch)
+                    dirty = True
+                if dirty and (stopping or time.monotonic() >= checkpoint_at):
+                    self._checkpoint()
+                    dirty = False
+                if time.monotonic() >= checkpoint_at:
+                    checkpoint_at = time.monotonic() + self.checkpoint_interval
+        finally:
+            os.close(fd)
+
+    def _write(self, fd, batch):
+        data = "".join(
+            f"{ts:.3f}\t{event}\t{step}\t{lead_id or ''}\t{'' if seconds is None else f'{seconds:.3f}'}\n"
+            for ts, event, step, lead_id, seconds in batch
+        ).encode()
+        try:
+            os.write(fd, data)
+        except OSError as e:
+            # Счётчики всё равно обновляются: /funnel важнее полноты журнала
+            logging.error(f"Воронка: ошибка записи в {self.log_path}: {e}")
+        else:
+            self._offset += len(data)
+            self.written += len(batch)
+        with self._lock:
+            for ts, event, step, lead_id, seconds in batch:
+                self.counters.apply(ts, event, step, seconds)
+
+    def _checkpoint(self):
+        with self._lock:
+            data = {"offset": self._offset, "stats": self.counters.to_dict()}
+        tmp_path = self.state_path.with_suffix(".tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logging.error(f"Воронка: не удалось сохранить {self.state_path}: {e}")
+
+    def _recover(self):
+        """Счётчики из снимка плюс хвост журнала после его смещения."""
+        size = self.log_path.stat().st_size if self.log_path.exists() else 0
+        stats, offset = FunnelStats(), 0
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("offset", 0) <= size:
+                stats, offset = FunnelStats.from_dict(data["stats"]), data["offset"]
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Воронка: снимок {self.state_path} не прочитан ({e}), пересчёт по журналу")
+
+        replayed = 0
+        if size > offset:
+            with open(self.log_path, "rb") as f:
+                f.seek(offset)
+                tail = f.read()
+            if not tail.endswith(b"\n"):
+                # Оборванная при падении строка: следующая запись начнётся с новой
+                with open(self.log_path, "ab") as f:
+                    f.write(b"\n")
+                tail += b"\n"
+            for line in tail.decode("utf-8", "replace").splitlines():
+                parts = line.split("\t")
+                if len(parts) != 5:
+                    continue
+                try:
+                    ts, seconds = float(parts[0]), float(parts[4]) if parts[4] else None
+                except ValueError:
+                    continue
+                stats.apply(ts, parts[1], parts[2], seconds)
+                replayed += 1
+            offset += len(tail)
+        with self._lock:
+            self.counters = stats
+            self._offset = offset
+        if replayed:
+            logging.info("Воронка: дочитано событий из журнала: %s", replayed)
+
+    # ===== Отчёт =====
+    def snapshot(self) -> FunnelStats:
+        """Свои счётчики плюс снимки других процессов-обработчиков."""
+        merged = FunnelStats()
+        with self._lock:
+            merged.merge(self.counters)
+        for path in self.directory.glob("*.state.json"):
+            if path == self.state_path:
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    merged.merge(FunnelStats.from_dict(json.load(f)["stats"]))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logging.warning(f"Воронка: снимок {path} не прочитан: {e}")
+        return merged
+
+    def stats(self) -> dict:
+        return {"written": self.written, "dropped": self.dropped, "queued": self._queue.qsize()}
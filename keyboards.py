@@ -0,0 +1,33 @@
+from typing import FrozenSet, NamedTuple, Tuple
+
+from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove
+
+
+# ===== Клавиатуры и допустимые ответы =====
+# Каждый набор вариантов записан один раз: из него один раз собираются
+# и клавиатура, и множество для проверки ответа (варианты анкеты — из
+# questionnaire.json при старте). Объекты Telegram после создания
+# неизменяемы, поэтому обработчики просто переиспользуют их.
+
+
+class Choice(NamedTuple):
+    options: Tuple[str, ...]
+    valid: FrozenSet[str]
+    markup: ReplyKeyboardMarkup
+
+
+def choice(*options: str) -> Choice:
+    return Choice(
+        options,
+        frozenset(options),
+        ReplyKeyboardMarkup(
+            [[option] for option in options],
+            resize_keyboard=True,
+            one_time_keyboard=True,
+        ),
+    )
+
+
+RESTART = choice("🔄 Выбрать ещё один агрегат", "❌ Завершить")
+
+REMOVE = ReplyKeyboardRemove()
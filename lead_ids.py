@@ -0,0 +1,57 @@
+import os
+import threading
+import time
+
+
+# ===== Идентификаторы заявок (ULID) =====
+# 26 символов Crockford base32: 48 бит времени в мс + 80 бит случайности.
+# Строки сортируются по времени создания; внутри одной миллисекунды
+# случайная часть увеличивается на 1, поэтому ID монотонны и не совпадают.
+
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_RANDOM_MAX = (1 << 80) - 1
+
+_lock = threading.Lock()
+_last_ms = -1
+_last_random = 0
+
+
+def _encode(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        chars.append(_ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def new_lead_id() -> str:
+    global _last_ms, _last_random
+
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms <= _last_ms:
+            # Та же (или отставшая) миллисекунда — продолжаем последовательность
+            now_ms = _last_ms
+            if _last_random == _RANDOM_MAX:
+                now_ms += 1
+                _last_random = int.from_bytes(os.urandom(10), "big")
+            else:
+                _last_random += 1
+        else:
+            _last_random = int.from_bytes(os.urandom(10), "big")
+        _last_ms = now_ms
+
+        return _encode(now_ms, 10) + _encode(_last_random, 16)
+
+
+def decode_lead_id(lead_id: str) -> int:
+    """128-битное число ULID; ValueError для строки не из new_lead_id()."""
+    if len(lead_id) != 26:
+        raise ValueError(f"Не ULID: {lead_id!r}")
+    value = 0
+    for char in lead_id:
+        digit = _ALPHABET.find(char)
+        if digit < 0:
+            raise ValueError(f"Не ULID: {lead_id!r}")
+        value = (value << 5) | digit
+    return value
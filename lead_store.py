@@ -0,0 +1,236 @@
+import csv
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+from pathlib import Path
+
+
+# ===== Хранилище лидов (SQLite, WAL) =====
+# Основное хранилище заявок. JSON-файлы и leads.csv остаются
+# необязательными выгрузками (см. LeadWriter).
+
+DEFAULT_DB_PATH = Path("applications") / "leads.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS leads (
+    id INTEGER PRIMARY KEY,
+    lead_id TEXT,
+    timestamp TEXT NOT NULL,
+    client_name TEXT,
+    client_contact TEXT,
+    contact_normalized TEXT,
+    aggregate TEXT,
+    vehicle_info TEXT,
+    engine_volume REAL,
+    oil_volume REAL,
+    total_price_client REAL,
+    profit REAL,
+    dedup_key TEXT UNIQUE,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS leads_timestamp ON leads (timestamp);
+CREATE INDEX IF NOT EXISTS leads_aggregate ON leads (aggregate, timestamp);
+CREATE INDEX IF NOT EXISTS leads_contact ON leads (contact_normalized);
+"""
+
+# База могла быть создана до появления lead_id
+_MIGRATIONS = [
+    ("lead_id", "ALTER TABLE leads ADD COLUMN lead_id TEXT"),
+]
+
+_INDEXES = """
+CREATE UNIQUE INDEX IF NOT EXISTS leads_lead_id ON leads (lead_id);
+"""
+
+_INSERT = """
+INSERT OR IGNORE INTO leads (
+    lead_id, timestamp, client_name, client_contact, contact_normalized, aggregate,
+    vehicle_info, engine_volume, oil_volume, total_price_client, profit,
+    dedup_key, data
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+IMPORT_BATCH_SIZE = 500
+
+
+def normalize_phone(digits: str) -> str:
+    if len(digits) == 11 and digits.startswith("8"):
+        return "7" + digits[1:]
+    if len(digits) == 10:
+        return "7" + digits
+    return digits
+
+
+def normalize_contact(contact) -> str:
+    contact = (contact or "").strip()
+    if contact.startswith("@"):
+        return contact.lower()
+    digits = re.sub(r"\D", "", contact)
+    if len(digits) >= 10:
+        return normalize_phone(digits)
+    return contact.lower()
+
+
+def _optional_float(value):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _dedup_key(application: dict) -> str:
+    # Одна и та же заявка есть и в базе, и в JSON, и в leads.csv. Заявки с lead_id
+    # склеиваем по нему, старые — по секунде создания и контакту
+    if application.get("lead_id"):
+        return application["lead_id"]
+    timestamp = application["timestamp"]
+    return f"{timestamp[:19].replace(' ', 'T')}|{application.get('client_contact') or ''}"
+
+
+def _row(application: dict) -> tuple:
+    return (
+        application.get("lead_id"),
+        application["timestamp"],
+        application.get("client_name"),
+        application.get("client_contact"),
+        normalize_contact(application.get("client_contact")),
+        application.get("aggregate"),
+        application.get("vehicle_info"),
+        _optional_float(application.get("engine_volume")),
+        _optional_float(application.get("oil_volume")),
+        _optional_float(application.get("total_price_client")),
+        _optional_float(application.get("profit")),
+        _dedup_key(application),
+        json.dumps(application, ensure_ascii=False),
+    )
+
+
+class LeadStore:
+    def __init__(self, path: Path = DEFAULT_DB_PATH):
+        self.path = Path(path)
+        self._conn = None
+
+    def connect(self):
+        # Соединение SQLite привязано к потоку: открываем его там, где пишем
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(leads)")}
+            for column, statement in _MIGRATIONS:
+                if column not in columns:
+                    self._conn.execute(statement)
+            self._conn.executescript(_INDEXES)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def insert_many(self, applications):
+        conn = self.connect()
+        with conn:
+            conn.executemany(_INSERT, [_row(application) for application in applications])
+
+    def get(self, lead_id: str):
+        row = self.connect().execute(
+            "SELECT data FROM leads WHERE lead_id = ?", (lead_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find_by_contact(self, contact) -> list:
+        cur = self.connect().execute(
+            "SELECT data FROM leads WHERE contact_normalized = ? ORDER BY timestamp",
+            (normalize_contact(contact),),
+        )
+        return [json.loads(data) for (data,) in cur]
+
+    def count_by_aggregate(self, since: str = "") -> dict:
+        cur = self.connect().execute(
+            "SELECT aggregate, COUNT(*) FROM leads WHERE timestamp >= ? GROUP BY aggregate",
+            (since,),
+        )
+        return dict(cur.fetchall())
+
+    def count(self) -> int:
+        return self.connect().execute("SELECT COUNT(*) FROM leads").fetchone()[0]
+
+
+# ===== Разовый импорт старых заявок =====
+def _iter_json_applications(applications_dir: Path):
+    # И старые файлы в корне папки, и новые в applications/ГГГГ/ММ/ДД/
+    for root, dirs, files in os.walk(applications_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                with open(path, encoding="utf-8") as f:
+                    application = json.load(f)
+            except Exception as e:
+                logging.error(f"Не удалось прочитать {path}: {e}")
+                continue
+            if "timestamp" in application:
+                yield application
+
+
+def _iter_csv_applications(leads_csv_path: Path):
+    with open(leads_csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if not row.get("дата"):
+                continue
+            yield {
+                "lead_id": row.get("id заявки") or None,
+                "timestamp": row["дата"].replace(" ", "T"),
+                "client_name": row.get("имя клиента") or None,
+                "client_contact": row.get("контакт") or None,
+                "aggregate": row.get("агрегат") or None,
+                "vehicle_info": row.get("марка авто") or None,
+                "engine_volume": _optional_float(row.get("объем двигателя")),
+                "oil_volume": _optional_float(row.get("объем масла")),
+                "total_price_client": _optional_float(row.get("итоговая цена")),
+                "profit": _optional_float(row.get("прибыль")),
+            }
+
+
+def import_legacy(applications_dir: Path = Path("applications"), store: LeadStore = None) -> int:
+    """Переносит JSON-заявки и leads*.csv в SQLite; повторный запуск ничего не дублирует."""
+    applications_dir = Path(applications_dir)
+    store = store or LeadStore(applications_dir / DEFAULT_DB_PATH.name)
+    before = store.count()
+
+    sources = [_iter_json_applications(applications_dir)]
+    # CSV после JSON: строки, уже пришедшие из JSON, пропускаются по dedup_key.
+    # leads_<дата>.csv — старые файлы без колонки «id заявки»
+    for leads_csv_path in sorted(applications_dir.glob("leads*.csv")):
+        sources.append(_iter_csv_applications(leads_csv_path))
+
+    for source in sources:
+        batch = []
+        for application in source:
+            batch.append(application)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                store.insert_many(batch)
+                batch = []
+        if batch:
+            store.insert_many(batch)
+
+    return store.count() - before
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2 or sys.argv[1] != "import":
+        print("Использование: python lead_store.py import [папка_с_заявками]")
+        sys.exit(1)
+    imported = import_legacy(Path(sys.argv[2]) if len(sys.argv) > 2 else Path("applications"))
+    logging.info("Импортировано заявок: %s", imported)
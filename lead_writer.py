@@ -0,0 +1,247 @@
+import asyncio
+import csv
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from lead_store import LeadStore
+from tracing import KIND_CLIENT, tracer
+
+
+# ===== Запись заявок на диск =====
+# Хендлер только кладёт заявку в ограниченную очередь. Один поток-писатель
+# забирает всё накопившееся пачкой и вставляет её в SQLite одной транзакцией.
+# JSON-файлы (applications/ГГГГ/ММ/ДД/application_<id>.json) и строки
+# leads.csv — необязательные выгрузки; их файлы сбрасываются через fsync
+# не чаще, чем раз в fsync_interval секунд. У процессов-обработчиков
+# (BOT_WORKERS > 1) свой CSV на каждого: строки и заголовок не перемешиваются.
+
+CSV_HEADERS = [
+    "id заявки",
+    "дата",
+    "имя клиента",
+    "контакт",
+    "агрегат",
+    "марка авто",
+    "объем двигателя",
+    "объем масла",
+    "итоговая цена",
+    "прибыль",
+]
+
+_STOP = object()
+
+
+def csv_row(application: dict) -> dict:
+    engine_volume = application.get("engine_volume")
+    oil_volume = application.get("oil_volume")
+    total_price_client = application.get("total_price_client")
+    profit = application.get("profit")
+    return {
+        "id заявки": application.get("lead_id") or "",
+        "дата": datetime.fromisoformat(application["timestamp"]).isoformat(
+            sep=" ", timespec="seconds"
+        ),
+        "имя клиента": application.get("client_name") or "",
+        "контакт": application.get("client_contact") or "",
+        "агрегат": application.get("aggregate") or "",
+        "марка авто": application.get("vehicle_info") or "",
+        "объем двигателя": engine_volume if engine_volume is not None else "",
+        "объем масла": oil_volume if oil_volume is not None else "",
+        "итоговая цена": f"{total_price_client:.2f}" if total_price_client is not None else "",
+        "прибыль": f"{profit:.2f}" if profit is not None else "",
+    }
+
+
+class LeadWriter:
+    def __init__(
+        self,
+        applications_dir: Path = Path("applications"),
+        max_queue: int = 1000,
+        max_batch: int = 100,
+        fsync_interval: float = 1.0,
+        store: LeadStore = None,
+        export_json: bool = True,
+        export_csv: bool = True,
+        csv_name: str = "leads.csv",
+    ):
+        self.applications_dir = Path(applications_dir)
+        self.csv_name = csv_name
+        self.store = store or LeadStore(self.applications_dir / "leads.sqlite3")
+        self.export_json = export_json
+        self.export_csv = export_csv
+        self.max_batch = max_batch
+        # 0 — fsync после каждой пачки, отрицательное значение — не делать fsync
+        self.fsync_interval = fsync_interval
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._unsynced = []
+        self._csv_checked = False
+        self._last_sync = time.monotonic()
+        self.written = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="lead-writer", daemon=True)
+        self._thread.start()
+
+    async def submit(self, application: dict):
+        """Ставит заявку в очередь; если писатель отстаёт — ждёт место в очереди."""
+        try:
+            self._queue.put_nowait(application)
+        except queue.Full:
+            logging.warning(
+                "Очередь записи заявок заполнена (%s), ожидаем писателя", self.queue_depth
+            )
+            await asyncio.to_thread(self._queue.put, application)
+
+    async def stop(self):
+        if self._thread is None:
+            return
+        await asyncio.to_thread(self._queue.put, _STOP)
+        await asyncio.to_thread(self._thread.join)
+        self._thread = None
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                batch = [self._queue.get(timeout=self._sync_timeout())]
+            except queue.Empty:
+                self._safe_sync()
+                continue
+
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if any(application is _STOP for application in batch):
+                batch = [application for application in batch if application is not _STOP]
+                stopping = True
+
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    logging.error(f"Ошибка при сохранении заявок: {e}")
+
+            if stopping or self._sync_timeout() == 0:
+                self._safe_sync()
+
+        self.store.close()
+
+    def _write_batch(self, batch):
+        started = time.time_ns()
+        error = None
+        try:
+            self.store.insert_many(batch)
+        except Exception as e:
+            error = e
+            logging.error(f"Ошибка при сохранении заявок в базу: {e}")
+        self._trace(batch, "leads.sqlite", started, error)
+
+        if self.export_json or self.export_csv:
+            self.applications_dir.mkdir(exist_ok=True)
+        if self.export_json:
+            started = time.time_ns()
+            self._export_json(batch)
+            self._trace(batch, "leads.json", started)
+        if self.export_csv:
+            started = time.time_ns()
+            self._export_csv(batch)
+            self._trace(batch, "leads.csv", started)
+
+        self.written += len(batch)
+
+    @staticmethod
+    def _trace(batch, name, started, error=None):
+        # Пачка пишется целиком: у каждой заявки в трассе один и тот же отрезок
+        if not tracer.enabled:
+            return
+        ended = time.time_ns()
+        for application in batch:
+            tracer.span(
+                application.get("lead_id"), name, started, ended, {"batch_size": len(batch)}, error, KIND_CLIENT
+            )
+
+    def _export_json(self, batch):
+        for application in batch:
+            created = datetime.fromisoformat(application["timestamp"])
+            shard_dir = self.applications_dir / created.strftime("%Y/%m/%d")
+            try:
+                shard_dir.mkdir(parents=True, exist_ok=True)
+                filename = shard_dir / f"application_{application['lead_id']}.json"
+                with open(filename, "w", encoding="utf-8") as f:
+                    json.dump(application, f, ensure_ascii=False, indent=2)
+                self._unsynced.append(filename)
+            except Exception as e:
+                logging.error(f"Ошибка при сохранении заявки: {e}")
+
+    def _export_csv(self, batch):
+        leads_csv_path = self.applications_dir / self.csv_name
+        if not self._csv_checked:
+            self._rotate_legacy_csv(leads_csv_path)
+            self._csv_checked = True
+
+        file_exists = leads_csv_path.exists()
+        try:
+            with open(leads_csv_path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=CSV_HEADERS)
+                if not file_exists:
+                    writer.writeheader()
+                writer.writerows(csv_row(application) for application in batch)
+            self._unsynced.append(leads_csv_path)
+        except Exception as e:
+            logging.error(f"Ошибка при сохранении лида в CSV: {e}")
+
+    @staticmethod
+    def _rotate_legacy_csv(leads_csv_path: Path):
+        # Старый leads.csv без колонки «id заявки» откладываем в сторону,
+        # чтобы не смешивать строки с разным набором колонок
+        if not leads_csv_path.exists():
+            return
+        with open(leads_csv_path, newline="", encoding="utf-8") as f:
+            header = next(csv.reader(f), [])
+        if header and header != CSV_HEADERS:
+            legacy_path = leads_csv_path.with_name(
+                f"{leads_csv_path.stem}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+            )
+            leads_csv_path.replace(legacy_path)
+            logging.info("Старый %s переименован в %s", leads_csv_path.name, legacy_path.name)
+
+    def _sync_timeout(self):
+        # Сколько можно ждать новых заявок, прежде чем пора делать fsync
+        if self.fsync_interval < 0 or not self._unsynced:
+            return None
+        return max(0.0, self._last_sync + self.fsync_interval - time.monotonic())
+
+    def _safe_sync(self):
+        try:
+            self._sync()
+        except Exception as e:
+            logging.error(f"Ошибка при fsync заявок: {e}")
+
+    def _sync(self):
+        if self.fsync_interval < 0:
+            return
+        for path in dict.fromkeys(self._unsynced):
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self._unsynced.clear()
+        self._last_sync = time.monotonic()
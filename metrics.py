@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import math
+from bisect import bisect_left
+
+
+# ===== Метрики в формате Prometheus =====
+# Гистограммы и счётчики пишутся прямо из горячего пути, поэтому запись
+# дешёвая: корзины гистограммы — заранее выделенный список, наблюдение —
+# bisect по границам и += 1 в ячейку, без новых объектов. Дочерние метрики
+# с метками создаются один раз, и обработчики держат их у себя.
+# Очереди и счётчики, которые модули и так ведут в stats(), читаются только
+# при запросе /metrics (callback) и только из памяти: callback выполняется в
+# цикле событий и не ходит ни в базу, ни на диск. HTTP-сервер — на asyncio,
+# в том же цикле, что и бот: METRICS_PORT=0 — без сервера.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra="") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # последняя ячейка — +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        # le в Prometheus включительно: значение на границе попадает в её корзину
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Дочерняя метрика для значений меток; держите её, а не вызывайте labels() на каждое событие."""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}")
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def samples(self):
+        raise NotImplementedError
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def samples(self):
+        bounds = self.bounds + (math.inf,)
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(bounds, child.counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, values)} {_number(child.sum)}"
+            yield f"{self.name}_count{_labels(self.labelnames, values)} {cumulative}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.value += amount
+
+    def samples(self):
+        for values, child in self._children.items():
+            yield f"{self.name}{_labels(self.labelnames, values)} {_number(child.value)}"
+
+
+class Callback(_Metric):
+    """Значения читаются при запросе: fn() -> число или {значение метки: число}."""
+
+    def __init__(self, name, help, fn, kind="gauge", labelnames=()):
+        self.fn = fn
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        value = self.fn()
+        if not self.labelnames:
+            yield f"{self.name} {_number(value)}"
+            return
+        for label, number in value.items():
+            values = label if isinstance(label, tuple) else (label,)
+            yield f"{self.name}{_labels(self.labelnames, values)} {_number(number)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        # Повторная регистрация (новое приложение в том же процессе) заменяет прежнюю
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                logging.warning("Метрика %s не собрана: %s", metric.name, e)
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+def counter(name, help, labelnames=()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def callback(name, help, fn, kind="gauge", labelnames=()) -> Callback:
+    return REGISTRY.register(Callback(name, help, fn, kind, labelnames))
+
+
+# ===== HTTP: GET /metrics =====
+class MetricsServer:
+    def __init__(self, host: str = "0.0.0.0", port: int = 0, registry: Registry = REGISTRY):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._server = None
+
+    async def start(self):
+        if not self.port or self._server is not None:
+            return
+        try:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        except OSError as e:
+            logging.error("Метрики: не удалось слушать %s:%s: %s", self.host, self.port, e)
+            return
+        logging.info("Метрики: http://%s:%s/metrics", self.host, self.port)
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10)
+            method, path = (head.split(b"\r\n", 1)[0].split(b" ") + [b"", b""])[:2]
+            if method == b"GET" and path.split(b"?", 1)[0] == b"/metrics":
+                status, body = "200 OK", self.registry.render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -1,5 +1,13 @@
-import os
+import hashlib
+import json
 import logging
+import math
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional
 
 
 def _clean_number(env_value: str, default: str) -> float:
@@ -10,32 +18,183 @@ def _clean_number(env_value: str, default: str) -> float:
     return float(env_value)
 
 
-# Цена материалов за мл (можно переопределить в .env)
-RVS_PRICE_PER_ML = _clean_number(os.getenv("RVS_PRICE_PER_ML"), "70")
-ACCEL_PRICE_PER_ML = _clean_number(os.getenv("ACCEL_PRICE_PER_ML"), "30")
-MARKUP_COEF = _clean_number(os.getenv("MARKUP_COEF"), "2.0")
 SHOW_PRICE_TO_CLIENT = os.getenv("SHOW_PRICE_TO_CLIENT", "false").lower() == "true"
 
-# Дозировки по умолчанию (если не заданы во внешней среде)
-RVS_DOSE_ML_PER_L_ENGINE = _clean_number(os.getenv("RVS_DOSE_ML_PER_L_ENGINE"), "10")
-ACCEL_DOSE_ML_PER_L_OIL = _clean_number(os.getenv("ACCEL_DOSE_ML_PER_L_OIL"), "5")
-
-# Базовая работа
-BASE_WORK_COST = {
-    "Двигатель": 3000,   # база без учёта цилиндров
-    "МКПП": 5000,
-    "АКПП": 6000,
-    "Редуктор (мост)": 300,
-    "ГУР": 300,
+# Файл с правилами по агрегатам (и, при желании, ценами — они перекрывают .env).
+# Файл перечитывается не чаще, чем раз в PRICING_RELOAD_INTERVAL секунд, если изменился.
+PRICING_CONFIG_PATH = Path(
+    os.getenv("PRICING_CONFIG_PATH") or Path(__file__).with_name("pricing_rules.json")
+)
+PRICING_RELOAD_INTERVAL = _clean_number(os.getenv("PRICING_RELOAD_INTERVAL"), "5")
+
+
+# ===== Правила по агрегатам =====
+# Правило из файла дополняется секцией "default" и значениями ниже и
+# компилируется в кортеж коэффициентов: расчёт — это поиск в словаре
+# по названию агрегата и арифметика, без цепочек if по названиям.
+
+_RULE_DEFAULTS = {
+    "dose_by_engine_volume": False,  # РВС от объёма двигателя, ускоритель от объёма масла
+    "rvs_ml_per_l_oil": 0,
+    "accel_ml_per_l_oil": 0,
+    "work_base": 0,
+    "work_per_cylinder": None,  # None — работа не зависит от цилиндров
+    "default_cylinders": 4,
+    "work_fixed_by_cylinders": {},
+    "heavy_from_engine_volume_l": math.inf,
+    "heavy_work_coef": 1,
+}
+
+# Дозировки по объёму двигателя по умолчанию берутся из общих настроек
+_ENGINE_DOSE_KEYS = {
+    "rvs_ml_per_l_engine": "rvs_dose_ml_per_l_engine",
+    "accel_ml_per_l_engine_oil": "accel_dose_ml_per_l_oil",
 }
 
-WORK_PER_CYL = 1000  # выкрутить свечу + 2 компрессометра + АГЦ
 
-HEAVY_ENGINE_THRESHOLD_L = 8.0
-HEAVY_ENGINE_COEF = 1.5
+class AggregateRule(NamedTuple):
+    dose_by_engine_volume: bool
+    rvs_ml_per_l_engine: float
+    accel_ml_per_l_engine_oil: float
+    rvs_ml_per_l_oil: float
+    accel_ml_per_l_oil: float
+    work_base: float
+    work_per_cylinder: Optional[float]
+    default_cylinders: int
+    work_fixed_by_cylinders: Mapping[int, float]
+    heavy_from_engine_volume_l: float
+    heavy_work_coef: float
+
+
+@dataclass(frozen=True)
+class PricingConfig:
+    version: str
+    # Цена материалов за мл
+    rvs_price_per_ml: float
+    accel_price_per_ml: float
+    markup_coef: float
+    # Дозировки для агрегатов с dose_by_engine_volume
+    rvs_dose_ml_per_l_engine: float
+    accel_dose_ml_per_l_oil: float
+    # Скомпилированные правила: агрегат -> коэффициенты
+    rules: Mapping[str, AggregateRule]
+    default_rule: AggregateRule
+    # Исходные значения, из которых собран снимок
+    spec: Mapping = field(repr=False, compare=False)
+
+
+def _env_defaults() -> dict:
+    # Значения по умолчанию (можно переопределить в .env)
+    return {
+        "rvs_price_per_ml": _clean_number(os.getenv("RVS_PRICE_PER_ML"), "70"),
+        "accel_price_per_ml": _clean_number(os.getenv("ACCEL_PRICE_PER_ML"), "30"),
+        "markup_coef": _clean_number(os.getenv("MARKUP_COEF"), "2.0"),
+        "rvs_dose_ml_per_l_engine": _clean_number(os.getenv("RVS_DOSE_ML_PER_L_ENGINE"), "10"),
+        "accel_dose_ml_per_l_oil": _clean_number(os.getenv("ACCEL_DOSE_ML_PER_L_OIL"), "5"),
+        "default": {},
+        "aggregates": {},
+    }
+
+
+def _compile_rule(name: str, spec: dict, values: dict) -> AggregateRule:
+    merged = {**_RULE_DEFAULTS, **values["default"], **spec}
+    unknown = set(merged) - set(_RULE_DEFAULTS) - set(_ENGINE_DOSE_KEYS)
+    if unknown:
+        raise ValueError(f"Неизвестные поля в правиле «{name}»: {', '.join(sorted(unknown))}")
+
+    for key, global_key in _ENGINE_DOSE_KEYS.items():
+        merged.setdefault(key, values[global_key])
+    merged["dose_by_engine_volume"] = bool(merged["dose_by_engine_volume"])
+    merged["work_fixed_by_cylinders"] = MappingProxyType(
+        {int(cyl): cost for cyl, cost in merged["work_fixed_by_cylinders"].items()}
+    )
+    return AggregateRule(**merged)
+
+
+def build_pricing_config(values: dict) -> PricingConfig:
+    values = dict(values)
+    version = values.pop("version", None)
+    if not version:
+        fingerprint = json.dumps(values, sort_keys=True, ensure_ascii=False)
+        version = hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()[:12]
+
+    rules = {
+        name: _compile_rule(name, spec, values)
+        for name, spec in values["aggregates"].items()
+    }
+    return PricingConfig(
+        version=str(version),
+        rvs_price_per_ml=values["rvs_price_per_ml"],
+        accel_price_per_ml=values["accel_price_per_ml"],
+        markup_coef=values["markup_coef"],
+        rvs_dose_ml_per_l_engine=values["rvs_dose_ml_per_l_engine"],
+        accel_dose_ml_per_l_oil=values["accel_dose_ml_per_l_oil"],
+        rules=MappingProxyType(rules),
+        default_rule=_compile_rule("default", {}, values),
+        spec=MappingProxyType(values),
+    )
+
+
+def load_pricing_config(path: Path = None) -> PricingConfig:
+    path = PRICING_CONFIG_PATH if path is None else Path(path)
+    values = _env_defaults()
+    values.update(json.loads(path.read_text(encoding="utf-8")))
+    return build_pricing_config(values)
+
+
+def derive_config(config: PricingConfig, **overrides) -> PricingConfig:
+    """Снимок с теми же правилами, но другими общими ценами/дозировками."""
+    return build_pricing_config({**config.spec, **overrides})
+
+
+class _ConfigHolder:
+    def __init__(self, path: Path, reload_interval: float):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.config = load_pricing_config(path)
+        self._stamp = self._file_stamp()
+        self._checked_at = time.monotonic()
+
+    def _file_stamp(self):
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
 
+    def current(self) -> PricingConfig:
+        now = time.monotonic()
+        if now - self._checked_at >= self.reload_interval:
+            self._checked_at = now
+            stamp = self._file_stamp()
+            if stamp != self._stamp:
+                self._stamp = stamp
+                self.reload()
+        return self.config
 
-def calculate_treatment_cost(aggregate, engine_volume=None, oil_volume=None, cylinders=None):
+    def reload(self):
+        try:
+            config = load_pricing_config(self.path)
+        except Exception as e:
+            logging.error(f"Не удалось перечитать цены из {self.path}: {e}")
+            return
+        if config.version != self.config.version:
+            logging.info("Цены обновлены: версия %s -> %s", self.config.version, config.version)
+        # Замена ссылки атомарна: начатые расчёты дорабатывают со старым снимком
+        self.config = config
+
+
+_holder = _ConfigHolder(PRICING_CONFIG_PATH, PRICING_RELOAD_INTERVAL)
+
+
+def current_config() -> PricingConfig:
+    """Текущий снимок цен; файл перепроверяется не чаще раза в PRICING_RELOAD_INTERVAL."""
+    return _holder.current()
+
+
+def calculate_treatment_cost(
+    aggregate, engine_volume=None, oil_volume=None, cylinders=None, config=None
+):
     """
     Возвращает:
     rvs_ml,
@@ -45,59 +204,41 @@ def calculate_treatment_cost(aggregate, engine_volume=None, oil_volume=None, cyl
     work_cost,
     total_price_client,
     profit
-    """
-
-    logging.info(
-        "DEBUG in calc: aggregate=%s, engine_volume=%s, oil_volume=%s, cylinders=%s",
-        aggregate,
-        engine_volume,
-        oil_volume,
-        cylinders,
-    )
 
-    logging.info(
-        "DEBUG pricing env: RVS_PRICE_PER_ML=%s, ACCEL_PRICE_PER_ML=%s, MARKUP_COEF=%s, "
-        "RVS_DOSE_ML_PER_L_ENGINE=%s, ACCEL_DOSE_ML_PER_L_OIL=%s",
-        os.getenv("RVS_PRICE_PER_ML"),
-        os.getenv("ACCEL_PRICE_PER_ML"),
-        os.getenv("MARKUP_COEF"),
-        os.getenv("RVS_DOSE_ML_PER_L_ENGINE"),
-        os.getenv("ACCEL_DOSE_ML_PER_L_OIL"),
-    )
+    config — снимок PricingConfig; по умолчанию берётся current_config().
+    """
+    cfg = config or _holder.current()
+    rule = cfg.rules.get(aggregate, cfg.default_rule)
 
     # --- Материалы ---
     rvs_ml = 0.0
     accel_ml = 0.0
 
-    if aggregate == "Двигатель" and engine_volume and oil_volume:
+    if rule.dose_by_engine_volume and engine_volume and oil_volume:
         # Двигатель: дозировка от объёма двигателя и масла
-        rvs_ml = engine_volume * RVS_DOSE_ML_PER_L_ENGINE
-        accel_ml = oil_volume * ACCEL_DOSE_ML_PER_L_OIL
+        rvs_ml = engine_volume * rule.rvs_ml_per_l_engine
+        accel_ml = oil_volume * rule.accel_ml_per_l_engine_oil
     elif oil_volume:
         # Остальные агрегаты: упрощённая схема от объёма масла
-        rvs_ml = oil_volume * 5
-        accel_ml = oil_volume * 2.5
+        rvs_ml = oil_volume * rule.rvs_ml_per_l_oil
+        accel_ml = oil_volume * rule.accel_ml_per_l_oil
 
-    material_cost = rvs_ml * RVS_PRICE_PER_ML + accel_ml * ACCEL_PRICE_PER_ML
+    material_cost = rvs_ml * cfg.rvs_price_per_ml + accel_ml * cfg.accel_price_per_ml
 
     # --- Работа ---
-    base_work = BASE_WORK_COST.get(aggregate, 0)
-
-    if aggregate == "Двигатель":
-        cyl = cylinders or 4
+    work_cost = rule.work_base
 
-        if cyl == 2:
-            work_cost = 3000
-        else:
-            work_cost = base_work + WORK_PER_CYL * cyl
-    else:
-        work_cost = base_work
+    if rule.work_per_cylinder is not None:
+        cyl = cylinders or rule.default_cylinders
+        work_cost = rule.work_fixed_by_cylinders.get(cyl)
+        if work_cost is None:
+            work_cost = rule.work_base + rule.work_per_cylinder * cyl
 
-    if aggregate == "Двигатель" and engine_volume and engine_volume >= HEAVY_ENGINE_THRESHOLD_L:
-        work_cost *= HEAVY_ENGINE_COEF
+    if engine_volume and engine_volume >= rule.heavy_from_engine_volume_l:
+        work_cost *= rule.heavy_work_coef
 
     # --- Итог ---
-    material_price_client = material_cost * MARKUP_COEF
+    material_price_client = material_cost * cfg.markup_coef
     total_price_client = material_price_client + work_cost
     profit = total_price_client - (material_cost + work_cost)
 
@@ -0,0 +1,226 @@
+import numpy as np
+
+import pricing
+
+
+# ===== Пакетный расчёт стоимости =====
+# Те же правила агрегатов, что и в pricing.calculate_treatment_cost, но над
+# столбцами NumPy: дозировка по объёму двигателя, работа по цилиндрам,
+# фиксированные цены и надбавка за тяжёлый двигатель считаются масками.
+# Результаты совпадают со скалярной функцией.
+
+RESULT_FIELDS = (
+    "rvs_ml",
+    "accel_ml",
+    "material_cost",
+    "material_price_client",
+    "work_cost",
+    "total_price_client",
+    "profit",
+)
+
+_INPUT_FIELDS = ("aggregate", "engine_volume", "oil_volume", "cylinders")
+
+# Пачка считается блоками по столько строк: промежуточные массивы блока
+# остаются в кэше процессора, а не гоняются через память на каждой операции
+_BLOCK_ROWS = 16384
+
+
+def _as_float(values, size):
+    if values is None:
+        return np.full(size, np.nan)
+    if isinstance(values, np.ndarray) and values.dtype.kind == "f":
+        return values.astype(np.float64, copy=False)
+    # None (нет значения) превращаем в NaN
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def _truthy(values):
+    # Аналог `if value:` для float-столбца, где NaN означает None
+    return ~np.isnan(values) & (values != 0)
+
+
+def records_to_columns(records) -> dict:
+    """Список словарей заявок -> столбцы для calculate_treatment_cost_batch."""
+    return {field: [record.get(field) for record in records] for field in _INPUT_FIELDS}
+
+
+def factorize(values):
+    """Столбец названий -> (коды, названия), как np.unique(..., return_inverse=True).
+
+    Коды можно хранить вместо строк и передавать в calculate_treatment_cost_batch
+    вместе с categories: тогда строки при расчёте не сравниваются вовсе.
+    """
+    categories, codes = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    return codes.reshape(-1), categories
+
+
+def _rule_codes(aggregate, categories, cfg):
+    """
+    Номера правил для столбца агрегатов: функция «срез строк -> коды».
+    Код 0 — правило по умолчанию, 1..N — правила cfg.rules по порядку.
+    """
+    index = {name: code for code, name in enumerate(cfg.rules, 1)}
+    if categories is not None:
+        # Правило ищется для каждого названия один раз, по строкам — только take
+        by_category = np.array([index.get(name, 0) for name in categories], dtype=np.intp)
+        aggregate = np.asarray(aggregate, dtype=np.intp)
+        return lambda block: by_category.take(aggregate[block])
+
+    aggregate = np.ascontiguousarray(aggregate, dtype=str)
+    width = aggregate.dtype.itemsize // 4
+    # Название длиннее ширины столбца в нём не встретится (а обрезанное дало бы
+    # ложное совпадение), поэтому такие правила не ищутся вовсе
+    by_first = {}
+    for name, code in index.items():
+        if len(name) <= width:
+            by_first.setdefault(ord(name[0]) if name else 0, []).append(code)
+
+    if width and all(len(codes) == 1 for codes in by_first.values()):
+        # Кандидат — правило с той же первой буквой: буква берётся из UTF-32
+        # столбца одним take, строка сверяется только с названием кандидата.
+        # Так выходит одно сравнение строк на строку вместо одного на правило
+        letters = aggregate.view(np.uint32)[::width]
+        by_letter = np.zeros(max(by_first, default=0) + 2, dtype=np.intp)
+        for letter, (code,) in by_first.items():
+            by_letter[letter] = code
+        names = np.array([""] + list(cfg.rules), dtype=aggregate.dtype)
+
+        def codes(block):
+            # Буквы за пределами таблицы попадают на её последний, нулевой элемент
+            candidates = by_letter.take(letters[block], mode="clip")
+            return candidates * (aggregate[block] == names.take(candidates))
+
+        return codes
+
+    # Первые буквы совпадают — сравнение со столбцом на каждое правило
+    def codes(block):
+        names = aggregate[block]
+        result = np.zeros(names.shape[0], dtype=np.intp)
+        for name, code in index.items():
+            np.copyto(result, code, where=names == name)
+        return result
+
+    return codes
+
+
+def _spread(values, codes):
+    """Параметр правил по строкам; одинаковый у всех правил — скаляр, без прохода по столбцу."""
+    if (values == values[0]).all():
+        return values[0]
+    # Коды заведомо в диапазоне — take без проверки границ
+    return values.take(codes, mode="clip")
+
+
+def calculate_treatment_cost_batch(
+    aggregate, engine_volume=None, oil_volume=None, cylinders=None, config=None, categories=None
+):
+    """
+    Принимает столбцы (массивы NumPy или списки одинаковой длины) и
+    возвращает словарь массивов float64 с ключами из RESULT_FIELDS.
+    Вся пачка считается по одному снимку цен (config или current_config()).
+    С categories столбец aggregate — целые коды названий (см. factorize).
+    """
+    cfg = config or pricing.current_config()
+    rules = [cfg.default_rule] + list(cfg.rules.values())
+    codes_of = _rule_codes(aggregate, categories, cfg)
+    size = len(aggregate)
+    engine_volume = _as_float(engine_volume, size)
+    oil_volume = _as_float(oil_volume, size)
+    cylinders = _as_float(cylinders, size)
+
+    # Коэффициенты правил — таблица «параметр × правило», по строкам её
+    # раскладывает _spread; дальше только арифметика над столбцами
+    table = np.array(
+        [
+            [
+                rule.dose_by_engine_volume,
+                rule.rvs_ml_per_l_engine,
+                rule.accel_ml_per_l_engine_oil,
+                rule.rvs_ml_per_l_oil,
+                rule.accel_ml_per_l_oil,
+                rule.work_base,
+                # Без работы по цилиндрам base + 0 * cyl == base
+                rule.work_per_cylinder or 0.0,
+                rule.default_cylinders,
+                rule.heavy_from_engine_volume_l,
+                rule.heavy_work_coef,
+            ]
+            for rule in rules
+        ],
+        dtype=np.float64,
+    ).T.copy()
+    fixed_costs = [
+        (code, fixed_cyl, float(cost))
+        for code, rule in enumerate(rules)
+        if rule.work_per_cylinder is not None
+        for fixed_cyl, cost in rule.work_fixed_by_cylinders.items()
+    ]
+
+    result = {field: np.empty(size) for field in RESULT_FIELDS}
+    for start in range(0, size, _BLOCK_ROWS):
+        block = slice(start, start + _BLOCK_ROWS)
+        _calculate_block(
+            cfg,
+            table,
+            fixed_costs,
+            codes_of(block),
+            engine_volume[block],
+            oil_volume[block],
+            cylinders[block],
+            {field: column[block] for field, column in result.items()},
+        )
+    return result
+
+
+def _calculate_block(cfg, table, fixed_costs, codes, engine_volume, oil_volume, cylinders, out):
+    """Считает один блок строк прямо в срезы выходных столбцов out."""
+    (
+        dose_by_engine_volume,
+        rvs_per_engine,
+        accel_per_engine_oil,
+        rvs_per_oil,
+        accel_per_oil,
+        work_base,
+        work_per_cylinder,
+        default_cylinders,
+        heavy_from,
+        heavy_coef,
+    ) = (_spread(row, codes) for row in table)
+
+    has_engine_volume = _truthy(engine_volume)
+    has_oil_volume = _truthy(oil_volume)
+    # Нет объёма масла (NaN) — материалов 0, как в ветке `elif oil_volume`
+    oil = np.where(has_oil_volume, oil_volume, 0.0)
+
+    # --- Материалы ---
+    engine_doses = (dose_by_engine_volume != 0) & has_engine_volume & has_oil_volume
+    rvs_ml = out["rvs_ml"]
+    np.multiply(oil, rvs_per_oil, out=rvs_ml)
+    np.multiply(engine_volume, rvs_per_engine, out=rvs_ml, where=engine_doses)
+    accel_ml = out["accel_ml"]
+    np.multiply(oil, np.where(engine_doses, accel_per_engine_oil, accel_per_oil), out=accel_ml)
+
+    material_cost = out["material_cost"]
+    np.multiply(rvs_ml, cfg.rvs_price_per_ml, out=material_cost)
+    material_cost += accel_ml * cfg.accel_price_per_ml
+
+    # --- Работа ---
+    cyl = np.where(_truthy(cylinders), cylinders, default_cylinders)
+    work_cost = out["work_cost"]
+    np.multiply(work_per_cylinder, cyl, out=work_cost)
+    np.add(work_base, work_cost, out=work_cost)
+
+    # Фиксированная стоимость работы для отдельных чисел цилиндров
+    for code, fixed_cyl, cost in fixed_costs:
+        np.copyto(work_cost, cost, where=(codes == code) & (cyl == fixed_cyl))
+
+    # NaN (нет объёма) >= порога даёт False, как и `if engine_volume` в скалярной версии
+    with np.errstate(invalid="ignore"):
+        heavy = has_engine_volume & (engine_volume >= heavy_from)
+    np.multiply(work_cost, heavy_coef, out=work_cost, where=heavy)
+
+    # --- Итог ---
+    np.multiply(material_cost, cfg.markup_coef, out=out["material_price_client"])
+    np.add(out["material_price_client"], work_cost, out=out["total_price_client"])
+    np.subtract(out["total_price_client"], material_cost + work_cost, out=out["profit"])
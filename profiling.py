@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+
+import metrics
+
+
+# ===== Задержки цикла событий и профилировщик =====
+# Блокирующий вызов в обработчике (чтение файла, SQLite, тяжёлый расчёт)
+# останавливает ответы всем клиентам сразу. LoopLagMonitor: задача в цикле
+# отмечается раз в interval секунд, а сторожевой поток, увидев, что отметки
+# нет дольше threshold, снимает стек потока цикла — это и есть виновник.
+# Стек пишется в лог и хранится в последних keep зависаниях.
+#
+# sample_stacks() раз в 1/hz секунды снимает стеки всех потоков и
+# возвращает их в формате collapsed stacks («кадр;кадр;… число»): его
+# принимают flamegraph.pl, speedscope и inferno. MemoryTracer — снимки
+# tracemalloc для /memory.
+
+LAG_SECONDS = metrics.histogram(
+    "bot_loop_lag_seconds",
+    "Опоздание отметки цикла событий относительно расписания",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+STALLS = metrics.counter("bot_loop_stalls_total", "Зависания цикла событий дольше порога")
+
+
+def _code_name(code) -> str:
+    # co_qualname (Класс.метод) есть только с Python 3.11
+    return getattr(code, "co_qualname", code.co_name)
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{_code_name(code)}"
+
+
+def collapse(frame) -> str:
+    """Стек от корня к листу через «;» — одна строка collapsed stacks."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def format_stack(frame) -> str:
+    lines = []
+    while frame is not None:
+        code = frame.f_code
+        lines.append(f'  File "{code.co_filename}", line {frame.f_lineno}, in {_code_name(code)}')
+        frame = frame.f_back
+    return "\n".join(reversed(lines))
+
+
+class LoopLagMonitor:
+    def __init__(self, threshold: float = 0.1, interval: float = 0.05, keep: int = 20):
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls = deque(maxlen=keep)  # (time.time(), секунды, стек)
+        self.stall_count = 0
+        self.max_lag = 0.0
+        self._beat = 0.0
+        self._loop_thread = None
+        self._task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self.threshold <= 0 or self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await asyncio.to_thread(self._watchdog.join)
+        self._watchdog = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            LAG_SECONDS.observe(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+            self._beat = now
+
+    def _watch(self):
+        stalled_since = None
+        stack = None
+        while not self._stopped.wait(self.threshold / 4):
+            beat = self._beat
+            silent = time.monotonic() - beat
+            if stalled_since is None and silent > self.threshold:
+                frame = sys._current_frames().get(self._loop_thread)
+                stack = format_stack(frame) if frame is not None else "(стек недоступен)"
+                stalled_since = beat
+                STALLS.inc()
+                self.stall_count += 1
+                logging.warning(
+                    "Цикл событий заблокирован дольше %.0f мс, стек потока цикла:\n%s",
+                    self.threshold * 1000,
+                    stack,
+                )
+            elif stalled_since is not None and beat != stalled_since:
+                duration = beat - stalled_since
+                self.stalls.append((time.time(), duration, stack))
+                logging.warning("Цикл событий был заблокирован %.0f мс", duration * 1000)
+                stalled_since = stack = None
+
+    def stats(self) -> dict:
+        return {
+            "threshold_ms": round(self.threshold * 1000),
+            "stalls": self.stall_count,
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+        }
+
+
+def sample_stacks(seconds: float, hz: float = 100.0) -> str:
+    """Снимает стеки всех потоков seconds секунд; блокирует — вызывать из отдельного потока."""
+    me = threading.get_ident()
+    names = {}
+    samples = Counter()
+    period = 1.0 / hz
+    deadline = time.monotonic() + seconds
+    next_at = time.monotonic()
+    while next_at < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            name = names.get(ident)
+            if name is None:
+                names.update((t.ident, t.name) for t in threading.enumerate())
+                name = names.get(ident, str(ident))
+            # Поток — корень: flamegraph разводит цикл событий и фоновые потоки
+            samples[f"{name};{collapse(frame)}"] += 1
+        next_at += period
+        time.sleep(max(0.0, next_at - time.monotonic()))
+    return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+
+# ===== Память: снимки tracemalloc =====
+# tracemalloc замедляет каждое выделение памяти, поэтому по умолчанию
+# выключен и включается первым /memory (или сразу при запуске, если задан
+# MEMORY_TRACE_FRAMES). Отчёт — крупнейшие места выделения и прирост с
+# прошлого снимка.
+
+
+def format_size(size: float) -> str:
+    sign = "-" if size < 0 else ""
+    size = abs(size)
+    for unit in ("Б", "КиБ", "МиБ"):
+        if size < 1024:
+            return f"{sign}{size:.0f} {unit}" if unit == "Б" else f"{sign}{size:.1f} {unit}"
+        size /= 1024
+    return f"{sign}{size:.1f} ГиБ"
+
+
+def rss_bytes() -> int:
+    """Резидентная память процесса (Linux; 0, если /proc недоступен)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class MemoryTracer:
+    def __init__(self, frames: int = 1):
+        self.frames = max(1, frames)
+        self._previous = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self._previous = None
+
+    def stop(self):
+        tracemalloc.stop()
+        self._previous = None
+
+    def report(self, limit: int = 10) -> str:
+        """Крупнейшие места выделения и прирост с прошлого вызова."""
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+                tracemalloc.Filter(False, "<unknown>"),
+            )
+        )
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Отслеживается: {format_size(current)} (пик {format_size(peak)})", "", "Больше всего занято:"]
+        for i, stat in enumerate(snapshot.statistics("lineno")[:limit], 1):
+            lines.append(f"{i}. {format_size(stat.size)}, {stat.count} блоков — {_site(stat.traceback)}")
+
+        if self._previous is not None:
+            lines += ["", "Прирост с прошлого снимка:"]
+            diff = [d for d in snapshot.compare_to(self._previous, "lineno") if d.size_diff]
+            for stat in diff[:limit]:
+                sign = "+" if stat.size_diff > 0 else ""
+                lines.append(
+                    f"{sign}{format_size(stat.size_diff)} ({stat.count_diff:+d} блоков) — {_site(stat.traceback)}"
+                )
+            if not diff:
+                lines.append("нет")
+        self._previous = snapshot
+        return "\n".join(lines)
+
+
+def deep_sizeof(obj, _seen=None) -> int:
+    """Оценка размера объекта вместе с вложенными словарями, списками и строками."""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+def _site(traceback) -> str:
+    frame = traceback[0]
+    return f"{os.path.basename(frame.filename)}:{frame.lineno}"
@@ -0,0 +1,236 @@
+import json
+import os
+import re
+from pathlib import Path
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional, Tuple
+
+import keyboards
+from session import Session
+
+
+# ===== Анкета как таблица состояний =====
+# Вопросы, варианты ответов, диапазоны и переходы описаны в
+# questionnaire.json. При старте описание проверяется и собирается в
+# словари шагов: обработчику сообщения остаётся найти шаг по имени,
+# разобрать ответ и взять следующий шаг по ответу — без цепочек if.
+
+QUESTIONNAIRE_PATH = Path(
+    os.getenv("QUESTIONNAIRE_PATH") or Path(__file__).with_name("questionnaire.json")
+)
+
+
+class InvalidAnswer(ValueError):
+    def __init__(self, message: str, markup=None):
+        super().__init__(message)
+        self.message = message
+        self.markup = markup
+
+
+class Step:
+    """Скомпилированный шаг анкеты (__slots__ — быстрый доступ к полям в обработчике)."""
+
+    __slots__ = (
+        "name",
+        "field",
+        "question",
+        "markup",
+        "parse",
+        "action",
+        "next_steps",
+        "default_step",
+    )
+
+    def __init__(self, name, field, question, markup, parse, action):
+        self.name = name
+        self.field = field  # поле Session, куда сохраняется ответ
+        self.question = question
+        self.markup = markup  # клавиатура вопроса (или ReplyKeyboardRemove, или None)
+        self.parse = parse  # текст -> значение или InvalidAnswer
+        self.action = action  # действие после ответа (расчёт, отправка заявки)
+        # Переходы сразу на объекты шагов (связывает compile_questionnaire):
+        # обработчику не нужно искать следующий шаг по имени
+        self.next_steps = {}  # ответ -> следующий шаг
+        self.default_step = None  # None — последний шаг анкеты
+
+    def __repr__(self):
+        return f"Step({self.name!r})"
+
+
+class Conclusion(NamedTuple):
+    not_recommended_if: Tuple[Tuple[Tuple[str, str], ...], ...]
+    not_recommended: str
+    recommended: str
+
+    def text(self, session) -> str:
+        for rule in self.not_recommended_if:
+            if all(session.get(field) == value for field, value in rule):
+                return self.not_recommended
+        return self.recommended
+
+
+class Questionnaire(NamedTuple):
+    first_step: str
+    steps: Mapping[str, Step]
+    conclusion: Conclusion
+
+
+# ===== Разбор ответов =====
+def _options_parser(choice: keyboards.Choice, message: str):
+    def parse(text):
+        if text not in choice.valid:
+            raise InvalidAnswer(message, choice.markup)
+        return text
+
+    return parse
+
+
+def _number_parser(spec: dict):
+    low, high = spec["min"], spec["max"]
+    error = spec["error"]
+
+    def parse(text):
+        try:
+            value = float(text.strip().replace(",", "."))
+        except ValueError:
+            raise InvalidAnswer(error) from None
+        if value < low or value > high:
+            raise InvalidAnswer(error)
+        return value
+
+    return parse
+
+
+def _integer_parser(spec: dict):
+    low, high = spec["min"], spec["max"]
+    error = spec["error"]
+    range_error = spec.get("range_error", error)
+
+    def parse(text):
+        text = text.strip()
+        if not text.isdigit():
+            raise InvalidAnswer(error)
+        value = int(text)
+        if value < low or value > high:
+            raise InvalidAnswer(range_error)
+        return value
+
+    return parse
+
+
+def _text_parser(spec: dict):
+    min_length = spec.get("min_length", 1)
+    error = spec["error"]
+
+    def parse(text):
+        text = text.strip()
+        if len(text) < min_length:
+            raise InvalidAnswer(error)
+        return text
+
+    return parse
+
+
+def is_phone(contact: str) -> bool:
+    # пропускаем любые нормальные номера
+    return len(re.sub(r"\D", "", contact)) >= 10
+
+
+def _contact_parser(spec: dict):
+    error = spec["error"]
+
+    def parse(text):
+        contact = text.strip()
+        is_username = contact.startswith("@") and len(contact) >= 5
+        if not (is_phone(contact) or is_username):
+            raise InvalidAnswer(error)
+        return contact
+
+    return parse
+
+
+_INPUT_PARSERS = {
+    "number": _number_parser,
+    "integer": _integer_parser,
+    "text": _text_parser,
+    "contact": _contact_parser,
+}
+
+
+# ===== Сборка описания =====
+def _compile_step(name: str, spec: dict, definition: dict, actions) -> Tuple[Step, dict, Optional[str]]:
+    field = spec["field"]
+    if field not in Session.FIELDS:
+        raise ValueError(f"Шаг «{name}»: поля «{field}» нет в Session")
+    if spec.get("action") and spec["action"] not in actions:
+        raise ValueError(f"Шаг «{name}»: неизвестное действие «{spec['action']}»")
+
+    if "options" in spec:
+        choice = keyboards.choice(*spec["options"])
+        markup = choice.markup
+        parse = _options_parser(choice, definition["choose_from_keyboard"])
+    else:
+        markup = keyboards.REMOVE if spec.get("remove_keyboard") else None
+        input_spec = spec["input"]
+        if input_spec["type"] not in _INPUT_PARSERS:
+            raise ValueError(f"Шаг «{name}»: неизвестный тип ответа «{input_spec['type']}»")
+        parse = _INPUT_PARSERS[input_spec["type"]](input_spec)
+
+    # "next": "шаг" или {"ответ": "шаг", "*": "шаг по умолчанию"}
+    next_spec = spec.get("next")
+    if isinstance(next_spec, dict):
+        transitions = {answer: step for answer, step in next_spec.items() if answer != "*"}
+        default_next = next_spec.get("*")
+        unknown = set(transitions) - set(spec.get("options", ()))
+        if unknown:
+            raise ValueError(f"Шаг «{name}»: переходы по несуществующим ответам: {', '.join(unknown)}")
+    else:
+        transitions = {}
+        default_next = next_spec
+
+    targets = set(transitions.values()) | {default_next}
+    missing = targets - set(definition["steps"]) - {None}
+    if missing:
+        raise ValueError(f"Шаг «{name}»: переход на несуществующий шаг: {', '.join(missing)}")
+
+    step = Step(
+        name=name,
+        field=field,
+        question=spec["question"],
+        markup=markup,
+        parse=parse,
+        action=spec.get("action"),
+    )
+    # Переходы по именам; на объекты шагов их переводит compile_questionnaire
+    return step, transitions, default_next
+
+
+def compile_questionnaire(definition: dict, actions=()) -> Questionnaire:
+    compiled = {
+        name: _compile_step(name, spec, definition, actions)
+        for name, spec in definition["steps"].items()
+    }
+    steps = {name: step for name, (step, _, _) in compiled.items()}
+    if definition["first_step"] not in steps:
+        raise ValueError(f"Нет первого шага «{definition['first_step']}»")
+    for step, transitions, default_next in compiled.values():
+        step.next_steps = MappingProxyType({value: steps[name] for value, name in transitions.items()})
+        step.default_step = steps.get(default_next)
+
+    conclusion = definition["conclusion"]
+    return Questionnaire(
+        first_step=definition["first_step"],
+        steps=MappingProxyType(steps),
+        conclusion=Conclusion(
+            not_recommended_if=tuple(
+                tuple(rule.items()) for rule in conclusion["not_recommended_if"]
+            ),
+            not_recommended=conclusion["not_recommended"],
+            recommended=conclusion["recommended"],
+        ),
+    )
+
+
+def load_questionnaire(path: Path = None, actions=()) -> Questionnaire:
+    path = QUESTIONNAIRE_PATH if path is None else Path(path)
+    return compile_questionnaire(json.loads(path.read_text(encoding="utf-8")), actions)
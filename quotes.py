@@ -0,0 +1,167 @@
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from pricing import PricingConfig, calculate_treatment_cost, current_config
+
+
+# ===== Готовые расчёты (цифры + тексты) и их кеш =====
+# Одинаковые параметры (1.6 л, 4 цилиндра, 4 л масла и т.п.) встречаются
+# постоянно, поэтому расчёт и тексты для клиента и карточки собираются один
+# раз на (агрегат, объёмы, цилиндры, версия цен) и берутся из LRU-кеша.
+
+
+class Quote(NamedTuple):
+    rvs_ml: float
+    accel_ml: float
+    material_cost: float
+    material_price_client: float
+    work_cost: float
+    total_price_client: float
+    profit: float
+    pricing_version: str
+    printable_quote: str  # текст для клиента (для печати/копирования)
+    card_block: str  # блок «Материалы / Финансы / Текст для клиента» для карточки
+
+
+def build_quote(aggregate, engine_volume, oil_volume, cylinders, config: PricingConfig) -> Quote:
+    (
+        rvs_ml,
+        accel_ml,
+        material_cost,
+        material_price_client,
+        work_cost,
+        total_price_client,
+        profit,
+    ) = calculate_treatment_cost(
+        aggregate=aggregate,
+        engine_volume=engine_volume,
+        oil_volume=oil_volume,
+        cylinders=cylinders,
+        config=config,
+    )
+
+    printable_quote = (
+        "Предварительный расчёт стоимости обработки NANOREM:\n\n"
+        f"Материалы: {material_price_client:.2f} руб.\n"
+        f"Работа: {work_cost:.2f} руб.\n"
+        f"ИТОГО: {total_price_client:.2f} руб.\n\n"
+        "Расчёт предварительный, окончательная стоимость может быть скорректирована "
+        "по результатам диагностики и осмотра."
+    )
+
+    card_block = "\n".join(
+        [
+            "",
+            "🧪 Материалы:",
+            f" • РВС: {rvs_ml:.1f} мл",
+            f" • Ускоритель: {accel_ml:.1f} мл",
+            "",
+            "💰 Финансы:",
+            f" • Себестоимость материалов: {material_cost:.2f} руб.",
+            f" • Цена материалов для клиента: {material_price_client:.2f} руб.",
+            f" • Работа: {work_cost:.2f} руб.",
+            f" • ИТОГО для клиента: {total_price_client:.2f} руб.",
+            f" • Чистая прибыль: {profit:.2f} руб.",
+            "",
+            "📄 Текст для клиента:",
+            printable_quote,
+        ]
+    )
+
+    return Quote(
+        rvs_ml,
+        accel_ml,
+        material_cost,
+        material_price_client,
+        work_cost,
+        total_price_client,
+        profit,
+        config.version,
+        printable_quote,
+        card_block,
+    )
+
+
+class QuoteCache:
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._quotes = OrderedDict()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._quotes)
+
+    def get(self, aggregate, engine_volume, oil_volume, cylinders, config: PricingConfig = None) -> Quote:
+        config = config or current_config()
+        if config.version != self._version:
+            # Цены поменялись — старые расчёты больше не нужны
+            self._quotes.clear()
+            self._version = config.version
+
+        key = (aggregate, engine_volume, oil_volume, cylinders, config.version)
+        quote = self._quotes.get(key)
+        if quote is not None:
+            self.hits += 1
+            self._quotes.move_to_end(key)
+            return quote
+
+        self.misses += 1
+        quote = build_quote(aggregate, engine_volume, oil_volume, cylinders, config)
+        self._quotes[key] = quote
+        if len(self._quotes) > self.maxsize:
+            self._quotes.popitem(last=False)
+        return quote
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._quotes),
+            "hits": self.hits,
+            "misses": self.misses,
+            "version": self._version,
+        }
+
+
+def render_admin_card(application: dict, quote: Optional[Quote]) -> str:
+    aggregate = application.get("aggregate")
+    card_lines = [
+        "📝 Новая заявка от клиента",
+        f"🆔 {application.get('lead_id')}",
+        "",
+        f"👤 Ф.И.О.: {application.get('client_name') or '-'}",
+        f"📞 Контакт: {application.get('client_contact') or '-'}",
+        f"🔧 Агрегат: {aggregate}",
+    ]
+
+    vehicle_info = application.get("vehicle_info")
+    if vehicle_info:
+        card_lines.append(f"🚗 ТС: {vehicle_info}")
+
+    card_lines.append("")
+
+    if application.get("engine_volume") is not None:
+        card_lines.append(f"⚙️ Объём двигателя: {application['engine_volume']} л")
+    if application.get("oil_volume") is not None:
+        card_lines.append(f"🛢️ Объём масла: {application['oil_volume']} л")
+
+    if aggregate == "Двигатель":
+        if application.get("overheat"):
+            card_lines.append(f"🌡️ Перегрев: {application['overheat']}")
+        if application.get("repair"):
+            card_lines.append(f"🔨 Ремонт: {application['repair']}")
+        if application.get("oil_consumption"):
+            card_lines.append(f"📊 Расход масла: {application['oil_consumption']}")
+        if application.get("smoke"):
+            card_lines.append(f"💨 Дым: {application['smoke']}")
+    else:
+        if application.get("no_oil"):
+            card_lines.append(f"⛽ Езда без масла: {application['no_oil']}")
+        if application.get("symptoms"):
+            card_lines.append(f"🔊 Симптомы: {application['symptoms']}")
+
+    # Блок материалов и финансов собран заранее вместе с расчётом
+    if quote is not None:
+        card_lines.append(quote.card_block)
+
+    return "\n".join(card_lines)
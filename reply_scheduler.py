@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from telegram.constants import ChatAction
+
+
+# ===== Отложенная отправка ответов =====
+# Хендлер не ждёт REPLY_DELAY_SECONDS сам: он ставит ответ в очередь чата
+# и сразу возвращает следующее состояние диалога. Пользователь по-прежнему
+# видит «печатает…» и ответ через заданную паузу.
+
+
+class ReplyScheduler:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._queues = {}  # chat_id -> deque[(due, message, text, kwargs, on_sent, queued_ns)]
+        self._workers = {}  # chat_id -> asyncio.Task
+
+    @property
+    def pending(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def reply(self, message, text: str, on_sent=None, **kwargs):
+        """Ставит ответ на сообщение в очередь; ответы одного чата уходят по порядку.
+
+        on_sent(queued_ns, sent_ns) вызывается после успешной отправки (трассировка).
+        """
+        loop = asyncio.get_running_loop()
+        chat_id = message.chat_id
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+        queue.append((loop.time() + self.delay, message, text, kwargs, on_sent, time.time_ns()))
+
+        if chat_id not in self._workers:
+            self._workers[chat_id] = loop.create_task(self._drain(chat_id))
+
+    async def _drain(self, chat_id):
+        queue = self._queues[chat_id]
+        loop = asyncio.get_running_loop()
+        typing_sent = False
+        try:
+            while queue:
+                due, message, text, kwargs, on_sent, queued_ns = queue[0]
+                wait = due - loop.time()
+                if wait > 0:
+                    if not typing_sent:
+                        await self._send_typing(message)
+                        typing_sent = True
+                    await asyncio.sleep(wait)
+                queue.popleft()
+                try:
+                    await message.reply_text(text, **kwargs)
+                except Exception as e:
+                    logging.error(f"Ошибка при отправке ответа в чат {chat_id}: {e}")
+                else:
+                    if on_sent is not None:
+                        on_sent(queued_ns, time.time_ns())
+                typing_sent = False
+        finally:
+            self._workers.pop(chat_id, None)
+            if not queue:
+                self._queues.pop(chat_id, None)
+
+    @staticmethod
+    async def _send_typing(message):
+        try:
+            await message.get_bot().send_chat_action(
+                chat_id=message.chat_id,
+                action=ChatAction.TYPING,
+            )
+        except Exception as e:
+            logging.warning(f"Не удалось отправить «печатает…» в чат {message.chat_id}: {e}")
+
+    async def flush(self):
+        """Дожидается отправки всех запланированных ответов (при остановке бота)."""
+        while self._workers:
+            await asyncio.gather(*list(self._workers.values()), return_exceptions=True)
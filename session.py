@@ -0,0 +1,230 @@
+import asyncio
+import itertools
+import logging
+import sys
+import time
+
+
+# ===== Сессия клиента (context.user_data) =====
+# Вместо свободного словаря — запись с фиксированным набором полей в
+# __slots__: нет словаря на каждую сессию, опечатка в ключе сразу даёт
+# KeyError. Доступ как к словарю (get, [], clear, setdefault) сохранён,
+# поэтому обработчики и сохранение состояния работают без изменений.
+
+
+class Session:
+    __slots__ = (
+        "lead_id",
+        "aggregate",
+        "overheat",
+        "repair",
+        "oil_consumption",
+        "smoke",
+        "no_oil",
+        "symptoms",
+        "engine_volume",
+        "cylinders",
+        "oil_volume",
+        "quote",
+        "vehicle_info",
+        "client_name",
+        "client_contact",
+        "step",
+        "step_since",
+        "replied_at",
+        "last_seen",
+    )
+
+    lead_id: str
+    aggregate: str
+    overheat: str
+    repair: str
+    oil_consumption: str
+    smoke: str
+    no_oil: str
+    symptoms: str
+    engine_volume: float
+    cylinders: int
+    oil_volume: float
+    quote: object  # quotes.Quote, общий с кешем расчётов
+    vehicle_info: str
+    client_name: str
+    client_contact: str
+    step: str  # текущий шаг анкеты (questionnaire.json)
+    step_since: float  # time.time() вопроса текущего шага; нет — анкета не идёт (воронка)
+    replied_at: int  # time.time_ns() отправки последнего ответа бота (трассировка)
+    last_seen: float  # time.time() последнего сообщения
+
+    FIELDS = __slots__[:-1]
+    _FIELD_SET = frozenset(FIELDS)
+
+    def __init__(self):
+        self.last_seen = time.time()
+
+    def touch(self):
+        self.last_seen = time.time()
+
+    # --- Доступ как к словарю ---
+    def __getitem__(self, key):
+        if key not in self._FIELD_SET:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self._FIELD_SET:
+            raise KeyError(f"Неизвестное поле сессии: {key}")
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key not in self._FIELD_SET:
+            raise KeyError(key)
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key):
+        return key in self._FIELD_SET and hasattr(self, key)
+
+    def __iter__(self):
+        return (key for key in self.FIELDS if hasattr(self, key))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"Session({dict(self.items())!r})"
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self._FIELD_SET else default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def update(self, other=(), **kwargs):
+        items = other.items() if hasattr(other, "items") else other
+        for key, value in items:
+            self[key] = value
+        for key, value in kwargs.items():
+            self[key] = value
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self]
+
+    def clear(self):
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                delattr(self, key)
+
+    def memory_size(self) -> int:
+        # Расчёт (quote) общий с кешем расчётов и в размер сессии не входит
+        return sys.getsizeof(self) + sum(
+            sys.getsizeof(value) for key, value in self.items() if key != "quote"
+        )
+
+
+# ===== Удаление брошенных сессий =====
+class SessionSweeper:
+    """Раз в interval секунд удаляет сессии, неактивные дольше ttl, и их анкеты."""
+
+    def __init__(self, ttl: float, interval: float = 300):
+        self.application = None
+        # ConversationHandler анкеты: без JobQueue conversation_timeout не
+        # работает, и ключи брошенных анкет удаляет sweep
+        self.conversation = None
+        self.ttl = ttl
+        self.interval = interval
+        self._task = None
+        self.evicted = 0
+        self.sessions = 0
+        self.bytes_per_session = 0
+
+    def start(self, application):
+        self.application = application
+        if self._task is None and self.ttl > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logging.error(f"Ошибка при очистке сессий: {e}")
+
+    def sweep(self, now: float = None) -> int:
+        now = time.time() if now is None else now
+        expired = [
+            user_id
+            for user_id, session in self.application.user_data.items()
+            if now - session.last_seen > self.ttl
+        ]
+        for user_id in expired:
+            # Удаляется и из памяти, и из сохранённого состояния
+            self.application.drop_user_data(user_id)
+        self.evicted += len(expired)
+        if expired and self.conversation is not None:
+            self._end_conversations(set(expired))
+
+        self.measure()
+        if expired:
+            logging.info(
+                "Удалено брошенных сессий: %s; осталось %s, в среднем %s байт на сессию",
+                len(expired),
+                self.sessions,
+                self.bytes_per_session,
+            )
+        return len(expired)
+
+    def _end_conversations(self, user_ids: set):
+        # Ключ анкеты — (chat_id, user_id). pop отмечается в TrackingDict, и PTB
+        # удаляет анкету из сохранённого состояния при следующем сохранении
+        conversations = self.conversation._conversations
+        for key in [key for key in conversations if key[-1] in user_ids]:
+            conversations.pop(key, None)
+
+    def measure(self, sample: int = 1000) -> int:
+        """Средний размер сессии по первым sample сессиям (без обхода всех на каждый запрос)."""
+        if self.application is None:
+            return 0
+        user_data = self.application.user_data
+        sessions = list(itertools.islice(user_data.values(), sample))
+        self.sessions = len(user_data)
+        self.bytes_per_session = (
+            sum(session.memory_size() for session in sessions) // len(sessions) if sessions else 0
+        )
+        return self.bytes_per_session
+
+    def stats(self) -> dict:
+        return {
+            "sessions": self.sessions,
+            "evicted": self.evicted,
+            "bytes_per_session": self.bytes_per_session,
+        }
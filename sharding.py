@@ -0,0 +1,279 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+
+
+# ===== Несколько процессов-обработчиков за одним приёмом обновлений =====
+# Процесс-приёмник получает обновления (polling или webhook) и пересылает
+# каждое в очередь одного из N процессов-обработчиков по chat_id, поэтому
+# анкета клиента всегда живёт в одном процессе. У каждого обработчика свой
+# пул соединений с Bot API; база заявок, состояние анкет и pricing_rules.json
+# — общие файлы.
+#
+# Супервизор перезапускает упавший обработчик: канал к нему (pipe с одним
+# читателем) сохраняется, поэтому ещё не прочитанные обновления достаются
+# новому процессу. При изменении числа обработчиков (SIGTTIN/SIGTTOU)
+# все они останавливаются с сохранением состояния и запускаются заново уже
+# с новым распределением чатов; новые обновления в это время копятся в
+# очередях нового поколения.
+
+_STOP = None
+_CLOSE = object()
+_BATCH = 100
+
+
+def shard_of(chat_id, count: int) -> int:
+    return chat_id % count if chat_id is not None else 0
+
+
+def update_chat_id(update):
+    chat = update.effective_chat
+    if chat is not None:
+        return chat.id
+    user = update.effective_user
+    return user.id if user is not None else None
+
+
+class _Channel:
+    """Канал приёмник -> обработчик.
+
+    multiprocessing.Queue не подходит: читатель держит её блокировку, пока
+    ждёт данных, и убитый в этот момент процесс навсегда запирает очередь
+    для своей замены. Здесь у pipe ровно один читатель, а запись идёт из
+    отдельного потока, чтобы полный pipe не останавливал цикл событий.
+    """
+
+    def __init__(self, ctx):
+        self.reader, self._writer = ctx.Pipe(duplex=False)
+        self._pending = queue.SimpleQueue()
+        self._feeder = threading.Thread(target=self._feed, daemon=True)
+        self._feeder.start()
+
+    def put(self, item):
+        self._pending.put(item)
+
+    def _feed(self):
+        while True:
+            item = self._pending.get()
+            if item is _CLOSE:
+                return
+            try:
+                self._writer.send(item)
+            except Exception as e:
+                logging.error(f"Не удалось передать обновление обработчику: {e}")
+
+    def close(self):
+        self._pending.put(_CLOSE)
+        self._feeder.join()
+        self._writer.close()
+        self.reader.close()
+
+
+# ===== Процесс-обработчик =====
+def _worker_main(token: str, index: int, count: int, updates):
+    # Остановкой управляет супервизор: Ctrl+C и SIGTERM группе процессов
+    # не должны обрывать обработчик посреди анкеты
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(_serve_shard(token, index, count, updates, os.getppid()))
+
+
+def _next_batch(updates, parent_pid: int):
+    """Ждёт обновления из канала; None — пора останавливаться."""
+    while not updates.poll(1.0):
+        if os.getppid() != parent_pid:
+            logging.error("Процесс-приёмник завершился, обработчик останавливается")
+            return None
+    batch = [updates.recv()]
+    while len(batch) < _BATCH and batch[-1] is not _STOP and updates.poll():
+        batch.append(updates.recv())
+    return batch
+
+
+async def _serve_shard(token: str, index: int, count: int, updates, parent_pid: int):
+    import bot
+    from telegram import Update
+
+    app = bot.build_application(
+        token,
+        updater=False,
+        owns_key=lambda key: shard_of(key[0], count) == index,
+        worker=index,
+        workers=count,
+    )
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+    logging.info("Обработчик %s/%s запущен (pid %s)", index + 1, count, os.getpid())
+    try:
+        while True:
+            batch = await asyncio.to_thread(_next_batch, updates, parent_pid)
+            if batch is None:
+                break
+            for data in batch:
+                if data is _STOP:
+                    return
+                # Очередь приложения ограничена, и обновления берутся из неё,
+                # только когда у обработки есть место: ждём, если она не успевает
+                await app.update_queue.put(Update.de_json(data, app.bot))
+    finally:
+        await app.stop()
+        if app.post_stop:
+            await app.post_stop(app)
+        await app.shutdown()
+        logging.info("Обработчик %s/%s остановлен", index + 1, count)
+
+
+# ===== Супервизор в процессе-приёмнике =====
+class _Worker:
+    __slots__ = ("index", "updates", "process", "restarts", "started_at")
+
+    def __init__(self, index: int, updates):
+        self.index = index
+        self.updates = updates
+        self.process = None
+        self.restarts = 0
+        self.started_at = 0.0
+
+
+class ShardSupervisor:
+    def __init__(self, token: str, workers: int, stop_timeout: float = 30.0, check_interval: float = 1.0):
+        if workers < 1:
+            raise ValueError("Нужен хотя бы один обработчик")
+        self.token = token
+        self.count = workers
+        self.stop_timeout = stop_timeout
+        self.check_interval = check_interval
+        self._ctx = multiprocessing.get_context("spawn")
+        self._workers = []
+        self._monitor = None
+        self._resizing = None
+        self._stopping = False
+        self.forwarded = 0
+        self.restarts = 0
+        self.rebalances = 0
+
+    # --- Жизненный цикл (post_init / post_stop приложения-приёмника) ---
+    async def start(self, app=None):
+        self._workers = self._new_generation(self.count)
+        for worker in self._workers:
+            self._spawn(worker)
+        self._monitor = asyncio.create_task(self._watch())
+        loop = asyncio.get_running_loop()
+        if hasattr(signal, "SIGTTIN"):
+            loop.add_signal_handler(signal.SIGTTIN, self._request_resize, 1)
+            loop.add_signal_handler(signal.SIGTTOU, self._request_resize, -1)
+        logging.info("Запущено обработчиков: %s", self.count)
+
+    async def stop(self, app=None):
+        self._stopping = True
+        if self._resizing is not None:
+            await asyncio.gather(self._resizing, return_exceptions=True)
+        if self._monitor is not None:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+        if hasattr(signal, "SIGTTIN"):
+            loop = asyncio.get_running_loop()
+            loop.remove_signal_handler(signal.SIGTTIN)
+            loop.remove_signal_handler(signal.SIGTTOU)
+        await self._drain(self._workers)
+        logging.info("Обработчики остановлены: %s", self.stats())
+
+    # --- Пересылка (обработчик TypeHandler(Update) приёмника) ---
+    async def forward(self, update, context=None):
+        worker = self._workers[shard_of(update_chat_id(update), len(self._workers))]
+        worker.updates.put(update.to_dict())
+        self.forwarded += 1
+
+    # --- Изменение числа обработчиков ---
+    def _request_resize(self, delta: int):
+        if self._stopping or self._resizing is not None:
+            logging.warning("Изменение числа обработчиков уже идёт, сигнал пропущен")
+            return
+        count = max(1, self.count + delta)
+        if count != self.count:
+            self._resizing = asyncio.create_task(self.resize(count))
+
+    async def resize(self, count: int):
+        """Перезапускает обработчики с новым распределением чатов."""
+        try:
+            old = self._workers
+            # Новые обновления сразу идут в очереди нового поколения и ждут
+            # там, пока старые обработчики доделают своё и сохранят состояние
+            self._workers = self._new_generation(count)
+            self.count = count
+            await self._drain(old)
+            for worker in self._workers:
+                self._spawn(worker)
+            self.rebalances += 1
+            logging.info("Обработчиков теперь: %s", count)
+        finally:
+            self._resizing = None
+
+    # --- Внутреннее ---
+    def _new_generation(self, count: int):
+        return [_Worker(index, _Channel(self._ctx)) for index in range(count)]
+
+    def _spawn(self, worker: _Worker):
+        worker.process = self._ctx.Process(
+            target=_worker_main,
+            args=(self.token, worker.index, self.count, worker.updates.reader),
+            name=f"bot-shard-{worker.index}",
+            daemon=False,
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            if self._resizing is not None:
+                continue
+            for worker in self._workers:
+                process = worker.process
+                if process is None or process.is_alive():
+                    continue
+                # Падает сразу после старта — перезапускаем не чаще раза в 5 с
+                if time.monotonic() - worker.started_at < 5:
+                    continue
+                logging.error(
+                    "Обработчик %s завершился с кодом %s, перезапускаю",
+                    worker.index + 1,
+                    process.exitcode,
+                )
+                worker.restarts += 1
+                self.restarts += 1
+                self._spawn(worker)
+
+    async def _drain(self, workers):
+        for worker in workers:
+            worker.updates.put(_STOP)
+        deadline = time.monotonic() + self.stop_timeout
+        for worker in workers:
+            process = worker.process
+            if process is not None:
+                await asyncio.to_thread(process.join, max(0.0, deadline - time.monotonic()))
+                if process.is_alive():
+                    logging.error("Обработчик %s не остановился, завершаю принудительно", worker.index + 1)
+                    process.terminate()
+                    await asyncio.to_thread(process.join)
+            worker.updates.close()
+
+    @property
+    def alive(self) -> int:
+        return sum(1 for w in self._workers if w.process is not None and w.process.is_alive())
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.count,
+            "alive": self.alive,
+            "forwarded": self.forwarded,
+            "restarts": self.restarts,
+            "rebalances": self.rebalances,
+        }
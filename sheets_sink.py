@@ -0,0 +1,307 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from pathlib import Path
+
+import httpx
+
+import metrics
+from tracing import KIND_CLIENT, tracer
+
+
+# ===== Отправка лидов в Google Sheets =====
+# Один долгоживущий httpx-клиент (keep-alive), очередь в памяти и
+# max_connections фоновых отправителей: каждый берёт из очереди лид (или
+# пачку) и держит своё соединение, поэтому медленный ответ вебхука не
+# задерживает остальных. По умолчанию лиды уходят по одному, в прежнем
+# формате; с batch_size > 1 — пачками {"leads": [...]} по размеру или по
+# времени (скрипт должен уметь их разбирать, см. README). Порядок строк в
+# таблице при этом может не совпадать с порядком заявок.
+# Если вебхук недоступен — лиды после всех попыток дописываются в спул на
+# диск и отправляются повторно после первой удачной отправки. Весь доступ к
+# файлам спула идёт под одной блокировкой: дозапись не теряется при разборе.
+# У каждого процесса-обработчика свой спул; спулы обработчиков, которых
+# больше нет (orphan_spools), забираются в свой при запуске.
+
+
+POST_SECONDS = metrics.histogram(
+    "bot_sheets_post_seconds", "Время POST пачки лидов в Google Sheets"
+)
+POST_RESPONSES = metrics.counter(
+    "bot_sheets_posts_total", "Ответы Google Sheets по HTTP-статусу (error — сетевая ошибка)", ("status",)
+)
+_POST_ERRORS = POST_RESPONSES.labels("error")
+
+
+def lead_payload(application: dict) -> dict:
+    """Строка для таблицы из сохранённой заявки."""
+    return {
+        "lead_id": application.get("lead_id"),
+        "name": application.get("client_name") or "",
+        "contact": application.get("client_contact") or "",
+        "aggregate": application.get("aggregate") or "",
+        "vehicle": application.get("vehicle_info") or "",
+        "engine_volume": application.get("engine_volume"),
+        "oil_volume": application.get("oil_volume"),
+        "price": application.get("total_price_client"),
+        "profit": application.get("profit"),
+    }
+
+
+class GoogleSheetsSink:
+    def __init__(
+        self,
+        url: str,
+        batch_size: int = 1,
+        batch_interval: float = 2.0,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 30.0,
+        timeout: float = 10.0,
+        max_connections: int = 16,
+        queue_size: int = 10000,
+        spool_path: Path = Path("applications") / "sheets_spool.jsonl",
+        stop_timeout: float = 10.0,
+    ):
+        self.url = url
+        self.batch_size = max(1, batch_size)
+        self.batch_interval = batch_interval
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.timeout = timeout
+        self.max_connections = max(1, max_connections)
+        self.spool_path = Path(spool_path)
+        self.stop_timeout = stop_timeout
+
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._client = None
+        self._task = None
+        self._in_flight = []  # пачки в отправке: при остановке уходят в спул
+        self._spool_lock = asyncio.Lock()
+        self._spool_pending = True  # в спуле могут быть лиды (после запуска — неизвестно)
+        self.orphan_spools = []
+        self.sent = 0
+        self.spooled = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, payload: dict):
+        """Ставит лид в очередь и сразу возвращает управление."""
+        if not self.url:
+            return
+        try:
+            self._queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            logging.warning("Очередь Google Sheets переполнена, лид записан в спул")
+            asyncio.get_running_loop().create_task(self._spool([payload]))
+
+    async def start(self):
+        if not self.url or self._task is not None:
+            return
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            follow_redirects=True,  # Apps Script отвечает 302 на googleusercontent
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=60,
+            ),
+        )
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Ждёт отправки очереди не дольше stop_timeout секунд; остальное — в спул без повторов."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), self.stop_timeout)
+        except asyncio.TimeoutError:
+            logging.warning(
+                "Google Sheets: за %s с отправлено не всё, остаток записывается в спул", self.stop_timeout
+            )
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        leftover = [payload for batch in self._in_flight for payload in batch]
+        self._in_flight = []
+        while not self._queue.empty():
+            leftover.append(self._queue.get_nowait())
+            self._queue.task_done()
+        if leftover:
+            await self._spool(leftover)
+        await self._client.aclose()
+        self._client = None
+
+    async def _run(self):
+        # Спул после прошлого запуска отправляется уже из фоновой задачи: недоступный
+        # вебхук не задерживает старт бота
+        if self.orphan_spools:
+            async with self._spool_lock:
+                await asyncio.to_thread(self._adopt_orphans)
+        await self._replay_spool()
+        await asyncio.gather(*(self._sender() for _ in range(self.max_connections)))
+
+    async def _sender(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self._in_flight.append(batch)
+            try:
+                if await self._send(batch):
+                    self._in_flight.remove(batch)
+                    await self._replay_spool()
+                else:
+                    await self._spool(batch)
+                    self._in_flight.remove(batch)
+            except Exception as e:
+                logging.error(f"Ошибка при отправке лидов в Google Sheets: {e}")
+                if batch in self._in_flight:
+                    self._in_flight.remove(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _send(self, batch) -> bool:
+        # Одиночный лид уходит в прежнем формате, пачка — как {"leads": [...]}
+        body = batch[0] if len(batch) == 1 else {"leads": batch}
+        started_ns = time.time_ns()
+        delivered = None
+        try:
+            delivered = await self._post(body, len(batch))
+            return delivered
+        finally:
+            # Повторы входят в спан: в трассе заявки видно всё время до Google Sheets
+            if tracer.enabled:
+                ended_ns = time.time_ns()
+                for payload in batch:
+                    tracer.span(
+                        payload.get("lead_id"),
+                        "sheets.post",
+                        started_ns,
+                        ended_ns,
+                        {"batch_size": len(batch), "delivered": delivered},
+                        kind=KIND_CLIENT,
+                    )
+
+    async def _post(self, body, count: int) -> bool:
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                delay = min(self.backoff_cap, self.backoff_base * 2 ** (attempt - 1))
+                await asyncio.sleep(random.uniform(0, delay))
+            started = time.perf_counter()
+            try:
+                resp = await self._client.post(self.url, json=body)
+            except httpx.HTTPError as e:
+                POST_SECONDS.observe(time.perf_counter() - started)
+                _POST_ERRORS.inc()
+                logging.warning(
+                    "Google Sheets недоступен (попытка %s): %s", attempt + 1, e
+                )
+                continue
+            POST_SECONDS.observe(time.perf_counter() - started)
+            POST_RESPONSES.labels(str(resp.status_code)).inc()
+
+            if resp.is_success:
+                self.sent += count
+                return True
+
+            logging.error(
+                "Google Sheets webhook returned %s: %s",
+                resp.status_code,
+                (resp.text or "")[:500],
+            )
+            if resp.status_code != 429 and resp.status_code < 500:
+                # Ошибка в данных — повтор не поможет
+                return True
+
+        return False
+
+    @property
+    def _taken_path(self) -> Path:
+        return self.spool_path.with_suffix(".taken")
+
+    async def _spool(self, batch):
+        def _write():
+            self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.spool_path, "a", encoding="utf-8") as f:
+                for payload in batch:
+                    f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+
+        async with self._spool_lock:
+            await asyncio.to_thread(_write)
+            self._spool_pending = True
+        self.spooled += len(batch)
+        logging.warning("В спул Google Sheets записано лидов: %s", len(batch))
+
+    def _adopt_orphans(self):
+        for path in self.orphan_spools:
+            for source in (path.with_suffix(".taken"), path):
+                if not source.exists():
+                    continue
+                data = source.read_text(encoding="utf-8")
+                if data.strip():
+                    self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+                    with open(self.spool_path, "a", encoding="utf-8") as f:
+                        f.write(data if data.endswith("\n") else data + "\n")
+                source.unlink()
+                logging.info("Спул Google Sheets %s перенесён в %s", source.name, self.spool_path.name)
+
+    def _take_spool(self) -> list:
+        # .taken остаётся, пока его лиды не доставлены (в том числе после
+        # аварийной остановки): сначала дочитываем его, спул — в следующий раз
+        taken_path = self._taken_path
+        if not taken_path.exists():
+            if not self.spool_path.exists():
+                return []
+            self.spool_path.replace(taken_path)
+        with open(taken_path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _keep_taken(self, payloads):
+        # Доставленное из .taken убирается: при следующем разборе не будет дублей
+        tmp_path = self._taken_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for payload in payloads:
+                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        tmp_path.replace(self._taken_path)
+
+    async def _replay_spool(self):
+        """Отправляет спул пачками; .taken удаляется только после доставки всех лидов из него."""
+        if not self._spool_pending:
+            return
+        async with self._spool_lock:
+            # Пока ждали блокировку, спул мог разобрать другой отправитель
+            while self._spool_pending:
+                payloads = await asyncio.to_thread(self._take_spool)
+                if not payloads:
+                    await asyncio.to_thread(self._taken_path.unlink, missing_ok=True)
+                    self._spool_pending = False
+                    return
+                logging.info("Из спула Google Sheets повторно отправляется лидов: %s", len(payloads))
+                for start in range(0, len(payloads), self.batch_size):
+                    if not await self._send(payloads[start : start + self.batch_size]):
+                        await asyncio.to_thread(self._keep_taken, payloads[start:])
+                        logging.warning(
+                            "Google Sheets недоступен, в спуле осталось лидов: %s", len(payloads) - start
+                        )
+                        return
+                await asyncio.to_thread(self._taken_path.unlink)
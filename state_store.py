@@ -0,0 +1,224 @@
+import asyncio
+import json
+import logging
+import pickle
+import sqlite3
+import time
+from pathlib import Path
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+
+# ===== Состояние диалогов между перезапусками (SQLite, WAL) =====
+# Храним user_data и шаг анкеты, чтобы после рестарта клиент продолжил
+# с того же вопроса. Записи копятся в памяти и уходят в базу одной
+# транзакцией за проход PTB (раз в update_interval секунд), а не по
+# записи на каждое сообщение. user_data читается лениво — при первом
+# сообщении пользователя, поэтому старт не зависит от размера истории.
+
+DEFAULT_STATE_PATH = Path("applications") / "state.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id INTEGER PRIMARY KEY,
+    data BLOB NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state BLOB NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (name, key)
+);
+CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (name, updated_at);
+"""
+
+
+def _connect(path: Path, **kwargs) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, **kwargs)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+class SqlitePersistence(BasePersistence):
+    def __init__(
+        self,
+        path: Path = DEFAULT_STATE_PATH,
+        update_interval: float = 5,
+        conversation_ttl: float = 7 * 24 * 3600,
+        owns_key=None,
+    ):
+        # chat_data и bot_data бот не использует — храним только user_data и диалоги
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = Path(path)
+        self.conversation_ttl = conversation_ttl
+        # Для процесса-шарда: поднимать только диалоги своих чатов
+        self.owns_key = owns_key
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Чтение — в потоке бота, запись — в отдельном потоке (WAL это позволяет)
+        self._reader = _connect(self.path)
+        self._writer = _connect(self.path, check_same_thread=False)
+
+        self._loaded_users = set()
+        # Несохранённые изменения: None означает «удалить»
+        self._pending_users = {}
+        self._pending_conversations = {}
+        self._flush_task = None
+        self._write_lock = asyncio.Lock()
+        self.batches = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending_users) + len(self._pending_conversations)
+
+    # --- Чтение ---
+    async def get_user_data(self) -> dict:
+        # Загружаем при первом обращении пользователя (refresh_user_data)
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        if user_id in self._loaded_users:
+            return
+        self._loaded_users.add(user_id)
+        if user_id in self._pending_users:
+            # Ещё не записанное изменение (или удаление) свежее, чем база
+            return
+        row = self._reader.execute(
+            "SELECT data FROM user_data WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return
+        try:
+            for key, value in pickle.loads(row[0]).items():
+                user_data.setdefault(key, value)
+        except Exception as e:
+            logging.error(f"Не удалось прочитать сохранённые данные пользователя {user_id}: {e}")
+
+    async def get_conversations(self, name: str) -> dict:
+        # Брошенные давно анкеты не поднимаем и не храним: клиент всё равно начнёт с /start
+        cutoff = time.time() - self.conversation_ttl
+        with self._reader:
+            self._reader.execute(
+                "DELETE FROM conversations WHERE name = ? AND updated_at < ?", (name, cutoff)
+            )
+        cur = self._reader.execute(
+            "SELECT key, state FROM conversations WHERE name = ?", (name,)
+        )
+        conversations = {}
+        for key, state in cur:
+            key = tuple(json.loads(key))
+            if self.owns_key is None or self.owns_key(key):
+                conversations[key] = pickle.loads(state)
+        return conversations
+
+    # --- Запись (копится до конца прохода) ---
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._loaded_users.add(user_id)
+        # Снимок полей здесь, в цикле событий: pickle идёт в потоке записи, а
+        # живую сессию тем временем меняют обработчики следующих сообщений
+        self._pending_users[user_id] = dict(data.items())
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        # Удалённые сессии не держим в списке загруженных: память не растёт с историей
+        self._loaded_users.discard(user_id)
+        self._pending_users[user_id] = None
+        self._schedule_flush()
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        self._pending_conversations[(name, json.dumps(key))] = new_state
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_pending())
+
+    async def _flush_pending(self):
+        # PTB вызывает update_* пачкой через gather: даём им всем отработать
+        await asyncio.sleep(0)
+        async with self._write_lock:
+            while self._pending_users or self._pending_conversations:
+                users, self._pending_users = self._pending_users, {}
+                conversations, self._pending_conversations = self._pending_conversations, {}
+                try:
+                    await asyncio.to_thread(self._write, users, conversations)
+                except Exception as e:
+                    logging.error(f"Не удалось сохранить состояние диалогов: {e}")
+                    # Вернём в очередь, не затирая более свежие изменения
+                    for user_id, data in users.items():
+                        self._pending_users.setdefault(user_id, data)
+                    for key, state in conversations.items():
+                        self._pending_conversations.setdefault(key, state)
+                    return
+
+    def _write(self, users: dict, conversations: dict):
+        now = time.time()
+        with self._writer:
+            self._writer.executemany(
+                "INSERT OR REPLACE INTO user_data (user_id, data, updated_at) VALUES (?, ?, ?)",
+                [
+                    (user_id, pickle.dumps(data), now)
+                    for user_id, data in users.items()
+                    if data is not None
+                ],
+            )
+            self._writer.executemany(
+                "DELETE FROM user_data WHERE user_id = ?",
+                [(user_id,) for user_id, data in users.items() if data is None],
+            )
+            self._writer.executemany(
+                "INSERT OR REPLACE INTO conversations (name, key, state, updated_at) VALUES (?, ?, ?, ?)",
+                [
+                    (name, key, pickle.dumps(state), now)
+                    for (name, key), state in conversations.items()
+                    if state is not None
+                ],
+            )
+            self._writer.executemany(
+                "DELETE FROM conversations WHERE name = ? AND key = ?",
+                [(name, key) for (name, key), state in conversations.items() if state is None],
+            )
+        self.batches += 1
+
+    async def flush(self) -> None:
+        # Вызывается PTB при остановке, после последнего update_persistence
+        self._schedule_flush()
+        await self._flush_task
+        if self.pending:
+            logging.error(f"При остановке не сохранено изменений состояния: {self.pending}")
+        self._reader.close()
+        self._writer.close()
+
+    # --- chat_data, bot_data и callback_data не храним ---
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
@@ -0,0 +1,236 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+
+from lead_ids import decode_lead_id
+
+
+# ===== Трассировка анкеты (OpenTelemetry, OTLP/JSON) =====
+# Трасса — одна заявка: trace_id — это её lead_id (ULID, 128 бит), корневой
+# спан «questionnaire» начинается в момент выдачи lead_id (/start, время
+# зашито в ULID) и закрывается отправкой заявки. Поэтому любой модуль, у
+# которого есть lead_id (запись заявок, Google Sheets), пишет свои спаны в
+# ту же трассу без передачи контекста.
+#
+# Спаны уходят в очередь, фоновый поток раз в interval секунд выгружает их
+# пачкой в формате OTLP/JSON: строкой в файл (TRACING_FILE) и/или POST в
+# коллектор (TRACING_ENDPOINT, обычно http://коллектор:4318/v1/traces).
+# Без них трассировка выключена и спаны не создаются.
+
+SERVICE_NAME = "nanorem-opros-bot"
+
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+_STATUS_OK = 1
+_STATUS_ERROR = 2
+
+_STOP = object()
+
+
+def trace_ids(lead_id: str):
+    """(trace_id, span_id корневого спана) в hex или None для старых ID заявок."""
+    try:
+        value = decode_lead_id(lead_id)
+    except (TypeError, ValueError):
+        return None
+    return f"{value:032x}", f"{value & 0xFFFFFFFFFFFFFFFF:016x}"
+
+
+def _attribute(key, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Tracer:
+    def __init__(
+        self,
+        path: str = "",
+        endpoint: str = "",
+        interval: float = 1.0,
+        batch_size: int = 512,
+        max_queue: int = 10000,
+    ):
+        self.path = path
+        self.endpoint = endpoint
+        self.interval = interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self.exported = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path or self.endpoint)
+
+    # ===== Запись спанов =====
+    def span(
+        self,
+        lead_id,
+        name: str,
+        start_ns: int,
+        end_ns: int,
+        attributes: dict = None,
+        error: BaseException = None,
+        kind: int = KIND_INTERNAL,
+    ):
+        """Спан-потомок корневого спана заявки; из любого потока."""
+        if not self.enabled or not lead_id:
+            return
+        ids = trace_ids(lead_id)
+        if ids is None:
+            return
+        trace_id, root_id = ids
+        self._put(
+            {
+                "traceId": trace_id,
+                "spanId": os.urandom(8).hex(),
+                "parentSpanId": root_id,
+                "name": name,
+                "kind": kind,
+                "startTimeUnixNano": str(start_ns),
+                "endTimeUnixNano": str(end_ns),
+                "attributes": [_attribute(k, v) for k, v in (attributes or {}).items() if v is not None],
+                "status": (
+                    {"code": _STATUS_ERROR, "message": f"{type(error).__name__}: {error}"}
+                    if error is not None
+                    else {"code": _STATUS_OK}
+                ),
+            }
+        )
+
+    def root(self, lead_id, end_ns: int, attributes: dict = None):
+        """Корневой спан: от выдачи lead_id до end_ns."""
+        if not self.enabled or not lead_id:
+            return
+        ids = trace_ids(lead_id)
+        if ids is None:
+            return
+        trace_id, root_id = ids
+        start_ns = (int(trace_id, 16) >> 80) * 1_000_000
+        self._put(
+            {
+                "traceId": trace_id,
+                "spanId": root_id,
+                "name": "questionnaire",
+                "kind": KIND_SERVER,
+                "startTimeUnixNano": str(start_ns),
+                "endTimeUnixNano": str(end_ns),
+                "attributes": [_attribute(k, v) for k, v in (attributes or {}).items() if v is not None],
+                "status": {"code": _STATUS_OK},
+            }
+        )
+
+    @contextmanager
+    def io(self, lead_id, name: str, **attributes):
+        """Спан вокруг обращения к диску или сети; исключение отмечается в статусе."""
+        if not self.enabled:
+            yield
+            return
+        start_ns = time.time_ns()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.span(lead_id, name, start_ns, time.time_ns(), attributes, error, KIND_CLIENT)
+
+    def _put(self, span: dict):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    # ===== Выгрузка =====
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="tracing", daemon=True)
+        self._thread.start()
+        logging.info("Трассировка: %s", ", ".join(filter(None, (self.path, self.endpoint))))
+
+    def stop(self):
+        """Выгружает оставшиеся спаны; блокирует, вызывать через asyncio.to_thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        client = httpx.Client(timeout=10) if self.endpoint else None
+        stopping = False
+        try:
+            while not stopping:
+                batch = []
+                deadline = time.monotonic() + self.interval
+                while len(batch) < self.batch_size:
+                    try:
+                        span = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if span is _STOP:
+                        stopping = True
+                        break
+                    batch.append(span)
+                if batch:
+                    self._export(batch, client)
+        finally:
+            if client is not None:
+                client.close()
+
+    def _export(self, batch, client):
+        body = {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [_attribute("service.name", SERVICE_NAME)]},
+                    "scopeSpans": [{"scope": {"name": "bot"}, "spans": batch}],
+                }
+            ]
+        }
+        data = json.dumps(body, ensure_ascii=False).encode()
+        if self.path:
+            try:
+                # Одна запись O_APPEND на пачку: строки процессов-обработчиков не перемешиваются
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, data + b"\n")
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                logging.error(f"Ошибка записи трассировки в {self.path}: {e}")
+        if client is not None:
+            try:
+                resp = client.post(self.endpoint, content=data, headers={"Content-Type": "application/json"})
+                if not resp.is_success:
+                    logging.warning("Коллектор трассировки ответил %s", resp.status_code)
+            except httpx.HTTPError as e:
+                logging.warning("Коллектор трассировки недоступен: %s", e)
+        self.exported += len(batch)
+
+    def stats(self) -> dict:
+        return {"exported": self.exported, "dropped": self.dropped, "queued": self._queue.qsize()}
+
+
+# Общий трассировщик процесса; настраивает bot.py
+tracer = Tracer()
+
+
+def configure(path: str = "", endpoint: str = ""):
+    tracer.path = path
+    tracer.endpoint = endpoint